@@ -0,0 +1,125 @@
+# Responsibility: verify Supabase access tokens locally, without a call to
+# the auth server on every request. Tokens signed with asymmetric keys are
+# checked against the project's JWKS (cached, refetched when a token has an
+# unknown key id, i.e. after key rotation). Tokens signed with the legacy
+# shared secret are checked with SUPABASE_JWT_SECRET.
+import datetime as dt
+import logging
+import threading
+import time
+from collections import OrderedDict
+from uuid import UUID
+
+import jwt
+
+from app.config import AppConfig
+
+logger = logging.getLogger(__name__)
+
+AUDIENCE = "authenticated"
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256", "EdDSA"]
+TOKEN_CACHE_MAX_ENTRIES = 10_000
+
+
+# The token can't be verified locally, the auth server has to be asked
+class LocalVerificationUnavailable(Exception):
+    pass
+
+
+class TokenVerifier:
+    def __init__(
+        self,
+        supabase_url: str,
+        jwt_secret: str | None,
+        token_cache_ttl: dt.timedelta,
+        jwks_cache_ttl: dt.timedelta,
+    ):
+        self._issuer = f"{supabase_url}/auth/v1"
+        self._jwt_secret = jwt_secret
+        self._token_cache_ttl = token_cache_ttl
+        self._jwks_client = jwt.PyJWKClient(
+            f"{self._issuer}/.well-known/jwks.json",
+            lifespan=int(jwks_cache_ttl.total_seconds()),
+            timeout=10,
+        )
+        # Token -> (user id, monotonic time until which it's trusted)
+        self._verified: OrderedDict[str, tuple[UUID, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Returns the user id of a valid token. Raises jwt.InvalidTokenError for
+    # invalid and expired tokens, LocalVerificationUnavailable if the signing
+    # key isn't known locally.
+    def verify(self, token: str) -> UUID:
+        cached = self._get_cached(token)
+        if cached:
+            return cached
+
+        claims = self._decode(token)
+        try:
+            user_id = UUID(claims["sub"])
+        except ValueError as e:
+            raise jwt.InvalidTokenError(f"Subject is not a user id: {e}") from e
+        self.remember(token, user_id, expires_at=claims["exp"])
+        return user_id
+
+    # Caches a token verified elsewhere (e.g. by the auth server), until it
+    # expires or for the cache TTL at most
+    def remember(self, token: str, user_id: UUID, expires_at: float | None = None) -> None:
+        if expires_at is None:
+            expires_at = jwt.decode(token, options={"verify_signature": False}).get(
+                "exp", 0
+            )
+        seconds_left = min(
+            expires_at - time.time(), self._token_cache_ttl.total_seconds()
+        )
+        if seconds_left <= 0:
+            return
+        with self._lock:
+            self._verified[token] = (user_id, time.monotonic() + seconds_left)
+            self._verified.move_to_end(token)
+            if len(self._verified) > TOKEN_CACHE_MAX_ENTRIES:
+                self._verified.popitem(last=False)
+
+    def _get_cached(self, token: str) -> UUID | None:
+        with self._lock:
+            cached = self._verified.get(token)
+            if not cached:
+                return None
+            user_id, trusted_until = cached
+            if time.monotonic() >= trusted_until:
+                del self._verified[token]
+                return None
+            self._verified.move_to_end(token)
+            return user_id
+
+    def _decode(self, token: str) -> dict:
+        algorithm = jwt.get_unverified_header(token).get("alg")
+        if algorithm == "HS256":
+            if not self._jwt_secret:
+                raise LocalVerificationUnavailable("JWT secret is not configured")
+            key = self._jwt_secret
+        elif algorithm in ASYMMETRIC_ALGORITHMS:
+            try:
+                key = self._jwks_client.get_signing_key_from_jwt(token).key
+            except jwt.PyJWKClientError as e:
+                raise LocalVerificationUnavailable(str(e)) from e
+        else:
+            raise jwt.InvalidAlgorithmError(f"Unsupported algorithm {algorithm}")
+
+        return jwt.decode(
+            token,
+            key=key,
+            algorithms=[algorithm],
+            audience=AUDIENCE,
+            issuer=self._issuer,
+            options={"require": ["exp", "sub"]},
+        )
+
+
+def create_token_verifier(app_config: AppConfig) -> TokenVerifier:
+    return TokenVerifier(
+        supabase_url=app_config.supabase_url,
+        jwt_secret=app_config.supabase_jwt_secret,
+        token_cache_ttl=dt.timedelta(seconds=app_config.auth_token_cache_seconds),
+        jwks_cache_ttl=dt.timedelta(seconds=app_config.auth_jwks_cache_seconds),
+    )
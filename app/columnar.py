@@ -0,0 +1,321 @@
+# Responsibility: columnar engine for the parse -> filter -> enrich stages.
+# A statement is loaded into a DataFrame and processed with column operations.
+# The output is identical to the row-wise pipeline (parsers + filters + enrichment).
+# Rows with unexpected value types are validated with the row-wise models instead.
+import datetime as dt
+import math
+import re
+from dataclasses import asdict, fields
+from decimal import Decimal
+from hashlib import sha256
+from typing import Any, BinaryIO, Callable
+from uuid import UUID
+
+import pandas as pd
+from pydantic import ValidationError
+
+from app.enrichment import categorize_batch
+from app.filters import filter_batch
+from app.fx_rates import RateTable
+from app.metrics import StageTimer
+from app.parsers import revolut, swedbank
+from app.project_types import (
+    EnrichedTransaction,
+    ImportedTransaction,
+    PipelineStage,
+    Side,
+    StatementSource,
+    TransactionSource,
+    TransactionType,
+)
+
+FrameParserFN = Callable[[BinaryIO], pd.DataFrame]
+
+IMPORTED_COLUMNS = [field.name for field in fields(ImportedTransaction)]
+SIMPLE_DECIMAL = re.compile(r"^[ \t]*[+-]?\d+(\.\d+)?[ \t]*$")
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def enrich_statement(
+    statement: BinaryIO,
+    statement_source: StatementSource,
+    job_id: UUID,
+    user_id: UUID,
+    rate_table: RateTable,
+    timer: StageTimer | None = None,
+) -> list[EnrichedTransaction]:
+    parser = get_frame_parser(statement_source)
+    if parser is None:
+        raise ValueError(f"No columnar parser for {statement_source}")
+
+    timer = timer or StageTimer()
+    with timer.stage(PipelineStage.PARSE) as timing:
+        imported = parser(statement)
+        timing.add_rows(len(imported))
+    with timer.stage(PipelineStage.FILTER) as timing:
+        filtered, _ = filter_batch(imported)
+        timing.add_rows(len(filtered))
+    with timer.stage(PipelineStage.ENRICH) as timing:
+        enriched = enrich_frame(
+            filtered, job_id=job_id, user_id=user_id, rate_table=rate_table
+        )
+        timing.add_rows(len(enriched))
+    return enriched
+
+
+def enrich_frame(
+    frame: pd.DataFrame, job_id: UUID, user_id: UUID, rate_table: RateTable
+) -> list[EnrichedTransaction]:
+    datetimes = frame["transaction_datetime"].tolist()
+    counterparties = frame["counterparty"].tolist()
+    amounts = frame["orig_amount"].tolist()
+
+    enriched = frame.assign(
+        eur_amount=rate_table.to_eur(
+            datetimes, frame["orig_currency"].tolist(), amounts
+        ),
+        job_id=job_id,
+        user_id=user_id,
+    )
+    categories = categorize_batch(counterparties, datetimes, amounts)
+    notes = categories.pop("note")
+    enriched = enriched.assign(
+        **categories,
+        note=[
+            category_note if category_note is not None else note
+            for category_note, note in zip(notes, frame["note"].tolist())
+        ],
+    )
+
+    enriched = enriched.astype(object)
+    enriched = enriched.where(enriched.notna(), None)
+    return [EnrichedTransaction(**row) for row in enriched.to_dict("records")]
+
+
+# 1. Revolut
+def parse_revolut_frame(statement: BinaryIO) -> pd.DataFrame:
+    rows = revolut.get_statement_rows(statement)
+    raw = pd.DataFrame(rows, dtype=object)
+    string_columns = ["Description", "Currency", "Type", "Product", "State"]
+    datetime_columns = ["Started Date", "Completed Date"]
+    decimal_columns = ["Amount", "Balance"]
+    if raw.empty or not _has_columns(
+        raw, string_columns + datetime_columns + decimal_columns
+    ):
+        return _parse_rows(dict(enumerate(rows)), revolut.RawTransactionRevolut, revolut)
+
+    is_simple = _all_of(raw, string_columns, _is_str)
+    is_simple &= _all_of(raw, datetime_columns, _is_datetime)
+    is_simple &= _all_of(raw, decimal_columns, _is_number)
+    fallback_rows = {i: rows[i] for i in raw.index[~is_simple]}
+    raw = raw.loc[is_simple]
+
+    description = raw["Description"].str.strip()
+    currency = raw["Currency"].str.strip()
+    raw_type = raw["Type"].str.strip()
+    amount = raw["Amount"].map(_number_to_decimal)
+    balance = raw["Balance"].map(_number_to_decimal)
+    started_at = raw["Started Date"]
+    completed_at = raw["Completed Date"]
+
+    # Same rules as RawTransactionRevolut.is_valid_transaction
+    is_valid = raw["Product"].str.strip().str.upper() == revolut.SUPPORTED_PRODUCT
+    is_valid &= raw["State"].str.strip().str.upper() == revolut.SUPPORTED_STATE
+    is_valid &= ~raw_type.str.upper().isin(revolut.UNSUPPORTED_TYPES)
+
+    dedup_data = (
+        started_at.map(dt.datetime.isoformat)
+        + "_"
+        + completed_at.map(dt.datetime.isoformat)
+        + "_"
+        + description.str.lower()
+        + "_"
+        + amount.map(str).str.strip().str.lower()
+        + "_"
+        + balance.map(str).str.strip().str.lower()
+        + "_"
+    )
+    is_refund = raw_type.str.upper() == "CARD REFUND"
+    imported = pd.DataFrame(
+        {
+            "transaction_datetime": started_at,
+            "type": raw_type.map(
+                {
+                    "ATM": TransactionType.CASH_WITHDRAWAL,
+                    "Card Payment": TransactionType.CARD_PAYMENT,
+                    "Transfer": TransactionType.TRANSFER,
+                }
+            ).fillna(TransactionType.OTHER),
+            "counterparty": description,
+            "orig_amount": amount.map(abs),
+            "orig_currency": currency,
+            "side": amount.map(lambda value: Side.DEBIT if value <= 0 else Side.CREDIT),
+            "source": TransactionSource.REVOLUT,
+            "note": ("Refund from " + description).where(is_refund, None),
+            "dedup_key": _hash(dedup_data),
+        },
+        dtype=object,
+    ).loc[is_valid]
+
+    return _with_fallback_rows(
+        imported, fallback_rows, revolut.RawTransactionRevolut, revolut
+    )
+
+
+# 2. Swedbank
+def parse_swedbank_frame(statement: BinaryIO) -> pd.DataFrame:
+    rows = swedbank.get_statement_rows(statement)
+    raw = pd.DataFrame(rows, dtype=object)
+    string_columns = ["Gavėjas", "Valiuta", "Paaiškinimai", "Įrašo Nr.", "Kodas", "D/K"]
+    if raw.empty or not _has_columns(raw, string_columns + ["Data", "Suma"]):
+        return _parse_rows(
+            dict(enumerate(rows)), swedbank.RawTransactionSwedbank, swedbank
+        )
+
+    is_simple = _all_of(raw, string_columns, _is_str)
+    is_simple &= raw["Data"].map(_is_iso_date).astype(bool)
+    is_simple &= raw["Suma"].map(_is_simple_decimal).astype(bool)
+    fallback_rows = {i: rows[i] for i in raw.index[~is_simple]}
+    raw = raw.loc[is_simple]
+
+    counterparty = raw["Gavėjas"].str.strip()
+    description = raw["Paaiškinimai"].str.strip()
+    raw_type = raw["Kodas"].str.strip()
+    raw_side = raw["D/K"].str.strip()
+    amount = raw["Suma"].map(Decimal)
+    started_at = pd.Series(
+        [
+            dt.datetime.combine(dt.date.fromisoformat(value), dt.time())
+            for value in raw["Data"]
+        ],
+        index=raw.index,
+        dtype=object,
+    )
+
+    # Same rules as RawTransactionSwedbank validators
+    is_valid = raw_side.str.upper().isin(swedbank.SIDES)
+    is_valid &= ~description.str.contains(swedbank.EXCL_DESCRIPTION_REGEX)
+
+    transaction_type = raw_type.map(
+        {"K": TransactionType.CARD_PAYMENT, "MK": TransactionType.TRANSFER}
+    ).fillna(TransactionType.OTHER)
+    is_cash_withdrawal = (raw_type == "K") & description.str.contains(
+        "grynieji", regex=False
+    )
+    transaction_type = transaction_type.where(
+        ~is_cash_withdrawal, TransactionType.CASH_WITHDRAWAL
+    )
+
+    imported = pd.DataFrame(
+        {
+            "transaction_datetime": started_at,
+            "type": transaction_type,
+            "counterparty": counterparty.where(counterparty != "", description),
+            "orig_amount": amount.map(abs),
+            "orig_currency": raw["Valiuta"].str.strip(),
+            "side": raw_side.map(lambda value: Side.DEBIT if value == "D" else Side.CREDIT),
+            "source": TransactionSource.SWEDBANK,
+            "note": description,
+            "dedup_key": _hash(raw["Įrašo Nr."].str.strip().str.lower()),
+        },
+        dtype=object,
+    ).loc[is_valid]
+
+    return _with_fallback_rows(
+        imported, fallback_rows, swedbank.RawTransactionSwedbank, swedbank
+    )
+
+
+# Registry of columnar parsers
+_registry: dict[StatementSource, FrameParserFN] = {
+    StatementSource.REVOLUT: parse_revolut_frame,
+    StatementSource.SWEDBANK: parse_swedbank_frame,
+}
+
+
+def get_frame_parser(statement_source: StatementSource) -> FrameParserFN | None:
+    return _registry.get(statement_source)
+
+
+# Rows that don't have the expected value types go through the row-wise models,
+# so that the output (and rejections) stay the same as the row-wise pipeline.
+# Rows are keyed by their position in the statement.
+def _parse_rows(
+    rows: dict[int, dict[str, Any]], raw_model: Any, parser_module: Any
+) -> pd.DataFrame:
+    transactions = {}
+    for position, row in rows.items():
+        try:
+            raw_transaction = raw_model.model_validate(row)
+        except ValidationError:
+            continue
+        transactions[position] = asdict(
+            parser_module.convert_to_standardized_transaction(raw_transaction)
+        )
+
+    return pd.DataFrame.from_dict(
+        transactions, orient="index", columns=IMPORTED_COLUMNS, dtype=object
+    )
+
+
+def _with_fallback_rows(
+    imported: pd.DataFrame,
+    fallback_rows: dict[int, dict[str, Any]],
+    raw_model: Any,
+    parser_module: Any,
+) -> pd.DataFrame:
+    if fallback_rows:
+        fallback = _parse_rows(fallback_rows, raw_model, parser_module)
+        # Keep the statement order of the row-wise pipeline
+        imported = pd.concat([imported, fallback]).sort_index(kind="stable")
+    return imported.reset_index(drop=True)
+
+
+def _hash(values: pd.Series) -> pd.Series:
+    return values.map(lambda value: sha256(value.encode()).hexdigest())
+
+
+def _has_columns(frame: pd.DataFrame, columns: list[str]) -> bool:
+    return all(column in frame.columns for column in columns)
+
+
+def _all_of(
+    frame: pd.DataFrame, columns: list[str], check: Callable[[Any], bool]
+) -> pd.Series:
+    result = pd.Series(True, index=frame.index)
+    for column in columns:
+        result &= frame[column].map(check).astype(bool)
+    return result
+
+
+def _is_str(value: Any) -> bool:
+    return type(value) is str
+
+
+def _is_datetime(value: Any) -> bool:
+    return type(value) is dt.datetime
+
+
+def _is_number(value: Any) -> bool:
+    return type(value) is int or (type(value) is float and math.isfinite(value))
+
+
+def _is_iso_date(value: Any) -> bool:
+    return type(value) is str and ISO_DATE.match(value) is not None and _valid_date(value)
+
+
+def _valid_date(value: str) -> bool:
+    try:
+        dt.date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _is_simple_decimal(value: Any) -> bool:
+    return type(value) is str and SIMPLE_DECIMAL.match(value) is not None
+
+
+# Same conversion as pydantic: floats go through their shortest repr
+def _number_to_decimal(value: int | float) -> Decimal:
+    return Decimal(value) if type(value) is int else Decimal(repr(value))
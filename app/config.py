@@ -1,4 +1,6 @@
+import os
 from enum import StrEnum
+from pathlib import Path
 from uuid import UUID
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -9,13 +11,103 @@ class AppEnvironment(StrEnum):
     PROD = "PROD"
 
 
+class PipelineMode(StrEnum):
+    # Each stage processes the whole statement before the next one starts
+    BATCH = "batch"
+    # Rows flow through all stages in fixed-size chunks
+    STREAMING = "streaming"
+
+
+class PipelineEngine(StrEnum):
+    # One pydantic object per row through parse, filter and enrich
+    ROW = "row"
+    # Whole statement as a DataFrame, processed with column operations
+    COLUMNAR = "columnar"
+
+
+class JobRunner(StrEnum):
+    # Jobs run in the API process as FastAPI background tasks. Jobs left behind
+    # by a stopped API process are run again when an API process starts.
+    BACKGROUND = "background"
+    # Jobs stay queued in the jobs table until a worker process claims them
+    QUEUE = "queue"
+
+
+class PipelineExecutor(StrEnum):
+    # Parse, filter and enrich run in the process running the job
+    INLINE = "inline"
+    # Parse, filter and enrich run in a pool of separate processes
+    PROCESS_POOL = "process_pool"
+
+
+class InsertMode(StrEnum):
+    ORM = "orm"
+    BATCHED = "batched"
+    COPY = "copy"
+
+
+# Local files of the app (spool cache, exchange rates snapshot) live in the
+# user's cache directory, whatever the working directory
+CACHE_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    / "spending-tracker"
+)
+
+
 class AppConfig(BaseSettings):
     statements_storage_bucket: str = "statements"
     test_user_id: UUID | None = None
     app_environment: AppEnvironment = AppEnvironment.PROD
+    # Check the database and start the storage clients after the API accepts
+    # requests, see /ready
+    fast_start: bool = False
     db_connection_string: str
     supabase_url: str
     supabase_anon_key: str
     supabase_admin_key: str
+    # Verifies access tokens signed with the legacy shared secret locally.
+    # Tokens signed with asymmetric keys are verified with the project's JWKS.
+    supabase_jwt_secret: str | None = None
+    auth_token_cache_seconds: int = 60
+    auth_jwks_cache_seconds: int = 10 * 60
+    # Connection pool and retries of the HTTP clients talking to Supabase
+    http_pool_max_connections: int = 20
+    http_pool_max_keepalive: int = 10
+    http_keepalive_expiry_seconds: float = 30.0
+    http_timeout_seconds: float = 30.0
+    http_connect_timeout_seconds: float = 5.0
+    http_max_retries: int = 3
+    http_retry_backoff_seconds: float = 0.5
+    pipeline_mode: PipelineMode = PipelineMode.BATCH
+    pipeline_chunk_size: int = 5000
+    pipeline_engine: PipelineEngine = PipelineEngine.ROW
+    pipeline_executor: PipelineExecutor = PipelineExecutor.INLINE
+    pipeline_processes_per_core: float = 1.0
+    # Uploads larger than this are rejected with 413. Applies to each file of
+    # a batch, and to each statement in a ZIP archive once decompressed.
+    upload_max_bytes: int = 50 * 1024 * 1024
+    # Batch uploads: statements per batch, and statements uploaded or
+    # processed at the same time
+    batch_max_files: int = 100
+    batch_max_parallel_jobs: int = 4
+    # Local copy of uploaded statements for jobs running on the same node
+    spool_cache_dir: str = str(CACHE_DIR / "statements")
+    # 0 disables the cache.
+    spool_cache_max_bytes: int = 512 * 1024 * 1024
+    spool_cache_ttl_seconds: int = 60 * 60
+    insert_mode: InsertMode = InsertMode.BATCHED
+    # Rows read from the database and encoded at a time by exports
+    export_batch_size: int = 5000
+    insert_chunk_size: int = 1000
+    job_runner: JobRunner = JobRunner.BACKGROUND
+    job_lease_seconds: int = 5 * 60
+    job_poll_interval_seconds: float = 2.0
+    job_max_attempts: int = 3
+    fx_snapshot_path: str = str(CACHE_DIR / "ecb_rates.zip")
+    fx_refresh_interval_seconds: int = 6 * 60 * 60
+    # Prometheus metrics, at /metrics in the API and on worker_metrics_port in
+    # queue workers. Nothing is recorded when disabled.
+    metrics_enabled: bool = False
+    worker_metrics_port: int = 9100
 
     model_config = SettingsConfigDict(env_file=".env")
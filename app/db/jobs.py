@@ -1,18 +1,57 @@
 import datetime as dt
 import logging
+import os
+import socket
+import threading
 import uuid
 
-from sqlalchemy import Engine
+from sqlalchemy import (
+    ColumnElement,
+    DateTime,
+    delete,
+    Engine,
+    func,
+    Index,
+    Interval,
+    literal,
+    or_,
+    tuple_,
+    type_coerce,
+)
 from sqlalchemy.exc import IntegrityError
-from sqlmodel import Field, Session, SQLModel
+from sqlmodel import col, Field, select, Session, SQLModel, update
+from sqlmodel.sql.expression import SelectOfScalar
 
-from app.project_types import JobStatus, StatementSource
+from app.config import PipelineEngine
+from app.project_types import JobStatus, PipelineStage, StageTiming, StatementSource
 
 logger = logging.getLogger(__name__)
 
 
+# Statements uploaded together. Each one is ingested by a child job; the batch
+# status is derived from the children.
+class IngestBatch(SQLModel, table=True):
+    __tablename__ = "ingest_batches"  # type: ignore
+
+    id: uuid.UUID = Field(primary_key=True, default_factory=uuid.uuid4)
+    user_id: uuid.UUID = Field(nullable=False, index=True)
+    created_at: dt.datetime = Field(nullable=False, default_factory=dt.datetime.now)
+    file_count: int = Field(nullable=False, default=0)
+
+
 class IngestJob(SQLModel, table=True):
     __tablename__ = "jobs" # type: ignore
+    __table_args__ = (
+        Index("ix_jobs_user_source_hash", "user_id", "statement_source", "content_hash"),
+        # Job listing, newest first, optionally by status or statement source
+        Index("ix_jobs_user_created", "user_id", "created_at", "id"),
+        Index("ix_jobs_user_status_created", "user_id", "status", "created_at", "id"),
+        Index(
+            "ix_jobs_user_source_created", "user_id", "statement_source", "created_at", "id"
+        ),
+        # Queue: oldest pending job
+        Index("ix_jobs_status_created", "status", "created_at"),
+    )
 
     id: uuid.UUID = Field(primary_key=True, default_factory=uuid.uuid4)
     statement_source: StatementSource = Field(nullable=False)
@@ -25,6 +64,29 @@ class IngestJob(SQLModel, table=True):
     ingested_txn_count: int | None = Field(default=None)
     duplicate_txn_count: int | None = Field(default=None)
     user_id: uuid.UUID | None = Field(nullable=True, default=None)
+    pipeline_engine: PipelineEngine | None = Field(default=None)
+    # Queue: the worker running the job holds a lease and renews it while working.
+    # Jobs whose lease expired (worker crashed or was stopped) are queued again.
+    worker_id: str | None = Field(default=None)
+    # UTC, from the database clock (see db_now)
+    lease_expires_at: dt.datetime | None = Field(default=None, index=True)
+    attempts: int = Field(nullable=False, default=0)
+    # sha256 of the statement file, to recognize statements uploaded again
+    content_hash: str | None = Field(default=None)
+    batch_id: uuid.UUID | None = Field(
+        default=None, foreign_key="ingest_batches.id", index=True
+    )
+
+
+# Wall time and rows of each pipeline stage of a job, see app.metrics
+class JobStageMetric(SQLModel, table=True):
+    __tablename__ = "job_stage_metrics"  # type: ignore
+
+    job_id: uuid.UUID = Field(primary_key=True, foreign_key="jobs.id")
+    stage: PipelineStage = Field(primary_key=True)
+    seconds: float = Field(nullable=False)
+    row_count: int | None = Field(default=None)
+    rows_per_second: float | None = Field(default=None)
 
 
 def create_new_job(new_job: IngestJob, db: Engine) -> IngestJob:
@@ -43,12 +105,88 @@ def create_new_job(new_job: IngestJob, db: Engine) -> IngestJob:
             ) from e
 
 
+# Creates the batch and its jobs in one transaction
+def create_batch(
+    batch: IngestBatch, jobs: list[IngestJob], db: Engine
+) -> tuple[IngestBatch, list[IngestJob]]:
+    with Session(db, expire_on_commit=False) as session:
+        session.add(batch)
+        session.flush()
+        for job in jobs:
+            job.batch_id = batch.id
+            session.add(job)
+        session.commit()
+        return batch, jobs
+
+
+def load_batch(batch_id: uuid.UUID, db: Engine) -> IngestBatch | None:
+    with Session(db) as session:
+        return session.get(IngestBatch, batch_id)
+
+
+# Jobs of the batch, in upload order
+def load_batch_jobs(batch_id: uuid.UUID, db: Engine) -> list[IngestJob]:
+    query = (
+        select(IngestJob)
+        .where(IngestJob.batch_id == batch_id)
+        .order_by(col(IngestJob.created_at), col(IngestJob.id))
+    )
+    with Session(db) as session:
+        return list(session.exec(query).all())
+
+
 def load_job(job_id: uuid.UUID, db: Engine) -> IngestJob | None:
     with Session(db) as session:
         job = session.get(IngestJob, job_id)
         return job
 
 
+# Latest completed job of the user that ingested the same statement file
+def find_completed_job(
+    db: Engine, user_id: uuid.UUID, statement_source: StatementSource, content_hash: str
+) -> IngestJob | None:
+    query = (
+        select(IngestJob)
+        .where(
+            IngestJob.user_id == user_id,
+            IngestJob.statement_source == statement_source,
+            IngestJob.content_hash == content_hash,
+            IngestJob.status == JobStatus.COMPLETED,
+        )
+        .order_by(col(IngestJob.finished_at).desc())
+        .limit(1)
+    )
+    with Session(db) as session:
+        return session.exec(query).first()
+
+
+# A page of the user's jobs, newest first. `after` is the (created_at, id) of
+# the last job of the previous page.
+def list_jobs(
+    db: Engine,
+    user_id: uuid.UUID,
+    limit: int,
+    status: JobStatus | None = None,
+    statement_source: StatementSource | None = None,
+    after: tuple[dt.datetime, uuid.UUID] | None = None,
+) -> list[IngestJob]:
+    query = select(IngestJob).where(IngestJob.user_id == user_id)
+    if status is not None:
+        query = query.where(IngestJob.status == status)
+    if statement_source is not None:
+        query = query.where(IngestJob.statement_source == statement_source)
+    if after is not None:
+        # Row comparison: continues in the index where the previous page ended
+        query = query.where(
+            tuple_(col(IngestJob.created_at), col(IngestJob.id)) < after
+        )
+    query = query.order_by(
+        col(IngestJob.created_at).desc(), col(IngestJob.id).desc()
+    ).limit(limit)
+    with Session(db) as session:
+        return list(session.exec(query).all())
+
+
 def update_job(updated_job: IngestJob, db: Engine) -> None:
     with Session(db) as session:
         session.add(updated_job)
@@ -56,5 +194,271 @@ def update_job(updated_job: IngestJob, db: Engine) -> None:
         session.refresh(updated_job)
 
 
+# Replaces the timings of a previous attempt of the job
+def save_stage_metrics(
+    job_id: uuid.UUID, timings: list[StageTiming], db: Engine
+) -> None:
+    with Session(db) as session:
+        previous = delete(JobStageMetric).where(col(JobStageMetric.job_id) == job_id)
+        session.exec(previous)  # type: ignore
+        session.add_all(
+            JobStageMetric(
+                job_id=job_id,
+                stage=timing.stage,
+                seconds=timing.seconds,
+                row_count=timing.row_count,
+                rows_per_second=timing.rows_per_second,
+            )
+            for timing in timings
+        )
+        session.commit()
+
+
+# In pipeline order
+def load_stage_metrics(job_id: uuid.UUID, db: Engine) -> list[JobStageMetric]:
+    query = select(JobStageMetric).where(JobStageMetric.job_id == job_id)
+    with Session(db) as session:
+        metrics = session.exec(query).all()
+    order = list(PipelineStage)
+    return sorted(metrics, key=lambda metric: order.index(metric.stage))
+
+
+# Jobs waiting for or held by a worker, for the queue depth metric
+def count_queued_jobs(db: Engine) -> dict[JobStatus, int]:
+    query = (
+        select(IngestJob.status, func.count())
+        .where(col(IngestJob.status).in_([JobStatus.PENDING, JobStatus.RUNNING]))
+        .group_by(IngestJob.status)
+    )
+    with Session(db) as session:
+        return {status: count for status, count in session.exec(query).all()}
+
+
+# Claims the oldest pending job. Rows locked by other workers are skipped,
+# so any number of workers can poll the table concurrently.
+def claim_next_job(
+    db: Engine, worker_id: str, lease_duration: dt.timedelta
+) -> IngestJob | None:
+    query = (
+        select(IngestJob)
+        .where(IngestJob.status == JobStatus.PENDING)
+        .order_by(col(IngestJob.created_at))
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    return _claim(query, db, worker_id, lease_duration)
+
+
+# Claims a specific job, if it is still pending
+def claim_job(
+    job_id: uuid.UUID, db: Engine, worker_id: str, lease_duration: dt.timedelta
+) -> IngestJob | None:
+    query = (
+        select(IngestJob)
+        .where(IngestJob.id == job_id, IngestJob.status == JobStatus.PENDING)
+        .with_for_update(skip_locked=True)
+    )
+    return _claim(query, db, worker_id, lease_duration)
+
+
+# Claims the pending jobs of a batch, in upload order, to run them together
+def claim_batch_jobs(
+    batch_id: uuid.UUID, db: Engine, worker_id: str, lease_duration: dt.timedelta
+) -> list[IngestJob]:
+    query = (
+        select(IngestJob)
+        .where(IngestJob.batch_id == batch_id, IngestJob.status == JobStatus.PENDING)
+        .order_by(col(IngestJob.created_at), col(IngestJob.id))
+        .with_for_update(skip_locked=True)
+    )
+    return _claim_all(query, db, worker_id, lease_duration)
+
+
+def _claim(
+    query: SelectOfScalar[IngestJob], db: Engine, worker_id: str, lease_duration: dt.timedelta
+) -> IngestJob | None:
+    jobs = _claim_all(query, db, worker_id, lease_duration)
+    return jobs[0] if jobs else None
+
+
+def _claim_all(
+    query: SelectOfScalar[IngestJob], db: Engine, worker_id: str, lease_duration: dt.timedelta
+) -> list[IngestJob]:
+    with Session(db, expire_on_commit=False) as session:
+        job_ids = [job.id for job in session.exec(query).all()]
+        if not job_ids:
+            return []
+        session.exec(
+            update(IngestJob)
+            .where(col(IngestJob.id).in_(job_ids))
+            .values(
+                status=JobStatus.RUNNING,
+                started_at=dt.datetime.now(),
+                worker_id=worker_id,
+                lease_expires_at=db_now(db, lease_duration),
+                attempts=IngestJob.attempts + 1,
+            )
+        )
+        jobs = session.exec(
+            select(IngestJob)
+            .where(col(IngestJob.id).in_(job_ids))
+            .execution_options(populate_existing=True)
+        ).all()
+        session.commit()
+        # In the order of the query
+        by_id = {job.id: job for job in jobs}
+        return [by_id[job_id] for job_id in job_ids]
+
+
+# Current UTC time of the database, plus `offset`. Leases are set and
+# compared with the database clock, so workers on nodes with skewed clocks
+# agree on when a lease expires.
+def db_now(
+    db: Engine, offset: dt.timedelta = dt.timedelta()
+) -> ColumnElement[dt.datetime]:
+    if db.dialect.name == "postgresql":
+        now = func.timezone("UTC", func.now()) + literal(offset, Interval())
+    else:
+        # SQLite: same text format as the stored datetimes (microseconds)
+        now = func.strftime(
+            "%Y-%m-%d %H:%M:%f", "now", f"{offset.total_seconds():+f} seconds"
+        ).concat("000")
+    return type_coerce(now, DateTime)
+
+
+# Stores the outcome of a running job, if this worker still holds its lease.
+# Returns False if the lease was lost: the job may have been requeued and
+# claimed by another worker, whose results are kept.
+def finish_job(job: IngestJob, db: Engine) -> bool:
+    with Session(db) as session:
+        result = session.exec(
+            update(IngestJob)
+            .where(
+                col(IngestJob.id) == job.id,
+                col(IngestJob.worker_id) == job.worker_id,
+                col(IngestJob.status) == JobStatus.RUNNING,
+            )
+            .values(
+                status=job.status,
+                finished_at=job.finished_at,
+                failure_reason=job.failure_reason,
+                ingested_txn_count=job.ingested_txn_count,
+                duplicate_txn_count=job.duplicate_txn_count,
+                lease_expires_at=None,
+            )
+        )
+        session.commit()
+        return result.rowcount == 1
+
+
+# Extends the lease of a running job.
+# Returns False if the worker doesn't hold the lease anymore.
+def renew_lease(
+    job_id: uuid.UUID,
+    db: Engine,
+    worker_id: str | None,
+    lease_duration: dt.timedelta,
+) -> bool:
+    with Session(db) as session:
+        result = session.exec(
+            update(IngestJob)
+            .where(
+                col(IngestJob.id) == job_id,
+                col(IngestJob.worker_id) == worker_id,
+                col(IngestJob.status) == JobStatus.RUNNING,
+            )
+            .values(lease_expires_at=db_now(db, lease_duration))
+        )
+        session.commit()
+        return result.rowcount == 1
+
+
+# Running jobs with an expired lease go back to the queue, or fail after
+# `max_attempts`. Running jobs without a lease were started before the queue
+# existed and are treated as expired. Returns the number of requeued jobs.
+def requeue_expired_jobs(db: Engine, max_attempts: int) -> int:
+    is_expired = (col(IngestJob.status) == JobStatus.RUNNING) & or_(
+        col(IngestJob.lease_expires_at).is_(None),
+        col(IngestJob.lease_expires_at) < db_now(db),
+    )
+    with Session(db) as session:
+        session.exec(
+            update(IngestJob)
+            .where(is_expired, col(IngestJob.attempts) >= max_attempts)
+            .values(
+                status=JobStatus.FAILED,
+                finished_at=dt.datetime.now(),
+                failure_reason="lease_expired",
+                lease_expires_at=None,
+            )
+        )
+        requeued = session.exec(
+            update(IngestJob)
+            .where(is_expired)
+            .values(status=JobStatus.PENDING, worker_id=None, lease_expires_at=None)
+        )
+        session.commit()
+        return requeued.rowcount
+
+
+# Identifies the process holding a lease: unique across processes and nodes
+def get_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# Renews the lease of a job in a background thread while it runs
+class LeaseHeartbeat:
+    def __init__(self, job: IngestJob, db: Engine, lease_duration: dt.timedelta):
+        self._job_id = job.id
+        self._worker_id = job.worker_id
+        self._db = db
+        self._lease_duration = lease_duration
+        self._stop_event = threading.Event()
+        self._lost = threading.Event()
+        self._thread = threading.Thread(
+            target=self._renew_loop, name=f"job-lease-{job.id}", daemon=True
+        )
+
+    # Another worker may be running the job: its results must not be written
+    @property
+    def lease_lost(self) -> bool:
+        return self._lost.is_set()
+
+    @property
+    def active(self) -> bool:
+        return self._thread.is_alive()
+
+    def __enter__(self) -> "LeaseHeartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.stop()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _renew_loop(self) -> None:
+        # Several renewals per lease, so one failed renewal doesn't lose it
+        interval = self._lease_duration.total_seconds() / 3
+        while not self._stop_event.wait(interval):
+            try:
+                renewed = renew_lease(
+                    self._job_id, self._db, self._worker_id, self._lease_duration
+                )
+            except Exception as e:
+                logger.log(logging.WARNING, f"Could not renew job lease: {e}")
+                continue
+            if not renewed:
+                self._lost.set()
+                logger.log(
+                    logging.WARNING,
+                    f"Lost the lease of job {self._job_id}, it may run again",
+                )
+                return
+
+
 class DuplicateEntryError(ValueError):
     pass
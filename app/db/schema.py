@@ -0,0 +1,105 @@
+# Responsibility: create and upgrade the database schema (explicitly, with the
+# migrate command) and check at start-up that the database matches the models.
+# Upgrades are additive: missing tables, columns and indexes are created.
+from sqlalchemy import Column, Engine, Enum, inspect, text
+from sqlalchemy.engine import Connection
+from sqlmodel import SQLModel
+
+# Register all tables
+from app.db import jobs, summaries, transactions  # noqa: F401
+
+
+class SchemaOutdatedError(RuntimeError):
+    pass
+
+
+# Returns what is missing from the database, empty if the schema is up to date
+def find_schema_problems(db: Engine) -> list[str]:
+    with db.connect() as connection:
+        inspector = inspect(connection)
+        existing_tables = set(inspector.get_table_names())
+        problems = []
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                problems.append(f"missing table {table.name}")
+                continue
+            existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            problems.extend(
+                f"missing column {table.name}.{column.name}"
+                for column in table.columns
+                if column.name not in existing_columns
+            )
+            existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            problems.extend(
+                f"missing index {index.name}"
+                for index in table.indexes
+                if index.name not in existing_indexes
+            )
+        return problems
+
+
+def check_schema(db: Engine) -> None:
+    problems = find_schema_problems(db)
+    if problems:
+        raise SchemaOutdatedError(
+            f"Database schema is outdated ({', '.join(problems)}). "
+            "Run spending-tracker-migrate."
+        )
+
+
+# Creates what is missing. Returns the changes made.
+def migrate(db: Engine) -> list[str]:
+    changes = []
+    with db.begin() as connection:
+        inspector = inspect(connection)
+        existing_tables = set(inspector.get_table_names())
+        for table in SQLModel.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                table.create(connection)
+                changes.append(f"created table {table.name}")
+                continue
+
+            existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    _add_column(connection, column)
+                    changes.append(f"added column {table.name}.{column.name}")
+
+            existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    changes.append(f"created index {index.name}")
+    return changes
+
+
+def _add_column(connection: Connection, column: Column) -> None:
+    # Native enum types (Postgres) must exist before a column can use them
+    if isinstance(column.type, Enum):
+        column.type.create(connection, checkfirst=True)
+
+    dialect = connection.dialect
+    column_type = column.type.compile(dialect=dialect)
+    definition = f"{dialect.identifier_preparer.quote(column.name)} {column_type}"
+    if not column.nullable:
+        # Existing rows get the model's default
+        default = column.default
+        if default is None or not default.is_scalar:
+            raise SchemaOutdatedError(
+                f"Can't add required column {column.table.name}.{column.name} "
+                "without a default"
+            )
+        definition += f" NOT NULL DEFAULT {_literal(default.arg)}"
+
+    table_name = dialect.identifier_preparer.quote(column.table.name)
+    connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {definition}"))
+
+
+def _literal(value: object) -> str:
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return str(value)
+    # Enums are stored by name
+    name = getattr(value, "name", value)
+    return "'" + str(name).replace("'", "''") + "'"
@@ -0,0 +1,173 @@
+# Responsibility: monthly spending rollups. Each row holds the EUR totals of a
+# user's transactions for a month and category. Rows are updated by
+# `insert_transactions` in the transaction that inserts the transactions, so
+# summaries are read from a few rows per month instead of the user's history.
+import datetime as dt
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from typing import Iterable
+
+from sqlalchemy import Date, Engine, case, delete, func, insert, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import col, Field, select, Session, SQLModel
+
+from app.project_types import EnrichedTransaction, Side
+
+
+class MonthlySpending(SQLModel, table=True):
+    __tablename__ = "monthly_spending"  # type: ignore
+
+    # Categories are part of the key: missing ones are stored as ""
+    user_id: uuid.UUID = Field(primary_key=True)
+    month: dt.date = Field(primary_key=True)
+    category: str = Field(primary_key=True, default="")
+    sub_category: str = Field(primary_key=True, default="")
+    meal_type: str = Field(primary_key=True, default="")
+    spent_eur: Decimal = Field(nullable=False, default=Decimal("0"))
+    income_eur: Decimal = Field(nullable=False, default=Decimal("0"))
+    transaction_count: int = Field(nullable=False, default=0)
+
+
+_KEY_COLUMNS = ["user_id", "month", "category", "sub_category", "meal_type"]
+_UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def month_of(value: dt.datetime | dt.date) -> dt.date:
+    return dt.date(value.year, value.month, 1)
+
+
+# Adds newly inserted transactions to the rollups, in the caller's transaction
+def add_to_rollups(
+    session: Session, transactions: Iterable[EnrichedTransaction]
+) -> None:
+    totals: dict[tuple, list] = defaultdict(lambda: [Decimal("0"), Decimal("0"), 0])
+    for transaction in transactions:
+        key = (
+            transaction.user_id,
+            month_of(transaction.transaction_datetime),
+            transaction.category or "",
+            transaction.sub_category or "",
+            transaction.meal_type or "",
+        )
+        total = totals[key]
+        amount = transaction.eur_amount or Decimal("0")
+        if transaction.side == Side.DEBIT:
+            total[0] += amount
+        else:
+            total[1] += amount
+        total[2] += 1
+    if not totals:
+        return
+
+    # Rows are locked in key order, so concurrent jobs of a user can't deadlock
+    rows = [
+        dict(
+            zip(_KEY_COLUMNS, key),
+            spent_eur=spent,
+            income_eur=income,
+            transaction_count=count,
+        )
+        for key, (spent, income, count) in sorted(totals.items(), key=_sort_key)
+    ]
+    dialect_insert = _UPSERTS.get(session.get_bind().dialect.name)
+    if dialect_insert is None:
+        _add_with_orm(session, rows)
+        return
+
+    upsert = dialect_insert(MonthlySpending)
+    statement = upsert.on_conflict_do_update(
+        index_elements=_KEY_COLUMNS,
+        set_={
+            "spent_eur": MonthlySpending.spent_eur + upsert.excluded.spent_eur,
+            "income_eur": MonthlySpending.income_eur + upsert.excluded.income_eur,
+            "transaction_count": MonthlySpending.transaction_count
+            + upsert.excluded.transaction_count,
+        },
+    )
+    session.connection().execute(statement, rows)
+
+
+# Databases without an upsert: each rollup row is read, then updated or added
+def _add_with_orm(session: Session, rows: list[dict]) -> None:
+    for row in rows:
+        key = tuple(row[column] for column in _KEY_COLUMNS)
+        rollup = session.get(MonthlySpending, key)
+        if rollup is None:
+            session.add(MonthlySpending(**row))
+            continue
+        rollup.spent_eur += row["spent_eur"]
+        rollup.income_eur += row["income_eur"]
+        rollup.transaction_count += row["transaction_count"]
+        session.add(rollup)
+
+
+def _sort_key(item: tuple[tuple, list]) -> tuple:
+    user_id, *rest = item[0]
+    return (str(user_id), *rest)
+
+
+# Recomputes the rollups from the transactions, of one user or of all users.
+# Returns the number of rollup rows written.
+def rebuild_rollups(db: Engine, user_id: uuid.UUID | None = None) -> int:
+    # Imported here: app.db.transactions imports this module
+    from app.db.transactions import Transaction
+
+    if db.dialect.name == "postgresql":
+        month = func.date_trunc("month", Transaction.transaction_datetime).cast(Date)
+    else:
+        month = func.date(Transaction.transaction_datetime, "start of month")
+    keys = [
+        col(Transaction.user_id),
+        month,
+        func.coalesce(Transaction.category, ""),
+        func.coalesce(Transaction.sub_category, ""),
+        func.coalesce(Transaction.meal_type, ""),
+    ]
+    eur_amount = func.coalesce(Transaction.eur_amount, 0)
+    aggregate = select(
+        *keys,
+        func.sum(case((col(Transaction.side) == Side.DEBIT, eur_amount), else_=0)),
+        func.sum(case((col(Transaction.side) == Side.CREDIT, eur_amount), else_=0)),
+        func.count(),
+    ).group_by(*keys)
+    clear = delete(MonthlySpending)
+    if user_id is not None:
+        aggregate = aggregate.where(Transaction.user_id == user_id)
+        clear = clear.where(col(MonthlySpending.user_id) == user_id)
+
+    with Session(db) as session:
+        if db.dialect.name == "postgresql":
+            # Waits for the jobs updating the rollups to commit, and makes new
+            # ones wait for the rebuild: their transactions are counted once
+            session.exec(
+                text("LOCK TABLE monthly_spending IN SHARE ROW EXCLUSIVE MODE")  # type: ignore
+            )
+        session.exec(clear)  # type: ignore
+        result = session.exec(
+            insert(MonthlySpending).from_select(  # type: ignore
+                _KEY_COLUMNS + ["spent_eur", "income_eur", "transaction_count"],
+                aggregate,
+            )
+        )
+        session.commit()
+        return result.rowcount
+
+
+# Rollups of the user's months from `first_month` to `last_month` (inclusive)
+def load_monthly_spending(
+    db: Engine,
+    user_id: uuid.UUID,
+    first_month: dt.date | None = None,
+    last_month: dt.date | None = None,
+) -> list[MonthlySpending]:
+    query = select(MonthlySpending).where(MonthlySpending.user_id == user_id)
+    if first_month is not None:
+        query = query.where(col(MonthlySpending.month) >= first_month)
+    if last_month is not None:
+        query = query.where(col(MonthlySpending.month) <= last_month)
+    query = query.order_by(
+        col(MonthlySpending.month).desc(), col(MonthlySpending.spent_eur).desc()
+    )
+    with Session(db) as session:
+        return list(session.exec(query).all())
@@ -1,17 +1,60 @@
+import csv
 import uuid
 import datetime as dt
+from dataclasses import dataclass, fields
 from decimal import Decimal
+from enum import Enum
+from io import StringIO
+from typing import Any, Sequence
 
-from sqlalchemy import Engine, UniqueConstraint
-from sqlmodel import Field, select, Session, SQLModel
+from sqlalchemy import ColumnElement, Engine, Index, text, tuple_, UniqueConstraint
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import col, Field, select, Session, SQLModel
 
-from app.project_types import Side, TransactionSource, TransactionType
+from app.config import InsertMode
+from app.db.summaries import add_to_rollups
+from app.project_types import (
+    EnrichedTransaction,
+    Side,
+    TransactionSource,
+    TransactionType,
+)
+
+# Postgres limits the number of bind parameters in a single statement,
+# so large statements are inserted in several multi-row INSERTs.
+INSERT_BATCH_SIZE = 1000
+STAGING_TABLE = "transactions_staging"
 
 
 class Transaction(SQLModel, table=True):
     __tablename__ = "transactions" # type: ignore
     __table_args__ = (
         UniqueConstraint("user_id", "dedup_key", name="uq_transaction_user_id_dedup_key"),
+        # Queries of a user's transactions, newest first, optionally by date range
+        Index("ix_transactions_user_datetime", "user_id", "transaction_datetime", "id"),
+        Index(
+            "ix_transactions_user_category_datetime",
+            "user_id",
+            "category",
+            "transaction_datetime",
+            "id",
+        ),
+        Index(
+            "ix_transactions_user_source_datetime",
+            "user_id",
+            "source",
+            "transaction_datetime",
+            "id",
+        ),
+        # Credits (income, refunds) are a small share of the rows: a partial
+        # index finds them without reading past the debits
+        Index(
+            "ix_transactions_user_credits_datetime",
+            "user_id",
+            "transaction_datetime",
+            "id",
+            postgresql_where=text("side = 'CREDIT'"),
+        ),
     )
 
     id: uuid.UUID = Field(primary_key=True, default_factory=uuid.uuid4)
@@ -35,13 +78,207 @@ class Transaction(SQLModel, table=True):
     user_id: uuid.UUID = Field(nullable=False)
 
 
-def insert_transactions(transactions: list[Transaction], db: Engine) -> None:
+# Conditions of a transactions query. Unset conditions don't filter.
+@dataclass(frozen=True, slots=True)
+class TransactionQuery:
+    user_id: uuid.UUID
+    # From `start` (inclusive) to `end` (exclusive)
+    start: dt.datetime | None = None
+    end: dt.datetime | None = None
+    category: str | None = None
+    source: TransactionSource | None = None
+    side: Side | None = None
+
+    def conditions(self) -> list[ColumnElement[bool]]:
+        conditions = [col(Transaction.user_id) == self.user_id]
+        if self.start is not None:
+            conditions.append(col(Transaction.transaction_datetime) >= self.start)
+        if self.end is not None:
+            conditions.append(col(Transaction.transaction_datetime) < self.end)
+        if self.category is not None:
+            conditions.append(col(Transaction.category) == self.category)
+        if self.source is not None:
+            conditions.append(col(Transaction.source) == self.source)
+        if self.side is not None:
+            conditions.append(col(Transaction.side) == self.side)
+        return conditions
+
+
+# A page of transactions, newest first. `after` is the
+# (transaction_datetime, id) of the last transaction of the previous page.
+def list_transactions(
+    db: Engine,
+    transaction_query: TransactionQuery,
+    limit: int,
+    after: tuple[dt.datetime, uuid.UUID] | None = None,
+) -> list[Transaction]:
+    query = select(Transaction).where(*transaction_query.conditions())
+    if after is not None:
+        query = query.where(
+            tuple_(col(Transaction.transaction_datetime), col(Transaction.id)) < after
+        )
+    query = query.order_by(
+        col(Transaction.transaction_datetime).desc(), col(Transaction.id).desc()
+    ).limit(limit)
+    with Session(db) as session:
+        return list(session.exec(query).all())
+
+
+# Inserts the transactions that are not stored yet for the user and returns
+# the dedup keys of the inserted rows. Deduplication is done by the database
+# using the (user_id, dedup_key) unique constraint, so the cost depends on the
+# size of the batch and not on the size of the table.
+# The monthly rollups are updated with the inserted rows in the same transaction.
+def insert_transactions(
+    transactions: Sequence[EnrichedTransaction],
+    db: Engine,
+    mode: InsertMode = InsertMode.BATCHED,
+    chunk_size: int = INSERT_BATCH_SIZE,
+) -> set[str]:
+    # Bulk load paths rely on Postgres specific syntax (ON CONFLICT, COPY)
+    if mode == InsertMode.ORM or db.dialect.name != "postgresql":
+        return _insert_with_orm(transactions, db, chunk_size)
+
     with Session(db) as session:
-        session.add_all(transactions)
+        if mode == InsertMode.COPY:
+            inserted = _insert_with_copy(session, transactions, chunk_size)
+        else:
+            inserted = _insert_batched(session, transactions, chunk_size)
+        add_to_rollups(session, _inserted_transactions(transactions, inserted))
         session.commit()
 
+    return inserted
+
+
+# The first transaction of each inserted dedup key: later ones in the same
+# batch were skipped as duplicates
+def _inserted_transactions(
+    transactions: Sequence[EnrichedTransaction], inserted: set[str]
+) -> list[EnrichedTransaction]:
+    remaining = set(inserted)
+    result = []
+    for transaction in transactions:
+        if transaction.dedup_key in remaining:
+            remaining.discard(transaction.dedup_key)
+            result.append(transaction)
+    return result
+
+
+_RECORD_FIELDS = [field.name for field in fields(EnrichedTransaction)]
+
+
+# Column values of the row to insert. Columns not set by the pipeline
+# get the same values as the Transaction model defaults.
+def _to_row(transaction: EnrichedTransaction) -> dict[str, Any]:
+    row = {name: getattr(transaction, name) for name in _RECORD_FIELDS}
+    row["id"] = uuid.uuid4()
+    row["manually_added"] = False
+    row["refunded_eur_amount"] = Decimal("0")
+    return row
 
-def get_existing_dedup_keys(db: Engine) -> list[str]:
+
+def _insert_batched(
+    session: Session, transactions: Sequence[EnrichedTransaction], chunk_size: int
+) -> set[str]:
+    statement = (
+        insert(Transaction.__table__)  # type: ignore
+        .on_conflict_do_nothing(constraint="uq_transaction_user_id_dedup_key")
+        .returning(Transaction.dedup_key)  # type: ignore
+    )
+    # Executed as multi-row INSERTs of `chunk_size` rows (insertmanyvalues)
+    connection = session.connection(
+        execution_options={"insertmanyvalues_page_size": chunk_size}
+    )
+    inserted: set[str] = set()
+    for start in range(0, len(transactions), chunk_size):
+        batch = transactions[start : start + chunk_size]
+        result = connection.execute(statement, [_to_row(txn) for txn in batch])
+        inserted.update(result.scalars().all())
+    return inserted
+
+
+_COPY_COLUMNS = [column.name for column in Transaction.__table__.columns]  # type: ignore
+
+
+# Streams the rows into a temporary staging table with COPY and moves them
+# into the transactions table with a single INSERT ... SELECT.
+def _insert_with_copy(
+    session: Session, transactions: Sequence[EnrichedTransaction], chunk_size: int
+) -> set[str]:
+    columns = ", ".join(_COPY_COLUMNS)
+    # Raw DBAPI (psycopg2) connection sharing the session transaction
+    cursor = session.connection().connection.cursor()
+    try:
+        # Rows are numbered in COPY order, see the INSERT below
+        cursor.execute(
+            f"CREATE TEMP TABLE {STAGING_TABLE} "
+            "(LIKE transactions INCLUDING DEFAULTS, position bigserial) "
+            "ON COMMIT DROP"
+        )
+        for start in range(0, len(transactions), chunk_size):
+            buffer = StringIO()
+            writer = csv.writer(buffer, quoting=csv.QUOTE_NOTNULL)
+            writer.writerows(
+                _to_copy_row(txn) for txn in transactions[start : start + chunk_size]
+            )
+            buffer.seek(0)
+            cursor.copy_expert(
+                f"COPY {STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+
+        # A dedup key repeated in the batch is inserted from its first row,
+        # as in the other modes (see _inserted_transactions)
+        cursor.execute(
+            f"INSERT INTO transactions ({columns}) "
+            f"SELECT DISTINCT ON (user_id, dedup_key) {columns} FROM {STAGING_TABLE} "
+            "ORDER BY user_id, dedup_key, position "
+            "ON CONFLICT ON CONSTRAINT uq_transaction_user_id_dedup_key DO NOTHING "
+            "RETURNING dedup_key"
+        )
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def _to_copy_row(transaction: EnrichedTransaction) -> list[Any]:
+    row = _to_row(transaction)
+    values = []
+    for column in _COPY_COLUMNS:
+        value = row[column]
+        # Enum columns store the member names, same as the ORM does
+        if isinstance(value, Enum):
+            value = value.name
+        values.append(value)
+    return values
+
+
+# Fallback for databases without ON CONFLICT / COPY support.
+# Only the dedup keys of the current batch are looked up,
+# and ORM objects are only built for the new transactions.
+def _insert_with_orm(
+    transactions: Sequence[EnrichedTransaction], db: Engine, chunk_size: int
+) -> set[str]:
+    inserted: set[str] = set()
     with Session(db) as session:
-        result = session.exec(select(Transaction.dedup_key)).all()
-        return list(result)
+        for start in range(0, len(transactions), chunk_size):
+            batch = transactions[start : start + chunk_size]
+            existing = set(
+                session.exec(
+                    select(Transaction.user_id, Transaction.dedup_key).where(
+                        Transaction.dedup_key.in_(  # type: ignore
+                            [txn.dedup_key for txn in batch]
+                        )
+                    )
+                ).all()
+            )
+            for transaction in batch:
+                key = (transaction.user_id, transaction.dedup_key)
+                if key not in existing:
+                    existing.add(key)
+                    session.add(Transaction(**_to_row(transaction)))
+                    inserted.add(transaction.dedup_key)
+        add_to_rollups(session, _inserted_transactions(transactions, inserted))
+        session.commit()
+
+    return inserted
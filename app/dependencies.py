@@ -1,19 +1,25 @@
 import logging
-from typing import Annotated
+from typing import Annotated, TYPE_CHECKING
 from uuid import UUID
 
+import httpx
+import jwt
 from fastapi import Depends, HTTPException, Request
 from fastapi.security import (
     HTTPBearer,
     HTTPAuthorizationCredentials,
 )
-from supabase import Client
 from supabase_auth.errors import AuthApiError
 from sqlalchemy import Engine
 
+from app.auth import LocalVerificationUnavailable, TokenVerifier
 from app.file_storage import FileStorage
 from app.config import AppConfig
 
+if TYPE_CHECKING:
+    # Slow to import, loaded when the storage clients are started
+    from supabase import Client
+
 logger = logging.getLogger(__name__)
 jwt_auth = HTTPBearer()
 
@@ -32,25 +38,78 @@ def get_db_engine(request: Request):
 DBDependency = Annotated[Engine, Depends(get_db_engine)]
 
 
+# Storage is started in the background in fast-start mode
+def _get_started(request: Request, name: str):  # type: ignore
+    component = getattr(request.app.state, name, None)
+    if component is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Service is starting",
+            headers={"Retry-After": "1"},
+        )
+    return component
+
+
 def get_file_storage(request: Request) -> FileStorage:
-    return request.app.state.file_storage
+    return _get_started(request, "file_storage")
 
 
 FSDependency = Annotated[FileStorage, Depends(get_file_storage)]
 
 
-def get_supabase_admin(request: Request) -> Client:
-    return request.app.state.supabase_admin
+def get_http_client(request: Request) -> httpx.Client:
+    return request.app.state.http_client
+
+
+HttpClientDependency = Annotated[httpx.Client, Depends(get_http_client)]
+
+
+def get_supabase_admin(request: Request) -> "Client":
+    return _get_started(request, "supabase_admin")
+
+
+SupabaseAdminDependency = Annotated["Client", Depends(get_supabase_admin)]
+
+
+def get_token_verifier(request: Request) -> TokenVerifier:
+    return request.app.state.token_verifier
 
 
-SupabaseAdminDependency = Annotated[Client, Depends(get_supabase_admin)]
+TokenVerifierDependency = Annotated[TokenVerifier, Depends(get_token_verifier)]
 
 
+# Verifies the token locally. The auth server is only asked when the signing key
+# isn't known locally: until then, the admin client isn't needed (it may still be
+# starting in fast-start mode).
 def get_authenticated_user(
-    supabase_admin: SupabaseAdminDependency,
+    request: Request,
+    token_verifier: TokenVerifierDependency,
     header: Annotated[HTTPAuthorizationCredentials, Depends(jwt_auth)],
 ) -> UUID:
     token = header.credentials
+    try:
+        return token_verifier.verify(token)
+    except jwt.InvalidTokenError as e:
+        logger.log(logging.WARNING, f"Could not validate Bearer token: {e}")
+        raise HTTPException(status_code=401, detail="User Authentication Failed")
+    except LocalVerificationUnavailable as e:
+        logger.log(logging.INFO, f"Verifying Bearer token remotely: {e}")
+
+    user_id = _get_remote_user(get_supabase_admin(request), token)
+    token_verifier.remember(token, user_id)
+    return user_id
+
+
+# For routes that must not accept revoked sessions (signed out users): always
+# asks the auth server
+def get_authenticated_user_strict(
+    request: Request,
+    header: Annotated[HTTPAuthorizationCredentials, Depends(jwt_auth)],
+) -> UUID:
+    return _get_remote_user(get_supabase_admin(request), header.credentials)
+
+
+def _get_remote_user(supabase_admin: "Client", token: str) -> UUID:
     try:
         result = supabase_admin.auth.get_user(token)
     except AuthApiError as e:
@@ -64,3 +123,4 @@ def get_authenticated_user(
 
 
 AuthDependency = Annotated[UUID, Depends(get_authenticated_user)]
+StrictAuthDependency = Annotated[UUID, Depends(get_authenticated_user_strict)]
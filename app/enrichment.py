@@ -1,12 +1,13 @@
 import datetime as dt
-import re
 from decimal import Decimal
+from typing import Sequence
 from uuid import UUID
 
-from currency_converter import CurrencyConverter, ECB_URL, RateNotFoundError
+import numpy as np
 
-from app.db.transactions import Transaction
-from app.project_types import ImportedTransaction
+from app.fx_rates import RateStore
+from app.merchant_matching import MerchantMatcher
+from app.project_types import EnrichedTransaction, ImportedTransaction
 
 import logging
 
@@ -55,40 +56,56 @@ RESTAURANT_MERCHANTS = {
     "Desertas Islandijos G3",
     "Jūsų Šnekutis",
 }
+BREAKFAST_MERCHANTS = {"caffeine", "kavos era"}
+
+# Compiled once, so each counterparty is normalized and scanned a single time
+_MERCHANT_MATCHER = (
+    MerchantMatcher()
+    .add_exact("groceries", SUPERMARKET_MERCHANTS)
+    .add_exact("breakfast", BREAKFAST_MERCHANTS)
+    .add_exact("hot_drinks", COFFESHOP_MERCHANTS)
+    .add_prefix("streaming", STREAMING_MERCHANTS)
+    .add_exact("business_lunch", BUSINESS_LUNCH_MERCHANTS)
+    .add_exact("food_delivery", FOOD_DELIVERY_MERCHANTS)
+    .add_substring("eating_out", RESTAURANT_MERCHANTS)
+    .compile()
+)
 
 
 def enrich_transactions(
-    transactions: list[ImportedTransaction], job_id: UUID, user_id: UUID
-) -> list[Transaction]:
+    transactions: list[ImportedTransaction],
+    job_id: UUID,
+    user_id: UUID,
+    rate_store: RateStore,
+) -> list[EnrichedTransaction]:
     result = []
-    converter = CurrencyConverter(ECB_URL)
-    for transaction in transactions:
-        # 1. convert to eur
-        try:
-            eur_amount = get_eur_amount(
-                converter,
-                transaction.transaction_datetime,
-                transaction.orig_currency,
-                transaction.orig_amount,
-            )
-        # If there are issues with the converter module, we use null eur amount
-        except Exception:
-            eur_amount = None
-
+    # 1. convert to eur, for the whole batch at once
+    eur_amounts = rate_store.rate_table.to_eur(
+        dates=[txn.transaction_datetime for txn in transactions],
+        currencies=[txn.orig_currency for txn in transactions],
+        amounts=[txn.orig_amount for txn in transactions],
+    )
+    for transaction, eur_amount in zip(transactions, eur_amounts):
         if eur_amount is None:
             logger.log(logging.WARNING, f"Could not convert to EUR for {transaction}")
 
         # 2. Calculate spending categories
         categorization = get_categorization(transaction)
 
-        new_values = {
-            "eur_amount": eur_amount,
-            "auto_added": True,
-            "job_id": job_id,
-            "user_id": user_id,
-        }
-        enriched_transaction = Transaction.model_validate(
-            {**transaction.model_dump(), **new_values, **categorization}
+        enriched_transaction = EnrichedTransaction(
+            transaction_datetime=transaction.transaction_datetime,
+            type=transaction.type,
+            counterparty=transaction.counterparty,
+            orig_amount=transaction.orig_amount,
+            orig_currency=transaction.orig_currency,
+            side=transaction.side,
+            source=transaction.source,
+            note=categorization.pop("note", transaction.note),
+            dedup_key=transaction.dedup_key,
+            eur_amount=eur_amount,
+            job_id=job_id,
+            user_id=user_id,
+            **categorization,
         )
 
         result.append(enriched_transaction)
@@ -97,14 +114,20 @@ def enrich_transactions(
 
 
 def get_categorization(transaction: ImportedTransaction) -> dict[str, str]:
-    if _is_groceries(transaction):
+    merchant_groups = _MERCHANT_MATCHER.match(transaction.counterparty)
+    if not merchant_groups:
+        return {}
+
+    txn_datetime = transaction.transaction_datetime
+    hour = txn_datetime.hour
+    if "groceries" in merchant_groups:
         return {
             "category": "Groceries",
             "sub_category": "Groceries",
             "detail": "Groceries",
         }
 
-    elif _is_breakfast(transaction):
+    elif "breakfast" in merchant_groups and hour < 11 and transaction.orig_amount > 5:
         return {
             "category": "Food & Drink",
             "sub_category": "Food",
@@ -112,7 +135,7 @@ def get_categorization(transaction: ImportedTransaction) -> dict[str, str]:
             "meal_type": "Breakfast",
         }
 
-    elif _is_hot_drinks(transaction):
+    elif "hot_drinks" in merchant_groups and transaction.orig_amount < 5:
         return {
             "category": "Food & Drink",
             "sub_category": "Food",
@@ -120,14 +143,18 @@ def get_categorization(transaction: ImportedTransaction) -> dict[str, str]:
             "meal_type": "Snacks",
         }
 
-    elif _is_streaming_services(transaction):
+    elif "streaming" in merchant_groups:
         return {
             "category": "Entertainment",
             "sub_category": "Streaming Services",
             "detail": f"{transaction.counterparty} subscription",
         }
 
-    elif _is_business_lunch(transaction):
+    elif (
+        "business_lunch" in merchant_groups
+        and txn_datetime.isoweekday() in range(1, 6)  # Weekday
+        and 11 <= hour < 15
+    ):
         return {
             "category": "Food & Drink",
             "sub_category": "Food",
@@ -136,13 +163,12 @@ def get_categorization(transaction: ImportedTransaction) -> dict[str, str]:
             "meal_type": "Lunch",
         }
 
-    elif _is_food_delivery(transaction):
+    elif "food_delivery" in merchant_groups:
         categorization = {
             "category": "Food & Drink",
             "sub_category": "Food",
             "detail": "Food Delivery",
         }
-        hour = transaction.transaction_datetime.hour
         if 10 < hour <= 15:
             meal_type = "Lunch"
         else:
@@ -151,13 +177,12 @@ def get_categorization(transaction: ImportedTransaction) -> dict[str, str]:
         categorization["meal_type"] = meal_type
         return categorization
 
-    elif _is_eating_out(transaction):
+    elif "eating_out" in merchant_groups:
         categorization = {
             "category": "Food & Drink",
             "sub_category": "Food",
             "detail": "Eating Out",
         }
-        hour = transaction.transaction_datetime.hour
         if hour < 11:
             meal_type = "Breakfast"
         elif hour < 17:
@@ -171,81 +196,105 @@ def get_categorization(transaction: ImportedTransaction) -> dict[str, str]:
     return {}
 
 
-def _is_eating_out(transaction: ImportedTransaction):
-    counterparty = transaction.counterparty.lower().strip()
-    return any(merchant.lower() in counterparty for merchant in RESTAURANT_MERCHANTS)
-
-
-def _is_food_delivery(transaction: ImportedTransaction):
-    counterparty = transaction.counterparty.lower().strip()
-    return any(counterparty == merchant.lower() for merchant in FOOD_DELIVERY_MERCHANTS)
-
-
-def _is_business_lunch(transaction: ImportedTransaction):
-    counterparty = transaction.counterparty.lower().strip()
-    return (
-        any(counterparty == merchant.lower() for merchant in BUSINESS_LUNCH_MERCHANTS)
-        and transaction.transaction_datetime.isoweekday() in range(1, 6)  # Weekday
-        and 11 <= transaction.transaction_datetime.hour < 15
-    )
-
-
-def _is_streaming_services(transaction: ImportedTransaction):
-    counterparty = transaction.counterparty.lower().strip()
-    return any(
-        re.search(rf"^{merchant}.*$", counterparty, flags=re.IGNORECASE)
-        for merchant in STREAMING_MERCHANTS
-    )
-
-
-def _is_groceries(transaction: ImportedTransaction):
-    counterparty = transaction.counterparty.lower().strip()
-    return any(counterparty == merchant.lower() for merchant in SUPERMARKET_MERCHANTS)
-
+# Column-wise version of get_categorization for a batch of transactions.
+# Returns category columns; "note" is None where the transaction note is kept.
+def categorize_batch(
+    counterparties: Sequence[str],
+    datetimes: Sequence[dt.datetime],
+    amounts: Sequence[Decimal],
+) -> dict[str, list[str | None]]:
+    # Statements repeat the same merchants, so each one is matched only once
+    matches = {cp: _MERCHANT_MATCHER.match(cp) for cp in set(counterparties)}
+    groups = [matches[cp] for cp in counterparties]
+
+    def in_group(label: str) -> np.ndarray:
+        return np.array(
+            [label in merchant_groups for merchant_groups in groups], dtype=bool
+        )
 
-def _is_breakfast(transaction: ImportedTransaction):
-    counterparty = transaction.counterparty.lower().strip()
-    return (
-        counterparty in ("caffeine", "kavos era")
-        and transaction.transaction_datetime.hour < 11
-        and transaction.orig_amount > 5
+    hour = np.array([txn_datetime.hour for txn_datetime in datetimes], dtype=int)
+    weekday = np.array([txn_datetime.isoweekday() for txn_datetime in datetimes])
+    above_5 = np.array([amount > 5 for amount in amounts], dtype=bool)
+    below_5 = np.array([amount < 5 for amount in amounts], dtype=bool)
+
+    # Same order as get_categorization, the first matching rule wins
+    rules = [
+        "groceries",
+        "breakfast",
+        "hot_drinks",
+        "streaming",
+        "business_lunch",
+        "food_delivery",
+        "eating_out",
+    ]
+    rule = np.select(
+        [
+            in_group("groceries"),
+            in_group("breakfast") & (hour < 11) & above_5,
+            in_group("hot_drinks") & below_5,
+            in_group("streaming"),
+            in_group("business_lunch") & (weekday <= 5) & (11 <= hour) & (hour < 15),
+            in_group("food_delivery"),
+            in_group("eating_out"),
+        ],
+        rules,
+        default="",
     )
 
-
-def _is_hot_drinks(transaction: ImportedTransaction):
-    counterparty = transaction.counterparty.lower().strip()
-    return (
-        any(counterparty == merchant.lower() for merchant in COFFESHOP_MERCHANTS)
-        and transaction.orig_amount < 5
+    delivery_meal = np.where((10 < hour) & (hour <= 15), "Lunch", "Dinner")
+    eating_out_meal = np.select(
+        [hour < 11, hour < 17], ["Breakfast", "Lunch"], default="Dinner"
     )
-
-
-def get_eur_amount(
-    converter: CurrencyConverter,
-    txn_date: dt.date,
-    orig_currency: str,
-    orig_amount: Decimal,
-) -> Decimal | None:
-    MAX_RETRIES = 10
-
-    if orig_currency.upper() == "EUR":
-        return orig_amount
-
-    eur_amount = None
-    exchange_rate_date = txn_date
-    retry_attempts = 0
-    # If the rate on the day of the transaction is not available
-    # we find the rate for the closest date
-    while eur_amount is None:
-        if retry_attempts > MAX_RETRIES:
-            return None
-
-        try:
-            eur_amount = converter.convert(
-                orig_amount, orig_currency, "EUR", date=exchange_rate_date
-            )
-        except RateNotFoundError:
-            exchange_rate_date = exchange_rate_date - dt.timedelta(days=1)
-            retry_attempts += 1
-
-    return Decimal(eur_amount).quantize(Decimal("0.01"))
+    streaming_detail = [f"{counterparty} subscription" for counterparty in counterparties]
+    food_rules = [
+        "breakfast",
+        "hot_drinks",
+        "business_lunch",
+        "food_delivery",
+        "eating_out",
+    ]
+
+    def pick(values_by_rule: dict[str, object]) -> list[str | None]:
+        return np.select(
+            [rule == name for name in values_by_rule],
+            [np.asarray(value, dtype=object) for value in values_by_rule.values()],
+            default=None,
+        ).tolist()
+
+    return {
+        "category": pick(
+            {
+                "groceries": "Groceries",
+                "streaming": "Entertainment",
+                **dict.fromkeys(food_rules, "Food & Drink"),
+            }
+        ),
+        "sub_category": pick(
+            {
+                "groceries": "Groceries",
+                "streaming": "Streaming Services",
+                **dict.fromkeys(food_rules, "Food"),
+            }
+        ),
+        "detail": pick(
+            {
+                "groceries": "Groceries",
+                "breakfast": "Eating Out",
+                "hot_drinks": "Hot Drinks & Snacks",
+                "streaming": streaming_detail,
+                "business_lunch": "Eating Out",
+                "food_delivery": "Food Delivery",
+                "eating_out": "Eating Out",
+            }
+        ),
+        "meal_type": pick(
+            {
+                "breakfast": "Breakfast",
+                "hot_drinks": "Snacks",
+                "business_lunch": "Lunch",
+                "food_delivery": delivery_meal,
+                "eating_out": eating_out_meal,
+            }
+        ),
+        "note": pick({"business_lunch": "Business Lunch"}),
+    }
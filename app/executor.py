@@ -0,0 +1,91 @@
+# Responsibility: run the CPU-bound pipeline stages (parse, filter, enrich)
+# in a pool of processes, so they don't compete with request handling
+# for the GIL of the API process. Only the statement bytes and the enriched
+# records cross the process boundary.
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, TypeVar
+
+from app.config import AppConfig, PipelineExecutor
+from app.fx_rates import get_rate_store
+from app.logging_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+# Set in the pool processes by the initializer
+_process_app_config: AppConfig | None = None
+
+
+def run_cpu_bound(
+    app_config: AppConfig, fn: Callable[..., T], /, *args: Any, **kwargs: Any
+) -> T:
+    if app_config.pipeline_executor == PipelineExecutor.INLINE:
+        return fn(*args, **kwargs)
+
+    pool = _get_pool(app_config)
+    try:
+        return pool.submit(_run_task, fn, *args, **kwargs).result()
+    except BrokenProcessPool:
+        # A pool process died (e.g. out of memory). The next job gets a new pool.
+        _discard_pool(pool)
+        raise
+
+
+def get_pool_size(app_config: AppConfig) -> int:
+    cores = os.cpu_count() or 1
+    return max(1, math.floor(cores * app_config.pipeline_processes_per_core))
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def _get_pool(app_config: AppConfig) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            pool_size = get_pool_size(app_config)
+            # Processes are spawned: forking a process that runs threads isn't safe
+            _pool = ProcessPoolExecutor(
+                max_workers=pool_size,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process,
+                initargs=(app_config,),
+            )
+            logger.log(logging.INFO, f"Started {pool_size} pipeline processes")
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _init_process(app_config: AppConfig) -> None:
+    global _process_app_config
+    configure_logging()
+    _process_app_config = app_config
+    get_rate_store(app_config).follow_snapshot()
+
+
+def _run_task(fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+    # Rates are downloaded by the parent process, which may have refreshed them
+    assert _process_app_config is not None
+    get_rate_store(_process_app_config).follow_snapshot()
+    return fn(*args, **kwargs)
@@ -0,0 +1,167 @@
+# Responsibility: export a user's transactions as CSV or Parquet.
+# Rows are read through a server-side cursor in batches of `batch_size` and
+# each batch is encoded and handed to the response before the next one is
+# read, so memory doesn't grow with the number of exported rows.
+# pyarrow (Parquet) is an optional dependency: pip install spending-tracker[parquet]
+import csv
+import importlib.util
+from io import StringIO
+from typing import Any, Iterator, Sequence
+
+from sqlalchemy import Engine, select
+from sqlmodel import col
+
+from app.db.transactions import Transaction, TransactionQuery
+from app.project_types import ExportFormat
+
+EXPORT_COLUMNS = [
+    "id",
+    "transaction_datetime",
+    "type",
+    "counterparty",
+    "orig_amount",
+    "orig_currency",
+    "side",
+    "source",
+    "eur_amount",
+    "refunded_eur_amount",
+    "category",
+    "sub_category",
+    "detail",
+    "meal_type",
+    "note",
+    "manually_added",
+    "job_id",
+]
+MEDIA_TYPES = {
+    ExportFormat.CSV: "text/csv; charset=utf-8",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+
+def is_format_available(export_format: ExportFormat) -> bool:
+    if export_format == ExportFormat.PARQUET:
+        return importlib.util.find_spec("pyarrow") is not None
+    return True
+
+
+def export_transactions(
+    db: Engine,
+    transaction_query: TransactionQuery,
+    export_format: ExportFormat,
+    batch_size: int,
+) -> Iterator[bytes]:
+    batches = _read_batches(db, transaction_query, batch_size)
+    if export_format == ExportFormat.PARQUET:
+        return _encode_parquet(batches)
+    return _encode_csv(batches)
+
+
+# Oldest first. The connection is held until the export is done or the client
+# disconnects (the generator is closed).
+def _read_batches(
+    db: Engine, transaction_query: TransactionQuery, batch_size: int
+) -> Iterator[Sequence[Sequence[Any]]]:
+    table = Transaction.__table__  # type: ignore
+    query = (
+        select(*(table.c[name] for name in EXPORT_COLUMNS))
+        .where(*transaction_query.conditions())
+        .order_by(col(Transaction.transaction_datetime), col(Transaction.id))
+    )
+    with db.connect() as connection:
+        # Server-side cursor on Postgres: rows are fetched `batch_size` at a time
+        result = connection.execution_options(
+            stream_results=True, yield_per=batch_size
+        ).execute(query)
+        yield from result.partitions()
+
+
+def _encode_csv(batches: Iterator[Sequence[Sequence[Any]]]) -> Iterator[bytes]:
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        # Enums are written as their values, UUIDs and amounts with str()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header of an empty export
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+# One Parquet row group per batch. The file footer is written at the end.
+def _encode_parquet(batches: Iterator[Sequence[Sequence[Any]]]) -> Iterator[bytes]:
+    # Imported here: optional dependency, slow to import
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    amount = pa.decimal128(38, 10)
+    schema = pa.schema(
+        [
+            ("id", pa.string()),
+            ("transaction_datetime", pa.timestamp("us")),
+            ("type", pa.string()),
+            ("counterparty", pa.string()),
+            ("orig_amount", amount),
+            ("orig_currency", pa.string()),
+            ("side", pa.string()),
+            ("source", pa.string()),
+            ("eur_amount", amount),
+            ("refunded_eur_amount", amount),
+            ("category", pa.string()),
+            ("sub_category", pa.string()),
+            ("detail", pa.string()),
+            ("meal_type", pa.string()),
+            ("note", pa.string()),
+            ("manually_added", pa.bool_()),
+            ("job_id", pa.string()),
+        ]
+    )
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for batch in batches:
+            columns = [
+                pa.array(
+                    _as_strings(values) if field.type == pa.string() else values,
+                    type=field.type,
+                )
+                for field, values in zip(schema, zip(*batch))
+            ]
+            writer.write_table(pa.table(columns, schema=schema))
+            yield sink.take()
+    yield sink.take()
+
+
+# Enums and UUIDs are stored as strings in Parquet
+def _as_strings(values: Sequence[Any]) -> list[str | None]:
+    return [None if value is None else str(value) for value in values]
+
+
+# Write-only file handed to the Parquet writer. What was written since the
+# last `take` is passed on to the response.
+class _ChunkSink:
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
@@ -1,38 +1,165 @@
+import base64
 import datetime as dt
+import hashlib
+import logging
+import mimetypes
+import zipfile
+from dataclasses import dataclass
 from io import BytesIO
-from typing import Any, BinaryIO
+from pathlib import PurePosixPath
+from typing import Any, BinaryIO, Iterator, Protocol
 from uuid import UUID
 
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
 from app.project_types import StatementSource
+from app.spool_cache import SpoolCache, SpoolEntry
+
+logger = logging.getLogger(__name__)
+
+TUS_VERSION = "1.0.0"
+# Supabase storage only accepts resumable uploads in chunks of exactly 6 MB
+# (except the last one)
+TUS_CHUNK_SIZE = 6 * 1024 * 1024
+TUS_CHUNK_ATTEMPTS = 3
+
+
+class FileTooLargeError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class StoredFile:
+    path: str
+    size: int
+
+
+# A statement file being uploaded: an UploadFile, or a file in a ZIP archive
+class StatementUpload(Protocol):
+    @property
+    def filename(self) -> str | None: ...
+    @property
+    def size(self) -> int | None: ...
+    @property
+    def content_type(self) -> str | None: ...
+    async def read(self, size: int = -1) -> bytes: ...
+    async def seek(self, offset: int) -> None: ...
+
+
+# A file in a ZIP archive, decompressed while it is read
+class ZipMemberUpload:
+    def __init__(self, archive: zipfile.ZipFile, info: zipfile.ZipInfo):
+        self._archive = archive
+        self._info = info
+        self._member: BinaryIO | None = None
+        # Directories of the archive are kept in the name, so names are unique
+        self.filename = "_".join(PurePosixPath(info.filename).parts)
+        self.size = info.file_size
+        self.content_type = mimetypes.guess_type(info.filename)[0]
+
+    async def read(self, size: int = -1) -> bytes:
+        return await run_in_threadpool(self._read, size)
+
+    # Only rewinding is supported: the member is decompressed again
+    async def seek(self, offset: int) -> None:
+        if offset != 0:
+            raise ValueError("Archived files can only be read again from the start")
+        self.close()
+
+    def close(self) -> None:
+        if self._member:
+            self._member.close()
+            self._member = None
+
+    def _read(self, size: int) -> bytes:
+        if self._member is None:
+            self._member = self._archive.open(self._info)
+        return self._member.read(size)
+
+
+# Statement files of a ZIP archive, skipping directories and hidden files
+# (e.g. __MACOSX/ metadata added by macOS)
+def iter_zip_members(archive: zipfile.ZipFile) -> Iterator[ZipMemberUpload]:
+    for info in archive.infolist():
+        parts = PurePosixPath(info.filename).parts
+        if info.is_dir() or any(part.startswith((".", "__MACOSX")) for part in parts):
+            continue
+        yield ZipMemberUpload(archive, info)
 
 
 # Integrate with supabase file storage
 class FileStorage:
-    def __init__(self, storage_client: Any):
+    def __init__(
+        self,
+        storage_client: Any,
+        upload_client: httpx.AsyncClient | None = None,
+        spool_cache: SpoolCache | None = None,
+    ):
         self._storage_client = storage_client
+        # Client for the resumable (TUS) upload endpoint of supabase storage,
+        # with the storage base url and service role key headers set
+        self._upload_client = upload_client
+        # Uploaded files are kept here for jobs that run on this node
+        self._spool_cache = spool_cache
 
-    # Make this more generic. The caller will provide the specific bucket and file_path
-    def upload_statement(
+    # Streams the upload to storage chunk by chunk, so that only two chunks (the
+    # one sent and the next) are held in memory.
+    async def stream_statement(
         self,
         statement_source: StatementSource,
         filename: str,
-        file: BinaryIO,
+        file: StatementUpload,
         bucket: str,
         user_id: UUID,
-    ) -> str:
-        timestamp = dt.datetime.now().isoformat()
-        file_path = f"{user_id}/{statement_source.value}/{timestamp}_{filename}"
+        max_size: int,
+    ) -> StoredFile:
+        if self._upload_client is None:
+            raise RuntimeError("File storage has no upload client")
 
-        file_data: bytes = file.read()
-        if not file_data:
+        # 1. Reject early, before anything is sent to storage
+        if file.size is not None and file.size > max_size:
+            raise FileTooLargeError(f"File is larger than {max_size} bytes")
+        if file.size == 0:
             raise ValueError("No content in the file provided")
 
-        response = self._storage_client.storage.from_(bucket).upload(
-            file=file_data,
-            path=file_path,
-            file_options={"cache-control": "3600", "upsert": "true"},
+        # 2. Create the upload. The size is known: the form data is spooled by
+        # the time the endpoint runs.
+        file_path = _statement_path(statement_source, filename, user_id)
+        upload_url = await self._create_upload(
+            bucket, file_path, file.content_type, file.size
         )
-        return response.path
+
+        # 3. Send the chunks, keeping a local copy in the spool cache. The next
+        # chunk is read ahead: with a deferred length, the last one declares it.
+        spool_entry = self._open_spool_entry(_cache_key(bucket, file_path))
+        offset = 0
+        try:
+            chunk = await file.read(TUS_CHUNK_SIZE)
+            while chunk:
+                if offset + len(chunk) > max_size:
+                    raise FileTooLargeError(f"File is larger than {max_size} bytes")
+                next_chunk = await file.read(TUS_CHUNK_SIZE)
+                upload_length = None
+                if file.size is None and not next_chunk:
+                    upload_length = offset + len(chunk)
+                offset = await self._upload_chunk(
+                    upload_url, chunk, offset, upload_length
+                )
+                spool_entry = await run_in_threadpool(_spool, spool_entry, chunk)
+                chunk = next_chunk
+            if offset == 0:
+                raise ValueError("No content in the file provided")
+        except BaseException:
+            if spool_entry:
+                spool_entry.discard()
+            await self._terminate_upload(upload_url)
+            raise
+        if spool_entry:
+            await run_in_threadpool(spool_entry.commit)
+
+        logger.log(logging.INFO, f"Uploaded {offset} bytes to {bucket}/{file_path}")
+        return StoredFile(path=file_path, size=offset)
 
     # Load a file from a bucket in supabase (download)
     def load_file(
@@ -40,5 +167,157 @@ class FileStorage:
         filepath: str,
         bucket: str,
     ) -> BytesIO:
+        if self._spool_cache:
+            cached = self._spool_cache.get(_cache_key(bucket, filepath))
+            if cached:
+                logger.log(logging.INFO, f"Loaded {bucket}/{filepath} from spool cache")
+                return cached
+
         response = self._storage_client.storage.from_(bucket).download(filepath)
         return BytesIO(response)
+
+    # Removes stored statements that no job will read, e.g. the other files of
+    # a batch that failed. Best effort: failures are only logged.
+    def delete_files(self, filepaths: list[str], bucket: str) -> None:
+        if not filepaths:
+            return
+        if self._spool_cache:
+            for filepath in filepaths:
+                self._spool_cache.remove(_cache_key(bucket, filepath))
+        try:
+            self._storage_client.storage.from_(bucket).remove(filepaths)
+        except Exception as e:
+            logger.log(logging.WARNING, f"Could not delete {filepaths}: {e}")
+
+    def _open_spool_entry(self, key: str) -> SpoolEntry | None:
+        if not self._spool_cache:
+            return None
+        try:
+            return self._spool_cache.open_entry(key)
+        except OSError as e:
+            logger.log(logging.WARNING, f"Could not spool upload: {e}")
+            return None
+
+    async def _create_upload(
+        self, bucket: str, file_path: str, content_type: str | None, size: int | None
+    ) -> str:
+        assert self._upload_client is not None
+        metadata = {
+            "bucketName": bucket,
+            "objectName": file_path,
+            "contentType": content_type or "application/octet-stream",
+            "cacheControl": "3600",
+        }
+        headers = {
+            "Tus-Resumable": TUS_VERSION,
+            "Upload-Metadata": ",".join(
+                f"{key} {base64.b64encode(value.encode()).decode()}"
+                for key, value in metadata.items()
+            ),
+            "x-upsert": "true",
+        }
+        if size is None:
+            headers["Upload-Defer-Length"] = "1"
+        else:
+            headers["Upload-Length"] = str(size)
+
+        response = await self._upload_client.post(
+            "/upload/resumable", headers=headers
+        )
+        response.raise_for_status()
+        return response.headers["Location"]
+
+    # Returns the offset after the chunk. A chunk that failed is resumed from
+    # the offset the storage server reports. `upload_length` completes an
+    # upload created with a deferred length.
+    async def _upload_chunk(
+        self, upload_url: str, chunk: bytes, offset: int, upload_length: int | None
+    ) -> int:
+        assert self._upload_client is not None
+        chunk_end = offset + len(chunk)
+        sent_from = offset
+        headers = {
+            "Tus-Resumable": TUS_VERSION,
+            "Content-Type": "application/offset+octet-stream",
+        }
+        if upload_length is not None:
+            headers["Upload-Length"] = str(upload_length)
+        for attempt in range(1, TUS_CHUNK_ATTEMPTS + 1):
+            try:
+                response = await self._upload_client.patch(
+                    upload_url,
+                    content=chunk[sent_from - offset :],
+                    headers={**headers, "Upload-Offset": str(sent_from)},
+                )
+                response.raise_for_status()
+                return int(response.headers["Upload-Offset"])
+            except httpx.HTTPError as e:
+                if attempt == TUS_CHUNK_ATTEMPTS:
+                    raise
+                logger.log(
+                    logging.WARNING, f"Chunk upload failed, resuming: {e}"
+                )
+                sent_from = await self._get_offset(upload_url)
+                if not offset <= sent_from <= chunk_end:
+                    raise
+                if sent_from == chunk_end:
+                    return chunk_end
+        raise AssertionError("unreachable")
+
+    async def _get_offset(self, upload_url: str) -> int:
+        assert self._upload_client is not None
+        response = await self._upload_client.head(
+            upload_url, headers={"Tus-Resumable": TUS_VERSION}
+        )
+        response.raise_for_status()
+        return int(response.headers["Upload-Offset"])
+
+    async def _terminate_upload(self, upload_url: str) -> None:
+        assert self._upload_client is not None
+        try:
+            await self._upload_client.delete(
+                upload_url, headers={"Tus-Resumable": TUS_VERSION}
+            )
+        except httpx.HTTPError as e:
+            logger.log(logging.WARNING, f"Could not terminate upload: {e}")
+
+
+# sha256 of the upload, rewound after so it can be streamed to storage.
+# Stops at `max_size`: an oversized file, or ZIP member, isn't read to the end.
+async def hash_upload(file: StatementUpload, max_size: int) -> str:
+    if file.size is not None and file.size > max_size:
+        raise FileTooLargeError(f"File is larger than {max_size} bytes")
+    content_hash = hashlib.sha256()
+    size = 0
+    while chunk := await file.read(TUS_CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            raise FileTooLargeError(f"File is larger than {max_size} bytes")
+        content_hash.update(chunk)
+    await file.seek(0)
+    return content_hash.hexdigest()
+
+
+def _cache_key(bucket: str, file_path: str) -> str:
+    return f"{bucket}/{file_path}"
+
+
+# The cache is best effort: the upload goes on without it if the disk is full
+def _spool(spool_entry: SpoolEntry | None, chunk: bytes) -> SpoolEntry | None:
+    if not spool_entry:
+        return None
+    try:
+        spool_entry.write(chunk)
+    except OSError as e:
+        logger.log(logging.WARNING, f"Could not spool upload: {e}")
+        spool_entry.discard()
+        return None
+    return spool_entry
+
+
+def _statement_path(
+    statement_source: StatementSource, filename: str, user_id: UUID
+) -> str:
+    timestamp = dt.datetime.now().isoformat()
+    return f"{user_id}/{statement_source.value}/{timestamp}_{filename}"
+
@@ -1,11 +1,18 @@
 # Responsibility: implement filters (WHAT) and filtering logic (HOW)
 # for a set of imported transactions.
-import copy
+import logging
 import re
-from typing import Callable
+from collections import Counter
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, NamedTuple
 
 from app.project_types import ImportedTransaction, TransactionType
 
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
 OWN_ACCOUNT_PATTERNS = {
     r"^JUSTAS ZIEMINYKAS$",
     r"^TO GBP$",
@@ -18,34 +25,106 @@ OWN_ACCOUNT_PATTERNS = {
     r"^Revolut\*\*6494\* E14 4HD London$", # Top up using Google Play with Swedbank card
 }
 
-FilterFN = Callable[[ImportedTransaction], bool]
+# All patterns compiled once into a single alternation
+OWN_ACCOUNT_REGEX = re.compile(
+    "|".join(f"(?:{pattern})" for pattern in sorted(OWN_ACCOUNT_PATTERNS)),
+    re.IGNORECASE,
+)
+
+
+# Rejects transactions of the given types, optionally only those
+# whose counterparty matches a pattern. The type check is done first
+# so the regex only runs for the few transactions it applies to.
+@dataclass(frozen=True)
+class TransactionFilter:
+    name: str
+    rejected_types: frozenset[TransactionType]
+    counterparty_pattern: re.Pattern[str] | None = None
+
+    def rejects(self, transaction: ImportedTransaction) -> bool:
+        if transaction.type not in self.rejected_types:
+            return False
+        return (
+            self.counterparty_pattern is None
+            or self.counterparty_pattern.search(transaction.counterparty) is not None
+        )
+
+    # Vectorized version over a batch with "type" and "counterparty" columns
+    def reject_mask(self, batch: "pd.DataFrame") -> "pd.Series":
+        mask = batch["type"].isin(self.rejected_types)
+        if self.counterparty_pattern is not None and mask.any():
+            candidates = batch.loc[mask, "counterparty"]
+            mask = mask.copy()
+            mask.loc[mask] = candidates.str.contains(
+                self.counterparty_pattern, regex=True
+            ).to_numpy()
+        return mask
+
+
+OWN_ACCOUNT_TRANSFER_FILTER = TransactionFilter(
+    name="own_account_transfer",
+    rejected_types=frozenset({TransactionType.TRANSFER}),
+    counterparty_pattern=OWN_ACCOUNT_REGEX,
+)
+
+ACTIVE_FILTERS: tuple[TransactionFilter, ...] = (
+    TransactionFilter(
+        name="cash_withdrawal",
+        rejected_types=frozenset({TransactionType.CASH_WITHDRAWAL}),
+    ),
+    OWN_ACCOUNT_TRANSFER_FILTER,
+)
 
 
 def is_own_account_transfer(transaction: ImportedTransaction) -> bool:
-    return transaction.type == TransactionType.TRANSFER and any(
-        re.search(pattern, transaction.counterparty, re.IGNORECASE) is not None
-        for pattern in OWN_ACCOUNT_PATTERNS
-    )
+    return OWN_ACCOUNT_TRANSFER_FILTER.rejects(transaction)
+
 
+class FilterResult(NamedTuple):
+    transactions: list[ImportedTransaction]
+    # Filter name -> number of transactions it rejected
+    rejected_counts: Counter[str]
 
-ACTIVE_FILTERS: list[FilterFN] = [
-    lambda txn: txn.type != TransactionType.CASH_WITHDRAWAL,
-    lambda txn: not is_own_account_transfer(txn),
-]
 
+def get_all_filters() -> tuple[TransactionFilter, ...]:
+    # Filters are immutable, so they can be shared between calls
+    return ACTIVE_FILTERS
 
-def get_all_filters() -> list[FilterFN]:
-    return list(copy.deepcopy(ACTIVE_FILTERS))
+
+def apply_filters(transactions: list[ImportedTransaction]) -> FilterResult:
+    filters = get_all_filters()
+    filtered = []
+    rejected_counts: Counter[str] = Counter()
+    for txn in transactions:
+        rejected_by = next((f.name for f in filters if f.rejects(txn)), None)
+        if rejected_by is None:
+            filtered.append(txn)
+        else:
+            rejected_counts[rejected_by] += 1
+
+    return FilterResult(filtered, rejected_counts)
 
 
 def filter_transactions(
     transactions: list[ImportedTransaction],
 ) -> list[ImportedTransaction]:
-    filters = get_all_filters()
-    filtered = [
-        txn
-        for txn in transactions
-        if all(filter_function(txn) for filter_function in filters)
-    ]
-
+    filtered, rejected_counts = apply_filters(transactions)
+    log_rejected_counts(rejected_counts)
     return filtered
+
+
+# Vectorized filtering of a whole batch
+def filter_batch(batch: "pd.DataFrame") -> tuple["pd.DataFrame", Counter[str]]:
+    rejected_counts: Counter[str] = Counter()
+    for transaction_filter in get_all_filters():
+        mask = transaction_filter.reject_mask(batch)
+        rejected_counts[transaction_filter.name] = int(mask.sum())
+        batch = batch.loc[~mask]
+
+    log_rejected_counts(rejected_counts)
+    return batch, rejected_counts
+
+
+def log_rejected_counts(rejected_counts: Counter[str]) -> None:
+    for name, count in rejected_counts.items():
+        logger.log(logging.INFO, f"Rejected by {name} filter: {count}")
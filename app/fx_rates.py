@@ -0,0 +1,282 @@
+# Responsibility: keep the ECB exchange rates loaded once per process,
+# refreshed in the background and persisted to a local snapshot file.
+import datetime as dt
+import logging
+import os
+import threading
+from collections import defaultdict
+from decimal import Decimal
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Iterable, Sequence
+from urllib.request import urlopen
+from zipfile import ZipFile
+
+import numpy as np
+from currency_converter import CURRENCY_FILE, ECB_URL
+
+from app.config import AppConfig
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_TIMEOUT_SECONDS = 30
+# If there is no rate on the day of the transaction (weekends, bank holidays)
+# the closest previous rate is used, up to this many days back
+MAX_RATE_AGE_DAYS = 10
+MISSING_RATE_VALUES = {"", "N/A"}
+
+
+# EUR reference rates from the ECB history, with dates sorted per currency.
+# Dates are stored as proleptic ordinals (date.toordinal) for cheap lookups.
+class RateTable:
+    def __init__(self, rates: dict[str, tuple[np.ndarray, np.ndarray]]):
+        self._rates = rates
+
+    @classmethod
+    def from_file(cls, path: str | Path) -> "RateTable":
+        with open(path, "rb") as file:
+            content = file.read()
+        return cls.from_lines(_read_lines(content))
+
+    # Lines of the ECB history csv: "Date,USD,JPY,...", "2014-03-28,1.3759,140.9,..."
+    @classmethod
+    def from_lines(cls, lines: Iterable[str]) -> "RateTable":
+        lines = iter(lines)
+        header = [currency.strip() for currency in next(lines).strip().split(",")[1:]]
+        dates: dict[str, list[int]] = defaultdict(list)
+        values: dict[str, list[float]] = defaultdict(list)
+        for line in lines:
+            if not line.strip():
+                continue
+            date, *rates = line.strip().split(",")
+            day = dt.date.fromisoformat(date).toordinal()
+            for currency, rate in zip(header, rates):
+                if currency and rate not in MISSING_RATE_VALUES:
+                    dates[currency].append(day)
+                    values[currency].append(float(rate))
+
+        if not dates:
+            raise ValueError("No exchange rates found")
+
+        table = {}
+        for currency in dates:
+            currency_dates = np.array(dates[currency], dtype=np.int64)
+            order = np.argsort(currency_dates)
+            table[currency] = (
+                currency_dates[order],
+                np.array(values[currency], dtype=np.float64)[order],
+            )
+        return cls(table)
+
+    @property
+    def last_date(self) -> dt.date:
+        return dt.date.fromordinal(
+            int(max(dates[-1] for dates, _ in self._rates.values()))
+        )
+
+    # Converts a batch of amounts to EUR. Transactions are grouped by currency
+    # and the closest previous rate is found with a single binary search per group.
+    # Returns None where there is no rate within MAX_RATE_AGE_DAYS.
+    def to_eur(
+        self,
+        dates: Sequence[dt.date],
+        currencies: Sequence[str],
+        amounts: Sequence[Decimal],
+    ) -> list[Decimal | None]:
+        result: list[Decimal | None] = [None] * len(amounts)
+        groups: dict[str, list[int]] = defaultdict(list)
+        for i, currency in enumerate(currencies):
+            if currency.upper() == "EUR":
+                result[i] = amounts[i]
+            elif currency in self._rates:
+                groups[currency].append(i)
+
+        for currency, indexes in groups.items():
+            rate_dates, rates = self._rates[currency]
+            txn_dates = np.array([dates[i].toordinal() for i in indexes])
+            positions = np.searchsorted(rate_dates, txn_dates, side="right") - 1
+            found = positions >= 0
+            positions = positions.clip(min=0)
+            found &= txn_dates - rate_dates[positions] <= MAX_RATE_AGE_DAYS
+
+            eur_amounts = (
+                np.array([float(amounts[i]) for i in indexes]) / rates[positions]
+            )
+            for i, is_found, eur_amount in zip(
+                indexes, found.tolist(), eur_amounts.tolist()
+            ):
+                if is_found:
+                    result[i] = Decimal(eur_amount).quantize(Decimal("0.01"))
+
+        return result
+
+
+def _read_lines(content: bytes) -> list[str]:
+    if content[:2] == b"PK":
+        with ZipFile(BytesIO(content)) as zip_file:
+            return [
+                line
+                for name in zip_file.namelist()
+                for line in zip_file.read(name).decode("utf-8").splitlines()
+            ]
+    return content.decode("utf-8").splitlines()
+
+
+def _download(url: str) -> bytes:
+    with urlopen(url, timeout=DOWNLOAD_TIMEOUT_SECONDS) as response:
+        return response.read()
+
+
+class RateStore:
+    def __init__(
+        self,
+        snapshot_path: Path,
+        refresh_interval: dt.timedelta,
+        source_url: str = ECB_URL,
+        download: Callable[[str], bytes] = _download,
+    ):
+        self._snapshot_path = snapshot_path
+        self._refresh_interval = refresh_interval
+        self._source_url = source_url
+        self._download = download
+        self._rate_table: RateTable | None = None
+        self._fetched_at: dt.datetime | None = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._refresh_thread: threading.Thread | None = None
+
+    # Never blocks on the network: rates are downloaded by the refresh thread
+    @property
+    def rate_table(self) -> RateTable:
+        if self._rate_table is None:
+            self.load()
+        if self._rate_table is None:
+            raise RatesUnavailableError("Exchange rates are not loaded")
+        return self._rate_table
+
+    # Time when the rates were downloaded from the ECB
+    @property
+    def fetched_at(self) -> dt.datetime | None:
+        return self._fetched_at
+
+    # Latest date for which the ECB published rates
+    @property
+    def last_rate_date(self) -> dt.date | None:
+        if self._rate_table is None:
+            return None
+        return self._rate_table.last_date
+
+    @property
+    def age(self) -> dt.timedelta | None:
+        if self._fetched_at is None:
+            return None
+        return dt.datetime.now() - self._fetched_at
+
+    # Rates available without the network: the local snapshot, or the rates
+    # bundled with currency_converter until a download succeeds
+    def load(self) -> None:
+        with self._lock:
+            if self._rate_table is not None:
+                return
+            if self._snapshot_path.exists():
+                self._load_snapshot()
+            else:
+                logger.log(logging.WARNING, "Using exchange rates bundled with package")
+                self._rate_table = RateTable.from_file(CURRENCY_FILE)
+
+    # For processes that don't download rates themselves (pipeline processes):
+    # loads the snapshot whenever the process owning the store replaced it.
+    def follow_snapshot(self) -> None:
+        with self._lock:
+            if self._snapshot_path.exists():
+                modified_at = dt.datetime.fromtimestamp(
+                    self._snapshot_path.stat().st_mtime
+                )
+                if self._fetched_at is None or modified_at > self._fetched_at:
+                    self._load_snapshot()
+            elif self._rate_table is None:
+                self._rate_table = RateTable.from_file(CURRENCY_FILE)
+
+    def refresh(self) -> None:
+        try:
+            rate_table = self._download_snapshot()
+        except Exception as e:
+            # Keep serving the rates that are already loaded
+            logger.log(logging.WARNING, f"Could not refresh ECB rates: {e}")
+            return
+
+        with self._lock:
+            self._set_rates(rate_table)
+        logger.log(logging.INFO, f"ECB rates refreshed up to {self.last_rate_date}")
+
+    # Loads the rates at startup, then downloads them in the background if the
+    # snapshot is missing or stale. The loaded rates are used meanwhile.
+    def start(self) -> None:
+        if self._refresh_thread is not None:
+            return
+        self.load()
+        self._stop_event.clear()
+        self._refresh_thread = threading.Thread(
+            target=self._refresh_loop, name="ecb-rates-refresh", daemon=True
+        )
+        self._refresh_thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._refresh_thread is not None:
+            self._refresh_thread.join()
+            self._refresh_thread = None
+
+    def _refresh_loop(self) -> None:
+        wait = self._time_until_refresh()
+        while not self._stop_event.wait(wait.total_seconds()):
+            self.refresh()
+            wait = self._refresh_interval
+
+    def _time_until_refresh(self) -> dt.timedelta:
+        # Nothing downloaded yet
+        if self.age is None:
+            return dt.timedelta(0)
+        return max(self._refresh_interval - self.age, dt.timedelta(0))
+
+    def _load_snapshot(self) -> None:
+        self._set_rates(RateTable.from_file(self._snapshot_path))
+
+    def _set_rates(self, rate_table: RateTable) -> None:
+        self._rate_table = rate_table
+        self._fetched_at = dt.datetime.fromtimestamp(
+            self._snapshot_path.stat().st_mtime
+        )
+
+    def _download_snapshot(self) -> RateTable:
+        content = self._download(self._source_url)
+
+        # Validate the download before it replaces the current snapshot
+        rate_table = RateTable.from_lines(_read_lines(content))
+        self._snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._snapshot_path.with_name(f"tmp_{self._snapshot_path.name}")
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, self._snapshot_path)
+        return rate_table
+
+
+_rate_store: RateStore | None = None
+_rate_store_lock = threading.Lock()
+
+
+# Process-wide rate store shared by all jobs
+def get_rate_store(app_config: AppConfig) -> RateStore:
+    global _rate_store
+    with _rate_store_lock:
+        if _rate_store is None:
+            _rate_store = RateStore(
+                snapshot_path=Path(app_config.fx_snapshot_path),
+                refresh_interval=dt.timedelta(
+                    seconds=app_config.fx_refresh_interval_seconds
+                ),
+            )
+        return _rate_store
+
+
+class RatesUnavailableError(RuntimeError):
+    pass
@@ -0,0 +1,195 @@
+# Responsibility: HTTP clients shared by everything that talks to Supabase
+# (auth, storage). Connections are kept alive in a pool, so requests don't pay
+# for TCP and TLS setup every time. Failed requests are retried with backoff
+# when it's safe to send them again.
+import asyncio
+import logging
+import random
+import time
+from typing import TYPE_CHECKING
+
+import httpx
+
+from app.config import AppConfig
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+MAX_BACKOFF_SECONDS = 10.0
+
+
+# Returns the delay before the next attempt, or None if the request must not be sent again
+def _retry_delay(
+    request: httpx.Request,
+    response: httpx.Response | None,
+    error: httpx.TransportError | None,
+    attempt: int,
+    max_retries: int,
+    backoff: float,
+) -> float | None:
+    if attempt >= max_retries:
+        return None
+    # Nothing was sent if the connection failed
+    not_sent = isinstance(
+        error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+    )
+    if not not_sent:
+        if request.method not in IDEMPOTENT_METHODS:
+            return None
+        if response is not None and response.status_code not in RETRY_STATUS_CODES:
+            return None
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, backoff * 2**attempt))
+
+
+class RetryTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.BaseTransport, max_retries: int, backoff: float):
+        self._transport = transport
+        self._max_retries = max_retries
+        self._backoff = backoff
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            response, error = None, None
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError as e:
+                error = e
+            delay = _retry_delay(
+                request, response, error, attempt, self._max_retries, self._backoff
+            )
+            if delay is None:
+                if error:
+                    raise error
+                assert response is not None
+                return response
+
+            reason = error if response is None else response.status_code
+            if response is not None:
+                response.close()
+            logger.log(
+                logging.WARNING,
+                f"Retrying {request.method} {request.url.path} in {delay:.2f}s ({reason})",
+            )
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    def __init__(
+        self, transport: httpx.AsyncBaseTransport, max_retries: int, backoff: float
+    ):
+        self._transport = transport
+        self._max_retries = max_retries
+        self._backoff = backoff
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            response, error = None, None
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                error = e
+            delay = _retry_delay(
+                request, response, error, attempt, self._max_retries, self._backoff
+            )
+            if delay is None:
+                if error:
+                    raise error
+                assert response is not None
+                return response
+
+            reason = error if response is None else response.status_code
+            if response is not None:
+                await response.aclose()
+            logger.log(
+                logging.WARNING,
+                f"Retrying {request.method} {request.url.path} in {delay:.2f}s ({reason})",
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _limits(app_config: AppConfig) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=app_config.http_pool_max_connections,
+        max_keepalive_connections=app_config.http_pool_max_keepalive,
+        keepalive_expiry=app_config.http_keepalive_expiry_seconds,
+    )
+
+
+def _timeout(app_config: AppConfig) -> httpx.Timeout:
+    return httpx.Timeout(
+        app_config.http_timeout_seconds, connect=app_config.http_connect_timeout_seconds
+    )
+
+
+def create_http_client(app_config: AppConfig) -> httpx.Client:
+    transport = RetryTransport(
+        httpx.HTTPTransport(limits=_limits(app_config)),
+        max_retries=app_config.http_max_retries,
+        backoff=app_config.http_retry_backoff_seconds,
+    )
+    return httpx.Client(transport=transport, timeout=_timeout(app_config))
+
+
+def create_async_http_client(
+    app_config: AppConfig, base_url: str = "", headers: dict[str, str] | None = None
+) -> httpx.AsyncClient:
+    transport = AsyncRetryTransport(
+        httpx.AsyncHTTPTransport(limits=_limits(app_config)),
+        max_retries=app_config.http_max_retries,
+        backoff=app_config.http_retry_backoff_seconds,
+    )
+    return httpx.AsyncClient(
+        transport=transport,
+        base_url=base_url,
+        headers=headers,
+        timeout=_timeout(app_config),
+    )
+
+
+# Supabase client sending its requests (auth, storage, ...) through the shared
+# pool. Cheap to create: a client per sign-in doesn't open new connections.
+def create_supabase_client(
+    app_config: AppConfig, supabase_key: str, http_client: httpx.Client
+) -> "Client":
+    # Imported here: slow to import (~1s)
+    from supabase import create_client
+    from supabase.lib.client_options import SyncClientOptions
+
+    return create_client(
+        app_config.supabase_url,
+        supabase_key,
+        options=SyncClientOptions(
+            httpx_client=http_client,
+            # Sessions are not kept: the clients only make requests on behalf of
+            # the service or hand tokens to API consumers
+            auto_refresh_token=False,
+            persist_session=False,
+        ),
+    )
+
+
+# Client for the storage API of the project, authenticated with the service role key
+def create_storage_upload_client(app_config: AppConfig) -> httpx.AsyncClient:
+    return create_async_http_client(
+        app_config,
+        base_url=f"{app_config.supabase_url}/storage/v1",
+        headers={
+            "apikey": app_config.supabase_admin_key,
+            "Authorization": f"Bearer {app_config.supabase_admin_key}",
+        },
+    )
@@ -0,0 +1,13 @@
+import logging
+
+
+# Shared by the API, the worker and the pipeline processes
+def configure_logging() -> None:
+    logging.basicConfig(
+        format="[{levelname}] - {asctime} - {name}: {message}",
+        style="{",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        level=logging.INFO,
+    )
+
+    logging.getLogger("googleapiclient").setLevel(logging.ERROR)
@@ -1,35 +1,101 @@
+import asyncio
+import datetime as dt
+import json
 import logging
-from contextlib import asynccontextmanager
+import threading
+import time
+import zipfile
+from contextlib import asynccontextmanager, ExitStack
+from decimal import Decimal
 from typing import Annotated
 from uuid import UUID
 
 
+import httpx
 from fastapi import (
     BackgroundTasks,
     Depends,
     FastAPI,
     Form,
     HTTPException,
+    Query,
+    Request,
+    Response,
     UploadFile,
 )
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from fastapi.responses import JSONResponse
-from sqlmodel import create_engine, SQLModel
-from supabase import create_client
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import Engine
+from sqlmodel import create_engine
 from supabase_auth.errors import AuthApiError
 
-from app.config import AppConfig, AppEnvironment
+from app.config import AppConfig, AppEnvironment, JobRunner, PipelineEngine
+from app.auth import create_token_verifier
 from app.dependencies import (
     AuthDependency,
     ConfigDependency,
     DBDependency,
     FSDependency,
     get_authenticated_user,
+    HttpClientDependency,
+    get_authenticated_user_strict,
+    StrictAuthDependency,
 )
-from app.db.jobs import IngestJob, create_new_job, load_job
-from app.project_types import StatementSource
-from app.file_storage import FileStorage
-from app.orchestration import run_job
+from app.db.jobs import (
+    create_batch,
+    IngestBatch,
+    IngestJob,
+    count_queued_jobs,
+    create_new_job,
+    find_completed_job,
+    JobStageMetric,
+    list_jobs,
+    load_batch,
+    load_batch_jobs,
+    load_job,
+    load_stage_metrics,
+)
+from app.db.schema import check_schema
+from app.db.summaries import load_monthly_spending, MonthlySpending
+from app.db.transactions import list_transactions, Transaction, TransactionQuery
+from app.pagination import (
+    conditional_json_response,
+    decode_cursor,
+    encode_cursor,
+    InvalidCursorError,
+)
+from app.progress import get_progress_broker, ProgressEvent, Subscription, TERMINAL_STAGES
+from app.project_types import (
+    ExportFormat,
+    JobStage,
+    JobStatus,
+    Side,
+    StatementSource,
+    TransactionSource,
+)
+from app.executor import shutdown_pool
+from app.export import export_transactions, is_format_available, MEDIA_TYPES
+from app.file_storage import (
+    FileStorage,
+    FileTooLargeError,
+    hash_upload,
+    iter_zip_members,
+    StatementUpload,
+)
+from app.fx_rates import get_rate_store
+from app.http_clients import (
+    create_http_client,
+    create_storage_upload_client,
+    create_supabase_client,
+)
+from app.logging_config import configure_logging
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, get_metrics
+from app.orchestration import run_batch, run_job
+from app.parsers.registry import detect_statement_source
+from app.readiness import ComponentStatus, Readiness
+from app.spool_cache import create_spool_cache
+from app.worker import Worker
 
 
 user_creds_auth = HTTPBasic()
@@ -38,11 +104,13 @@ user_creds_auth = HTTPBasic()
 # Validate username (email) and password, sign user in and return a JWT token if successful
 def validate_user_creds(
     app_config: ConfigDependency,
+    http_client: HttpClientDependency,
     creds: Annotated[HTTPBasicCredentials, Depends(user_creds_auth)],
 ) -> str:
-    # Create a supabase client separate from global admin client that uses storage
-    supabase_client = create_client(
-        app_config.supabase_url, app_config.supabase_anon_key
+    # Create a supabase client separate from global admin client that uses storage.
+    # It shares the connection pool of the admin client.
+    supabase_client = create_supabase_client(
+        app_config, app_config.supabase_anon_key, http_client=http_client
     )
     try:
         response = supabase_client.auth.sign_in_with_password(
@@ -69,44 +137,126 @@ async def lifespan(app: FastAPI):  # type: ignore
     app_config = AppConfig()  # type: ignore
     app.state.app_config = app_config
 
-    # 2. Initialize database client
+    # 2. Initialize database client. Connections are opened on first use.
     connection_string = app_config.db_connection_string
     if not connection_string:
         logger.error("Missing database connection string in environment")
         raise Exception("Missing database connection string in environment")
     engine = create_engine(connection_string)
-    SQLModel.metadata.create_all(engine)
     app.state.db_engine = engine
 
-    # 3. Initialize service role supabase client
-    supabase_url = app_config.supabase_url
-    supabase_admin_key = app_config.supabase_admin_key
-    supabase_admin = create_client(supabase_url, supabase_admin_key)
-    app.state.supabase_admin = supabase_admin
-    logger.info("Supabase Admin Client Initialized")
+    # 3. Initialize the pools of kept-alive connections to supabase
+    http_client = create_http_client(app_config)
+    app.state.http_client = http_client
+    upload_client = create_storage_upload_client(app_config)
 
-    # 4. Initialize file storage client
-    app.state.file_storage = FileStorage(supabase_admin)
-    logger.info("File Storage Initialized")
+    # 4. Load exchange rates in the background and keep them fresh
+    rate_store = get_rate_store(app_config)
+    rate_store.start()
+    app.state.rate_store = rate_store
+    logger.info("Exchange Rate Store Started")
 
-    # 5. Auth feature flag - skip jwt validation in DEV environment
+    # 5. Verify access tokens locally, with cached signing keys
+    app.state.token_verifier = create_token_verifier(app_config)
+    get_metrics().enabled = app_config.metrics_enabled
+
+    # 6. Auth feature flag - skip jwt validation in DEV environment
     if app_config.app_environment == AppEnvironment.DEV:
         app.dependency_overrides[get_authenticated_user] = (
             lambda: app_config.test_user_id
         )
+        app.dependency_overrides[get_authenticated_user_strict] = (
+            lambda: app_config.test_user_id
+        )
+
+    # 7. Check the database schema and start the storage clients. In fast-start mode
+    # this runs in the background: the API accepts requests right away and /ready
+    # reports when it's done.
+    readiness = Readiness(DATABASE_COMPONENT, STORAGE_COMPONENT)
+    app.state.readiness = readiness
+    if app_config.fast_start:
+        threading.Thread(
+            target=_start_components,
+            args=(app, upload_client),
+            name="start-components",
+            daemon=True,
+        ).start()
+    else:
+        _start_components(app, upload_client)
 
     yield
 
+    shutdown_pool()
+    rate_store.stop()
+    await upload_client.aclose()
+    http_client.close()
+
+
+DATABASE_COMPONENT = "database"
+STORAGE_COMPONENT = "storage"
+
+
+def _start_components(app: FastAPI, upload_client: httpx.AsyncClient) -> None:
+    app_config: AppConfig = app.state.app_config
+    readiness: Readiness = app.state.readiness
+
+    # Schema changes are made by spending-tracker-migrate, not at start-up
+    try:
+        check_schema(app.state.db_engine)
+        readiness.mark_ready(DATABASE_COMPONENT)
+    except Exception as e:
+        readiness.mark_failed(DATABASE_COMPONENT, e)
+        logger.exception("Database check failed")
+        if not app_config.fast_start:
+            raise
+
+    # Service role supabase client, file storage with an async client for streamed
+    # uploads and a local copy of uploads for the jobs of this node
+    try:
+        supabase_admin = create_supabase_client(
+            app_config, app_config.supabase_admin_key, http_client=app.state.http_client
+        )
+        app.state.supabase_admin = supabase_admin
+        logger.info("Supabase Admin Client Initialized")
+        app.state.file_storage = FileStorage(
+            supabase_admin,
+            upload_client=upload_client,
+            spool_cache=create_spool_cache(app_config),
+        )
+        logger.info("File Storage Initialized")
+        readiness.mark_ready(STORAGE_COMPONENT)
+    except Exception as e:
+        readiness.mark_failed(STORAGE_COMPONENT, e)
+        logger.exception("Storage start-up failed")
+        if not app_config.fast_start:
+            raise
+
+    # In background mode no worker recovers jobs: the ones whose lease expired
+    # (e.g. the API process running them restarted) are requeued and run here,
+    # with the jobs still queued.
+    if (
+        app_config.job_runner == JobRunner.BACKGROUND
+        and readiness.is_ready(DATABASE_COMPONENT)
+        and readiness.is_ready(STORAGE_COMPONENT)
+    ):
+        worker = Worker(
+            db=app.state.db_engine,
+            file_storage=app.state.file_storage,
+            app_config=app_config,
+        )
+        threading.Thread(
+            target=_recover_jobs,
+            args=(worker, app_config),
+            name="recover-jobs",
+            daemon=True,
+        ).start()
 
-def configure_logging() -> None:
-    logging.basicConfig(
-        format="[{levelname}] - {asctime} - {name}: {message}",
-        style="{",
-        datefmt="%Y-%m-%d %H:%M:%S",
-        level=logging.INFO,
-    )
 
-    logging.getLogger("googleapiclient").setLevel(logging.ERROR)
+def _recover_jobs(worker: Worker, app_config: AppConfig) -> None:
+    worker.drain()
+    # The leases of a process that just stopped expire within a lease duration
+    time.sleep(app_config.job_lease_seconds)
+    worker.drain()
 
 
 configure_logging()
@@ -114,12 +264,74 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(lifespan=lifespan)
 
+# Room for the multipart boundaries and the other form fields
+FORM_OVERHEAD_BYTES = 64 * 1024
+_UPLOAD_PATHS = ("/ingest-jobs", "/ingest-batches")
+
+
+# Reject oversized uploads from the Content-Length header, before the form is received
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):  # type: ignore
+    if request.method == "POST" and request.url.path in _UPLOAD_PATHS:
+        app_config = request.app.state.app_config
+        max_bytes = app_config.upload_max_bytes
+        if request.url.path == "/ingest-batches":
+            max_bytes *= app_config.batch_max_files
+        content_length = request.headers.get("content-length")
+        try:
+            declared_bytes = int(content_length) if content_length else 0
+        except ValueError:
+            return JSONResponse(
+                {"detail": "Invalid Content-Length header"}, status_code=400
+            )
+        if declared_bytes > max_bytes + FORM_OVERHEAD_BYTES:
+            return JSONResponse(
+                {"detail": f"File is larger than {max_bytes} bytes"}, status_code=413
+            )
+    return await call_next(request)
+
+
+# Latency per route template, so path parameters don't add series. Streamed
+# responses are timed until their headers are sent.
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):  # type: ignore
+    metrics = get_metrics()
+    if not metrics.enabled:
+        return await call_next(request)
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.observe_request(
+        request.method,
+        getattr(route, "path", "unmatched"),
+        response.status_code,
+        time.perf_counter() - started,
+    )
+    return response
+
 
 @app.get("/")
 def root() -> "str":
     return "HELLO FROM SPENDING TRACKER"
 
 
+# Readiness probe: 200 once the database, storage and exchange rates are ready
+@app.get("/ready")
+def ready(request: Request) -> JSONResponse:
+    components = request.app.state.readiness.report()
+    rates_loaded = request.app.state.rate_store.last_rate_date is not None
+    components["rates"] = {
+        "status": ComponentStatus.READY if rates_loaded else ComponentStatus.STARTING
+    }
+    is_ready = all(
+        component["status"] == ComponentStatus.READY for component in components.values()
+    )
+    return JSONResponse(
+        {"ready": is_ready, "components": components},
+        status_code=200 if is_ready else 503,
+    )
+
+
 @app.post("/auth")
 def authenticate_user(
     jwt: Annotated[str, Depends(validate_user_creds)],
@@ -128,52 +340,609 @@ def authenticate_user(
 
 
 @app.post("/ingest-jobs", status_code=202)
-def create_job(
-    user_id: AuthDependency,
+async def create_job(
+    # Uploads are not accepted from signed out sessions with unexpired tokens
+    user_id: StrictAuthDependency,
     statement_file: UploadFile,
     statement_source: Annotated[StatementSource, Form()],
     db: DBDependency,
     file_storage: FSDependency,
     app_config: ConfigDependency,
     background_tasks: BackgroundTasks,
+    # Defaults to the engine from the app config
+    pipeline_engine: Annotated[PipelineEngine | None, Form()] = None,
+) -> JSONResponse:
+    job = await _upload_job(
+        user_id=user_id,
+        statement_file=statement_file,
+        statement_source=statement_source,
+        db=db,
+        file_storage=file_storage,
+        app_config=app_config,
+        pipeline_engine=pipeline_engine,
+    )
+    db_entry = await run_in_threadpool(create_new_job, new_job=job, db=db)
+
+    # In queue mode the pending job is picked up by a worker process
+    if (
+        db_entry.status == JobStatus.PENDING
+        and app_config.job_runner == JobRunner.BACKGROUND
+    ):
+        background_tasks.add_task(
+            run_job,
+            job_id=db_entry.id,
+            db=db,
+            file_storage=file_storage,
+            app_config=app_config,
+        )
+
+    return JSONResponse(_job_response(db_entry))
+
+
+# Several statements in one request: as separate files, or in a single ZIP
+# archive. The source is detected from the file extension when not given.
+# The jobs are processed together: transactions repeated across the
+# statements are only ingested once.
+@app.post("/ingest-batches", status_code=202)
+async def create_batch_jobs(
+    user_id: StrictAuthDependency,
+    statement_files: list[UploadFile],
+    db: DBDependency,
+    file_storage: FSDependency,
+    app_config: ConfigDependency,
+    background_tasks: BackgroundTasks,
+    # Source of all the statements of the batch
+    statement_source: Annotated[StatementSource | None, Form()] = None,
+    pipeline_engine: Annotated[PipelineEngine | None, Form()] = None,
 ) -> JSONResponse:
+    # 1. Expand a ZIP archive into its statements
+    uploads: list[StatementUpload] = list(statement_files)
+    with ExitStack() as stack:
+        if len(statement_files) == 1 and _is_zip(statement_files[0]):
+            # Reads the central directory: not on the event loop
+            try:
+                archive = await run_in_threadpool(
+                    zipfile.ZipFile, statement_files[0].file
+                )
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail="Invalid ZIP archive")
+            stack.callback(archive.close)
+            uploads = list(iter_zip_members(archive))
+        if not uploads:
+            raise HTTPException(status_code=400, detail="No statement files")
+        if len(uploads) > app_config.batch_max_files:
+            raise HTTPException(
+                status_code=400,
+                detail=f"More than {app_config.batch_max_files} statement files",
+            )
+
+        # 2. Source of each statement
+        sources = [
+            statement_source or detect_statement_source(upload.filename or "")
+            for upload in uploads
+        ]
+        unknown = [
+            str(upload.filename)
+            for upload, source in zip(uploads, sources)
+            if not source
+        ]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Statement source not recognized: {', '.join(unknown)}",
+            )
+
+        # 3. Statements are streamed to storage a few at a time
+        semaphore = asyncio.Semaphore(app_config.batch_max_parallel_jobs)
+
+        async def upload_job(
+            upload: StatementUpload, source: StatementSource
+        ) -> IngestJob:
+            async with semaphore:
+                return await _upload_job(
+                    user_id=user_id,
+                    statement_file=upload,
+                    statement_source=source,
+                    db=db,
+                    file_storage=file_storage,
+                    app_config=app_config,
+                    pipeline_engine=pipeline_engine,
+                )
+
+        results = await asyncio.gather(
+            *(
+                upload_job(upload, source)  # type: ignore
+                for upload, source in zip(uploads, sources)
+            ),
+            return_exceptions=True,
+        )
+
+    # A failed statement fails the batch: the statements stored for it are
+    # deleted. Completed jobs point to the files of earlier jobs, kept.
+    jobs = [result for result in results if isinstance(result, IngestJob)]
+    error = next(
+        (result for result in results if isinstance(result, BaseException)), None
+    )
+    if error is not None:
+        await run_in_threadpool(
+            file_storage.delete_files,
+            [job.file_path for job in jobs if job.status == JobStatus.PENDING],
+            bucket=app_config.statements_storage_bucket,
+        )
+        raise error
+
+    batch, jobs = await run_in_threadpool(
+        create_batch,
+        batch=IngestBatch(user_id=user_id, file_count=len(jobs)),
+        jobs=jobs,
+        db=db,
+    )
+    logger.log(
+        logging.INFO, f"Created batch of {len(jobs)} statements | Batch ID: {batch.id}"
+    )
+
+    # 4. In queue mode the pending jobs are claimed together by a worker process
+    if app_config.job_runner == JobRunner.BACKGROUND and any(
+        job.status == JobStatus.PENDING for job in jobs
+    ):
+        background_tasks.add_task(
+            run_batch,
+            batch_id=batch.id,
+            db=db,
+            file_storage=file_storage,
+            app_config=app_config,
+        )
+
+    return JSONResponse(
+        {"batch_id": str(batch.id), "jobs": [_batch_job_item(job) for job in jobs]},
+        status_code=202,
+    )
+
+
+def _is_zip(upload: UploadFile) -> bool:
+    return (upload.filename or "").lower().endswith(".zip") or upload.content_type in (
+        "application/zip",
+        "application/x-zip-compressed",
+    )
+
+
+# Job of a stored statement, not saved yet. A statement ingested before gets a
+# completed job with the counts of the first one.
+async def _upload_job(
+    user_id: UUID,
+    statement_file: StatementUpload,
+    statement_source: StatementSource,
+    db: Engine,
+    file_storage: FileStorage,
+    app_config: AppConfig,
+    pipeline_engine: PipelineEngine | None,
+) -> IngestJob:
     # Filename is not mandatory for API consumer to provide. In this case we generate it.
     file_name = statement_file.filename or f"{statement_source.value}_statement"
 
-    file_path = file_storage.upload_statement(
+    # Hashed once, before anything is sent to storage. Oversized files are
+    # rejected without being read to the end.
+    try:
+        content_hash = await hash_upload(
+            statement_file, max_size=app_config.upload_max_bytes
+        )
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=f"{file_name}: {e}")
+    previous_job = await run_in_threadpool(
+        find_completed_job,
+        db=db,
+        user_id=user_id,
         statement_source=statement_source,
-        filename=file_name,
-        file=statement_file.file,
+        content_hash=content_hash,
+    )
+    if previous_job:
+        now = dt.datetime.now()
+        logger.log(
+            logging.INFO,
+            f"Statement {file_name} already ingested by job {previous_job.id}",
+        )
+        return IngestJob(
+            user_id=user_id,
+            statement_source=statement_source,
+            file_path=previous_job.file_path,
+            content_hash=content_hash,
+            status=JobStatus.COMPLETED,
+            started_at=now,
+            finished_at=now,
+            ingested_txn_count=previous_job.ingested_txn_count,
+            duplicate_txn_count=previous_job.duplicate_txn_count,
+        )
+
+    # Streamed to storage in chunks, without holding a worker thread
+    try:
+        stored_file = await file_storage.stream_statement(
+            statement_source=statement_source,
+            filename=file_name,
+            file=statement_file,
+            user_id=user_id,
+            bucket=app_config.statements_storage_bucket,
+            max_size=app_config.upload_max_bytes,
+        )
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=f"{file_name}: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{file_name}: {e}")
+
+    return IngestJob(
         user_id=user_id,
-        bucket=app_config.statements_storage_bucket,
+        statement_source=statement_source,
+        file_path=stored_file.path,
+        content_hash=content_hash,
+        pipeline_engine=pipeline_engine,
     )
 
-    job = IngestJob(
-        user_id=user_id, statement_source=statement_source, file_path=file_path
+
+# The batch is running until all of its jobs completed or failed
+@app.get("/ingest-batches/{batch_id}")
+def get_batch(
+    user_id: AuthDependency, batch_id: UUID, db: DBDependency
+) -> JSONResponse:
+    batch = load_batch(batch_id, db)
+    if not batch or batch.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    jobs = load_batch_jobs(batch_id, db)
+    statuses = [job.status for job in jobs]
+    if all(status == JobStatus.PENDING for status in statuses):
+        status = JobStatus.PENDING
+    elif any(status in (JobStatus.PENDING, JobStatus.RUNNING) for status in statuses):
+        status = JobStatus.RUNNING
+    elif all(status == JobStatus.FAILED for status in statuses):
+        status = JobStatus.FAILED
+    else:
+        status = JobStatus.COMPLETED
+    completed = [job for job in jobs if job.status == JobStatus.COMPLETED]
+    return JSONResponse(
+        {
+            "batch_id": str(batch.id),
+            "status": status,
+            "created_at": batch.created_at.isoformat(),
+            "ingested_txn_count": sum(job.ingested_txn_count or 0 for job in completed),
+            "duplicate_txn_count": sum(
+                job.duplicate_txn_count or 0 for job in completed
+            ),
+            "failed_job_count": statuses.count(JobStatus.FAILED),
+            "jobs": [_batch_job_item(job) for job in jobs],
+        }
     )
-    db_entry = create_new_job(new_job=job, db=db)
 
-    background_tasks.add_task(
-        run_job,
-        job_id=db_entry.id,
+
+def _batch_job_item(job: IngestJob) -> dict:
+    return {
+        **_job_response(job),
+        "statement_source": job.statement_source,
+        "file_path": job.file_path,
+    }
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+# The user's jobs, newest first. `next_cursor` is passed as `cursor` to get the
+# next page; it is null on the last page.
+@app.get("/ingest-jobs")
+def get_jobs(
+    request: Request,
+    user_id: AuthDependency,
+    db: DBDependency,
+    status: JobStatus | None = None,
+    statement_source: StatementSource | None = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+) -> Response:
+    try:
+        after = (
+            decode_cursor(cursor, (dt.datetime.fromisoformat, UUID)) if cursor else None
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # One more job than the page tells whether there is a next page
+    jobs = list_jobs(
+        db,
         user_id=user_id,
-        db=db,
-        file_storage=file_storage,
-        app_config=app_config,
+        limit=limit + 1,
+        status=status,
+        statement_source=statement_source,
+        after=after,
+    )
+    page = jobs[:limit]
+    next_cursor = None
+    if len(jobs) > limit:
+        next_cursor = encode_cursor((page[-1].created_at, page[-1].id))
+
+    return conditional_json_response(
+        request,
+        {"jobs": [_job_list_item(job) for job in page], "next_cursor": next_cursor},
     )
 
-    return JSONResponse({"job_id": str(db_entry.id), "status": db_entry.status})
+
+def _job_list_item(job: IngestJob) -> dict:
+    return {
+        **_job_response(job),
+        "statement_source": job.statement_source,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+# Filters of the transaction endpoints. `date_from` and `date_to` are inclusive.
+def get_transaction_query(
+    user_id: AuthDependency,
+    date_from: dt.date | None = None,
+    date_to: dt.date | None = None,
+    category: str | None = None,
+    source: TransactionSource | None = None,
+    side: Side | None = None,
+) -> TransactionQuery:
+    return TransactionQuery(
+        user_id=user_id,
+        start=dt.datetime.combine(date_from, dt.time()) if date_from else None,
+        end=dt.datetime.combine(date_to + dt.timedelta(days=1), dt.time())
+        if date_to
+        else None,
+        category=category,
+        source=source,
+        side=side,
+    )
+
+
+TransactionQueryDependency = Annotated[
+    TransactionQuery, Depends(get_transaction_query)
+]
+
+
+# The user's transactions, newest first, paginated like the jobs
+@app.get("/transactions")
+def get_transactions(
+    request: Request,
+    transaction_query: TransactionQueryDependency,
+    db: DBDependency,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+) -> Response:
+    try:
+        after = (
+            decode_cursor(cursor, (dt.datetime.fromisoformat, UUID)) if cursor else None
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    transactions = list_transactions(
+        db, transaction_query, limit=limit + 1, after=after
+    )
+    page = transactions[:limit]
+    next_cursor = None
+    if len(transactions) > limit:
+        next_cursor = encode_cursor((page[-1].transaction_datetime, page[-1].id))
+
+    return conditional_json_response(
+        request,
+        {
+            "transactions": [_transaction_item(txn) for txn in page],
+            "next_cursor": next_cursor,
+        },
+    )
+
+
+# All the user's transactions matching the filters, oldest first, streamed as
+# they are read from the database
+@app.get("/transactions/export")
+def export_transactions_file(
+    transaction_query: TransactionQueryDependency,
+    db: DBDependency,
+    app_config: ConfigDependency,
+    format: ExportFormat = ExportFormat.CSV,
+) -> StreamingResponse:
+    if not is_format_available(format):
+        raise HTTPException(
+            status_code=501, detail=f"{format} export is not installed on this server"
+        )
+
+    return StreamingResponse(
+        export_transactions(
+            db,
+            transaction_query,
+            export_format=format,
+            batch_size=app_config.export_batch_size,
+        ),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="transactions.{format}"'
+        },
+    )
+
+
+def _transaction_item(transaction: Transaction) -> dict:
+    item = transaction.model_dump(exclude={"user_id", "dedup_key"})
+    for key, value in item.items():
+        # Amounts as strings, so clients don't lose precision
+        if isinstance(value, (Decimal, UUID)):
+            item[key] = str(value)
+        elif isinstance(value, dt.datetime):
+            item[key] = value.isoformat()
+    return item
+
+
+MONTH_PATTERN = r"^\d{4}-(0[1-9]|1[0-2])$"
+
+
+# Spending per month and category, newest month first, read from the monthly
+# rollups. `from_month` and `to_month` (YYYY-MM) are inclusive.
+@app.get("/summaries")
+def get_summaries(
+    request: Request,
+    user_id: AuthDependency,
+    db: DBDependency,
+    from_month: Annotated[str | None, Query(pattern=MONTH_PATTERN)] = None,
+    to_month: Annotated[str | None, Query(pattern=MONTH_PATTERN)] = None,
+) -> Response:
+    rollups = load_monthly_spending(
+        db,
+        user_id=user_id,
+        first_month=_parse_month(from_month) if from_month else None,
+        last_month=_parse_month(to_month) if to_month else None,
+    )
+
+    months: dict[dt.date, dict] = {}
+    for rollup in rollups:
+        month = months.setdefault(
+            rollup.month,
+            {
+                "month": rollup.month.strftime("%Y-%m"),
+                "spent_eur": Decimal("0"),
+                "income_eur": Decimal("0"),
+                "transaction_count": 0,
+                "categories": [],
+            },
+        )
+        month["spent_eur"] += rollup.spent_eur
+        month["income_eur"] += rollup.income_eur
+        month["transaction_count"] += rollup.transaction_count
+        month["categories"].append(_summary_item(rollup))
+    for month in months.values():
+        month["spent_eur"] = str(month["spent_eur"])
+        month["income_eur"] = str(month["income_eur"])
+
+    return conditional_json_response(request, {"months": list(months.values())})
+
+
+def _parse_month(month: str) -> dt.date:
+    return dt.datetime.strptime(month, "%Y-%m").date()
+
+
+def _summary_item(rollup: MonthlySpending) -> dict:
+    return {
+        # Stored as "" when missing
+        "category": rollup.category or None,
+        "sub_category": rollup.sub_category or None,
+        "meal_type": rollup.meal_type or None,
+        "spent_eur": str(rollup.spent_eur),
+        "income_eur": str(rollup.income_eur),
+        "transaction_count": rollup.transaction_count,
+    }
 
 
 @app.get("/ingest-jobs/{job_id}")
 def get_job(user_id: AuthDependency, job_id: UUID, db: DBDependency) -> JSONResponse:
     job = load_job(job_id, db)
-    if not job:
+    if not job or job.user_id != user_id:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    return JSONResponse(
-        {
-            "job_id": str(job.id),
-            "status": job.status,
-        }
+    # Timings of the pipeline stages, once the job finished
+    stages = [_stage_item(metric) for metric in load_stage_metrics(job_id, db)]
+    return JSONResponse({**_job_response(job), "stages": stages})
+
+
+def _stage_item(metric: JobStageMetric) -> dict:
+    return {
+        "stage": metric.stage,
+        "seconds": metric.seconds,
+        "row_count": metric.row_count,
+        "rows_per_second": metric.rows_per_second,
+    }
+
+
+# Prometheus metrics of this process, with the queue depth from the jobs table.
+# Jobs run by queue workers are exposed by the workers themselves.
+@app.get("/metrics")
+def get_prometheus_metrics(db: DBDependency) -> Response:
+    metrics = get_metrics()
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+
+    try:
+        metrics.set_queued_jobs(count_queued_jobs(db))
+    except Exception as e:
+        logger.log(logging.WARNING, f"Could not count the queued jobs: {e}")
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+def _job_response(job: IngestJob) -> dict:
+    response: dict = {"job_id": str(job.id), "status": job.status}
+    if job.status == JobStatus.COMPLETED:
+        response["ingested_txn_count"] = job.ingested_txn_count
+        response["duplicate_txn_count"] = job.duplicate_txn_count
+    return response
+
+
+# Server-sent events with the progress of the job, until it completes or fails.
+# Jobs run by queue workers publish in their own process: for them (and as a
+# safety net) the job status is checked in the database when no event came for
+# a while.
+@app.get("/ingest-jobs/{job_id}/events")
+async def stream_job_events(
+    user_id: AuthDependency, job_id: UUID, db: DBDependency
+) -> StreamingResponse:
+    # Subscribe before loading the job, so no event is missed in between
+    subscription = get_progress_broker().subscribe(job_id)
+    job = await run_in_threadpool(load_job, job_id, db)
+    if not job or job.user_id != user_id:
+        subscription.close()
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return StreamingResponse(
+        _job_events(subscription, job, db),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
+
+
+JOB_EVENTS_CHECK_SECONDS = 15.0
+JOB_STATUS_STAGES = {
+    JobStatus.COMPLETED: JobStage.COMPLETED,
+    JobStatus.FAILED: JobStage.FAILED,
+}
+
+
+async def _job_events(subscription: Subscription, job: IngestJob, db: Engine):  # type: ignore
+    try:
+        # 1. Events published before the client connected
+        for event in subscription.history:
+            yield _format_event(event)
+            if event.stage in TERMINAL_STAGES:
+                return
+
+        # 2. New events, checking the status in the database when it's quiet
+        while True:
+            if job.status in JOB_STATUS_STAGES:
+                yield _format_event(_final_event(job))
+                return
+            try:
+                event = await asyncio.wait_for(
+                    subscription.get(), timeout=JOB_EVENTS_CHECK_SECONDS
+                )
+            except TimeoutError:
+                reloaded_job = await run_in_threadpool(load_job, job.id, db)
+                if reloaded_job is None:
+                    return
+                job = reloaded_job
+                # Keeps proxies from closing the idle connection
+                yield ": keep-alive\n\n"
+                continue
+
+            yield _format_event(event)
+            if event.stage in TERMINAL_STAGES:
+                return
+    finally:
+        subscription.close()
+
+
+def _final_event(job: IngestJob) -> ProgressEvent:
+    return ProgressEvent(
+        job.id,
+        JOB_STATUS_STAGES[job.status],
+        row_count=job.ingested_txn_count,
+        duplicate_count=job.duplicate_txn_count,
+        failure_reason=job.failure_reason,
+    )
+
+
+def _format_event(event: ProgressEvent) -> str:
+    return f"event: progress\ndata: {json.dumps(event.to_json())}\n\n"
@@ -0,0 +1,123 @@
+# Responsibility: match a counterparty against many merchant names at once.
+# Merchant lists are compiled once into a hash index (exact names),
+# a trie (name prefixes) and an Aho-Corasick automaton (name substrings).
+from collections import deque
+
+
+def normalize_counterparty(counterparty: str) -> str:
+    return counterparty.lower().strip()
+
+
+class PrefixTrie:
+    def __init__(self) -> None:
+        self._children: list[dict[str, int]] = [{}]
+        self._labels: list[set[str]] = [set()]
+
+    def add(self, pattern: str, label: str) -> None:
+        node = 0
+        for char in pattern:
+            next_node = self._children[node].get(char)
+            if next_node is None:
+                next_node = len(self._children)
+                self._children.append({})
+                self._labels.append(set())
+                self._children[node][char] = next_node
+            node = next_node
+        self._labels[node].add(label)
+
+    # Labels of the patterns the text starts with.
+    # Like a `^pattern.*$` regex, the rest of the text can't span several lines.
+    def find_labels(self, text: str) -> set[str]:
+        found: set[str] = set()
+        node = 0
+        for position, char in enumerate(text):
+            if self._labels[node] and "\n" not in text[position:]:
+                found |= self._labels[node]
+            node = self._children[node].get(char, -1)
+            if node < 0:
+                return found
+        found |= self._labels[node]
+        return found
+
+
+class SubstringAutomaton:
+    def __init__(self) -> None:
+        self._children: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._labels: list[set[str]] = [set()]
+
+    def add(self, pattern: str, label: str) -> None:
+        node = 0
+        for char in pattern:
+            next_node = self._children[node].get(char)
+            if next_node is None:
+                next_node = len(self._children)
+                self._children.append({})
+                self._fail.append(0)
+                self._labels.append(set())
+                self._children[node][char] = next_node
+            node = next_node
+        self._labels[node].add(label)
+
+    # Computes the failure links (breadth first) once all patterns are added
+    def build(self) -> None:
+        queue = deque(self._children[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._children[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._children[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._children[fail].get(char, 0)
+                # A node also matches the patterns ending at its failure node
+                self._labels[child] |= self._labels[self._fail[child]]
+                queue.append(child)
+
+    # Labels of the patterns found anywhere in the text, in a single pass
+    def find_labels(self, text: str) -> set[str]:
+        found: set[str] = set()
+        node = 0
+        for char in text:
+            while node and char not in self._children[node]:
+                node = self._fail[node]
+            node = self._children[node].get(char, 0)
+            if self._labels[node]:
+                found |= self._labels[node]
+        return found
+
+
+class MerchantMatcher:
+    def __init__(self) -> None:
+        self._exact: dict[str, set[str]] = {}
+        self._prefixes = PrefixTrie()
+        self._substrings = SubstringAutomaton()
+        self._has_substrings = False
+
+    def add_exact(self, label: str, merchants: set[str]) -> "MerchantMatcher":
+        for merchant in merchants:
+            self._exact.setdefault(merchant.lower(), set()).add(label)
+        return self
+
+    def add_prefix(self, label: str, merchants: set[str]) -> "MerchantMatcher":
+        for merchant in merchants:
+            self._prefixes.add(merchant.lower(), label)
+        return self
+
+    def add_substring(self, label: str, merchants: set[str]) -> "MerchantMatcher":
+        for merchant in merchants:
+            self._substrings.add(merchant.lower(), label)
+            self._has_substrings = True
+        return self
+
+    def compile(self) -> "MerchantMatcher":
+        self._substrings.build()
+        return self
+
+    # Labels of all merchant groups matching the counterparty
+    def match(self, counterparty: str) -> set[str]:
+        normalized = normalize_counterparty(counterparty)
+        labels = set(self._exact.get(normalized, ()))
+        labels |= self._prefixes.find_labels(normalized)
+        if self._has_substrings:
+            labels |= self._substrings.find_labels(normalized)
+        return labels
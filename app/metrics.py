@@ -0,0 +1,250 @@
+# Responsibility: timing of the ingest pipeline stages and process-wide
+# Prometheus metrics (stage durations and rows, queue depth, request latency).
+# Metrics are rendered in the Prometheus text format by /metrics in the API,
+# and by a small HTTP server in queue workers.
+# Nothing is recorded unless metrics_enabled is set: recording is then one
+# flag check per job or request.
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, Iterator, Mapping
+
+from app.project_types import JobStatus, PipelineStage, StageTiming
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds. Stages take from milliseconds (filter) to minutes (large inserts).
+STAGE_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300
+)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+# Wall time and rows of each stage of a job. Always on: the timings are
+# stored with the job.
+class StageTimer:
+    def __init__(self) -> None:
+        self._timings: dict[PipelineStage, StageTiming] = {}
+
+    # A stage run several times (streaming chunks) adds up
+    @contextmanager
+    def stage(self, stage: PipelineStage) -> Iterator[StageTiming]:
+        timing = self._timings.setdefault(stage, StageTiming(stage))
+        started = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            timing.seconds += time.perf_counter() - started
+
+    # Timings measured elsewhere, e.g. in a pipeline process
+    def add(self, timings: Iterable[StageTiming]) -> None:
+        for timing in timings:
+            total = self._timings.setdefault(timing.stage, StageTiming(timing.stage))
+            total.seconds += timing.seconds
+            if timing.row_count is not None:
+                total.add_rows(timing.row_count)
+
+    @property
+    def timings(self) -> list[StageTiming]:
+        return list(self._timings.values())
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        label_names: tuple[str, ...],
+        buckets: tuple[float, ...],
+    ):
+        self.name = name
+        self._description = description
+        self._label_names = label_names
+        self._buckets = buckets
+        # Per label values: observations per bucket (the last one is +Inf), sum
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple[str, ...], value: float) -> None:
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self._buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self._description}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = {
+                labels: (list(counts), total[0])
+                for labels, (counts, total) in self._series.items()
+            }
+        names = self._label_names + ("le",)
+        for labels, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            bounds = [_format_value(bound) for bound in self._buckets] + ["+Inf"]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket{_format_labels(names, labels + (bound,))} "
+                    f"{cumulative}"
+                )
+            label_text = _format_labels(self._label_names, labels)
+            yield f"{self.name}_sum{label_text} {_format_value(total)}"
+            yield f"{self.name}_count{label_text} {cumulative}"
+
+
+# A counter (only goes up) or a gauge (set to the current value)
+class Value:
+    def __init__(
+        self, name: str, description: str, label_names: tuple[str, ...], kind: str
+    ):
+        self.name = name
+        self._description = description
+        self._label_names = label_names
+        self._kind = kind
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple[str, ...], amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set(self, labels: tuple[str, ...], value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self._description}"
+        yield f"# TYPE {self.name} {self._kind}"
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            labels_text = _format_labels(self._label_names, labels)
+            yield f"{self.name}{labels_text} {_format_value(value)}"
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.stage_duration = Histogram(
+            "ingest_stage_duration_seconds",
+            "Wall time of an ingest pipeline stage, per job.",
+            ("stage",),
+            STAGE_BUCKETS,
+        )
+        self.stage_rows = Value(
+            "ingest_stage_rows_total",
+            "Rows produced by an ingest pipeline stage.",
+            ("stage",),
+            "counter",
+        )
+        self.jobs = Value(
+            "ingest_jobs_finished_total",
+            "Ingest jobs finished by this process.",
+            ("status",),
+            "counter",
+        )
+        self.queued_jobs = Value(
+            "ingest_jobs_queued",
+            "Ingest jobs waiting or running, across all processes.",
+            ("status",),
+            "gauge",
+        )
+        self.request_duration = Histogram(
+            "http_request_duration_seconds",
+            "Time until the response headers are sent, per route.",
+            ("method", "route", "status"),
+            REQUEST_BUCKETS,
+        )
+
+    def observe_job(self, status: JobStatus, timings: Iterable[StageTiming]) -> None:
+        if not self.enabled:
+            return
+        self.jobs.inc((status.value,))
+        for timing in timings:
+            self.stage_duration.observe((timing.stage.value,), timing.seconds)
+            if timing.row_count is not None:
+                self.stage_rows.inc((timing.stage.value,), timing.row_count)
+
+    def observe_request(
+        self, method: str, route: str, status: int, seconds: float
+    ) -> None:
+        if not self.enabled:
+            return
+        self.request_duration.observe((method, route, str(status)), seconds)
+
+    def set_queued_jobs(self, counts: Mapping[JobStatus, int]) -> None:
+        for status in (JobStatus.PENDING, JobStatus.RUNNING):
+            self.queued_jobs.set((status.value,), counts.get(status, 0))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in (
+            self.stage_duration,
+            self.stage_rows,
+            self.jobs,
+            self.queued_jobs,
+            self.request_duration,
+        ):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+_metrics = Metrics()
+
+
+# Process-wide metrics, shared by the jobs and the API
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = get_metrics().render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Scrapes are not logged
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+# /metrics of processes without the API (queue workers), in a daemon thread
+def start_metrics_server(port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("", port), _MetricsHandler)
+    threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+    logger.log(logging.INFO, f"Serving metrics on port {port}")
+    return server
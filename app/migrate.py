@@ -0,0 +1,27 @@
+# Responsibility: create or upgrade the database schema. Run it before
+# starting a new version of the API or the workers; they only check the schema.
+# Usage: spending-tracker-migrate (or python -m app.migrate)
+import logging
+
+from sqlmodel import create_engine
+
+from app.config import AppConfig
+from app.db.schema import migrate
+from app.logging_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    configure_logging()
+    app_config = AppConfig()  # type: ignore
+
+    db = create_engine(app_config.db_connection_string)
+    changes = migrate(db)
+    for change in changes:
+        logger.log(logging.INFO, f"Migration: {change}")
+    logger.log(logging.INFO, f"Database schema is up to date ({len(changes)} changes)")
+
+
+if __name__ == "__main__":
+    main()
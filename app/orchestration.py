@@ -1,113 +1,612 @@
 import datetime as dt
 import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from itertools import batched
+from io import BytesIO
+from typing import Iterable, Iterator, Sequence
 from uuid import UUID
 
-import pandas as pd
 from sqlalchemy import Engine
 
-from app.config import AppEnvironment
+from app.config import AppEnvironment, PipelineEngine, PipelineMode
 from app.file_storage import FileStorage
-from app.db.jobs import load_job, update_job
-from app.db.transactions import (
-    get_existing_dedup_keys,
-    insert_transactions,
-    Transaction,
+from app.db.jobs import (
+    claim_batch_jobs,
+    claim_job,
+    get_worker_id,
+    IngestJob,
+    finish_job,
+    LeaseHeartbeat,
+    save_stage_metrics,
 )
+from app.db.transactions import insert_transactions
 from app.dependencies import AppConfig
-from app.filters import filter_transactions
-from app.parsers.registry import get_parser
-from app.project_types import JobStatus, ImportedTransaction
+from app.executor import run_cpu_bound
+from app.filters import apply_filters, filter_transactions, log_rejected_counts
+from app.fx_rates import get_rate_store
+from app.metrics import get_metrics, StageTimer
+from app.parsers.registry import get_parser, get_stream_parser
+from app.progress import get_progress_broker, ProgressEvent
+from app.project_types import (
+    EnrichedTransaction,
+    ImportedTransaction,
+    JobStage,
+    JobStatus,
+    PipelineStage,
+    StageTiming,
+    StatementSource,
+)
 from app.enrichment import enrich_transactions
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass(slots=True)
+class PreparedTransactions:
+    enriched: list[EnrichedTransaction]
+    # Not counted by the columnar engine
+    parsed_count: int | None = None
+    filtered_count: int | None = None
+    # Parse, filter and enrich, timed where they ran
+    stage_timings: list[StageTiming] = field(default_factory=list)
+
+
+# Runs the job in the API process. The job is claimed the same way
+# a worker claims it, so it can't run in a worker at the same time.
 def run_job(
     job_id: UUID,
-    user_id: UUID,
     db: Engine,
     file_storage: FileStorage,
     app_config: AppConfig,
 ) -> None:
-    # 1. Load job info
-    job = load_job(job_id, db)
+    # 1. Claim the job
+    job = claim_job(
+        job_id,
+        db=db,
+        worker_id=get_worker_id(),
+        lease_duration=dt.timedelta(seconds=app_config.job_lease_seconds),
+    )
     if not job:
         return
 
+    process_job(job, db=db, file_storage=file_storage, app_config=app_config)
+
+
+# Runs the pipeline for a job claimed by this process
+def process_job(
+    job: IngestJob,
+    db: Engine,
+    file_storage: FileStorage,
+    app_config: AppConfig,
+) -> None:
     logger.log(logging.INFO, f"### Starting Job: {job.id} for {job.statement_source}")
-    job.started_at = dt.datetime.now()
-    job.status = JobStatus.RUNNING
-    update_job(updated_job=job, db=db)
+    _publish(job.id, JobStage.STARTED)
+    heartbeat = LeaseHeartbeat(
+        job,
+        db=db,
+        lease_duration=dt.timedelta(seconds=app_config.job_lease_seconds),
+    )
+    timer = StageTimer()
+    with heartbeat:
+        try:
+            ingested_count, duplicate_count = _run_pipeline(
+                job,
+                db=db,
+                file_storage=file_storage,
+                app_config=app_config,
+                timer=timer,
+            )
+        except Exception:
+            logger.exception(f"### Failed Job: {job.id} for {job.statement_source}")
+            _fail_job(job, db=db, timer=timer, heartbeat=heartbeat)
+            return
 
-    # Load the statement from file storage
-    statement = file_storage.load_file(
-        job.file_path, bucket=app_config.statements_storage_bucket
+        _complete_job(
+            job,
+            ingested_count,
+            duplicate_count,
+            db=db,
+            timer=timer,
+            heartbeat=heartbeat,
+        )
+
+
+# Runs the pending jobs of a batch in the API process, claimed like a worker would
+def run_batch(
+    batch_id: UUID,
+    db: Engine,
+    file_storage: FileStorage,
+    app_config: AppConfig,
+) -> None:
+    jobs = claim_batch_jobs(
+        batch_id,
+        db=db,
+        worker_id=get_worker_id(),
+        lease_duration=dt.timedelta(seconds=app_config.job_lease_seconds),
     )
+    if jobs:
+        process_batch(jobs, db=db, file_storage=file_storage, app_config=app_config)
 
-    # Find the right parser
-    parser = get_parser(job.statement_source)
 
-    # Log it and update job record status=failed, reason=technical_error
-    if parser is None:
+# Runs the jobs of a batch claimed by this process. Statements are downloaded
+# and prepared `batch_max_parallel_jobs` at a time, then the transactions of
+# all of them are inserted together: one dedup pass for the whole batch, and
+# a transaction in several statements is only counted as new once.
+# The streaming pipeline mode doesn't apply: statements are prepared whole.
+def process_batch(
+    jobs: list[IngestJob],
+    db: Engine,
+    file_storage: FileStorage,
+    app_config: AppConfig,
+) -> None:
+    batch_id = jobs[0].batch_id
+    logger.log(logging.INFO, f"### Starting batch {batch_id} of {len(jobs)} jobs")
+    lease_duration = dt.timedelta(seconds=app_config.job_lease_seconds)
+    timers = {job.id: StageTimer() for job in jobs}
+    heartbeats = {
+        job.id: LeaseHeartbeat(job, db=db, lease_duration=lease_duration)
+        for job in jobs
+    }
+    with ExitStack() as stack:
+        for job in jobs:
+            _publish(job.id, JobStage.STARTED)
+            stack.enter_context(heartbeats[job.id])
+
+        # 1. Download, parse, filter and enrich the statements
+        def prepare(job: IngestJob) -> PreparedTransactions | None:
+            try:
+                return _prepare_job(
+                    job,
+                    file_storage=file_storage,
+                    app_config=app_config,
+                    timer=timers[job.id],
+                )
+            except Exception:
+                logger.exception(f"### Failed Job: {job.id} for {job.statement_source}")
+                _fail_job(
+                    job, db=db, timer=timers[job.id], heartbeat=heartbeats[job.id]
+                )
+                # Its lease isn't needed while the other jobs run
+                heartbeats[job.id].stop()
+                return None
+
+        with ThreadPoolExecutor(
+            max_workers=app_config.batch_max_parallel_jobs,
+            thread_name_prefix="batch-job",
+        ) as executor:
+            results = list(executor.map(prepare, jobs))
+        prepared_jobs = [
+            (job, prepared) for job, prepared in zip(jobs, results) if prepared
+        ]
+        if not prepared_jobs:
+            return
+
+        # 2. Insert the transactions of all the statements, in upload order
+        enriched = [txn for _, prepared in prepared_jobs for txn in prepared.enriched]
+        insert_started = time.perf_counter()
+        try:
+            new, duplicates = _insert_new_transactions(
+                enriched, db=db, app_config=app_config
+            )
+        except Exception:
+            logger.exception(f"### Failed batch {batch_id}")
+            for job, _ in prepared_jobs:
+                _fail_job(
+                    job, db=db, timer=timers[job.id], heartbeat=heartbeats[job.id]
+                )
+            return
+        insert_seconds = time.perf_counter() - insert_started
+
+        # 3. Each job is credited with its own transactions, and with its share
+        # of the insert time. Results are written while the leases are held.
+        new_counts = Counter(txn.job_id for txn in new)
+        duplicate_counts = Counter(txn.job_id for txn in duplicates)
+        for job, prepared in prepared_jobs:
+            row_count = len(prepared.enriched)
+            timers[job.id].add(
+                [
+                    StageTiming(
+                        PipelineStage.INSERT,
+                        seconds=insert_seconds * row_count / max(len(enriched), 1),
+                        row_count=row_count,
+                    )
+                ]
+            )
+            _publish(
+                job.id,
+                JobStage.INSERTED,
+                row_count=new_counts[job.id],
+                duplicate_count=duplicate_counts[job.id],
+            )
+            _complete_job(
+                job,
+                new_counts[job.id],
+                duplicate_counts[job.id],
+                db=db,
+                timer=timers[job.id],
+                heartbeat=heartbeats[job.id],
+            )
+
+
+def _complete_job(
+    job: IngestJob,
+    ingested_count: int,
+    duplicate_count: int,
+    db: Engine,
+    timer: StageTimer,
+    heartbeat: LeaseHeartbeat,
+) -> None:
+    # 8. Update job status in DB.
+    job.finished_at = dt.datetime.now()
+    job.status = JobStatus.COMPLETED
+    job.ingested_txn_count = ingested_count
+    job.duplicate_txn_count = duplicate_count
+    job.lease_expires_at = None
+
+    if not _finish_job(job, heartbeat, db=db):
         return
+    _record_stages(job, timer, db=db)
+    _publish(
+        job.id,
+        JobStage.COMPLETED,
+        row_count=ingested_count,
+        duplicate_count=duplicate_count,
+    )
+
+    logger.log(logging.INFO, f"### Completed Job: {job.id} for {job.statement_source}")
+    logger.log(
+        logging.INFO,
+        f"Inserted {ingested_count} new transactions | {duplicate_count} duplicates",
+    )
+
+
+def _fail_job(
+    job: IngestJob, db: Engine, timer: StageTimer, heartbeat: LeaseHeartbeat
+) -> None:
+    job.finished_at = dt.datetime.now()
+    job.status = JobStatus.FAILED
+    job.failure_reason = "technical_error"
+    job.lease_expires_at = None
+    if not _finish_job(job, heartbeat, db=db):
+        return
+    # The stages that ran before the failure
+    _record_stages(job, timer, db=db)
+    _publish(job.id, JobStage.FAILED, failure_reason=job.failure_reason)
+
+
+# The outcome is only stored while this worker holds the lease. Otherwise the
+# job was requeued and another worker may have run it: its row is left alone.
+# Transactions already inserted are kept, a re-run counts them as duplicates.
+def _finish_job(job: IngestJob, heartbeat: LeaseHeartbeat, db: Engine) -> bool:
+    if not heartbeat.lease_lost and finish_job(job, db=db):
+        return True
+    logger.log(
+        logging.WARNING,
+        f"### Lost the lease of job {job.id}, its {job.status} status is not saved",
+    )
+    return False
+
+
+# Stores the stage timings with the job and adds them to the metrics.
+# A failure here doesn't change the outcome of the job.
+def _record_stages(job: IngestJob, timer: StageTimer, db: Engine) -> None:
+    timings = timer.timings
+    logger.log(
+        logging.INFO,
+        "Stages: " + " | ".join(_format_timing(timing) for timing in timings),
+    )
+    get_metrics().observe_job(job.status, timings)
+    try:
+        save_stage_metrics(job.id, timings, db=db)
+    except Exception as e:
+        logger.log(
+            logging.WARNING, f"Could not save the stage timings of {job.id}: {e}"
+        )
+
+
+def _format_timing(timing: StageTiming) -> str:
+    text = f"{timing.stage} {timing.seconds:.3f}s"
+    rows_per_second = timing.rows_per_second
+    if rows_per_second is not None:
+        text += f" ({timing.row_count} rows, {rows_per_second:.0f} rows/s)"
+    return text
+
+
+# Returns the number of inserted and duplicate transactions
+def _run_pipeline(
+    job: IngestJob,
+    db: Engine,
+    file_storage: FileStorage,
+    app_config: AppConfig,
+    timer: StageTimer,
+) -> tuple[int, int]:
+    # Find the right parser and run the pipeline
+    pipeline_engine = job.pipeline_engine or app_config.pipeline_engine
+    if (
+        pipeline_engine == PipelineEngine.ROW
+        and app_config.pipeline_mode == PipelineMode.STREAMING
+    ):
+        user_id = _user_id(job)
+        statement = _download(
+            job, file_storage=file_storage, app_config=app_config, timer=timer
+        )
+        stream_parser = get_stream_parser(job.statement_source)
+        if stream_parser is None:
+            raise ValueError(f"No parser for {job.statement_source}")
+        return _run_streaming_pipeline(
+            stream_parser(statement),
+            job_id=job.id,
+            user_id=user_id,
+            db=db,
+            app_config=app_config,
+            timer=timer,
+        )
+
+    prepared = _prepare_job(
+        job, file_storage=file_storage, app_config=app_config, timer=timer
+    )
+    enriched = prepared.enriched
+
+    # 7. Insert new transactions. Duplicates are skipped by the database.
+    with timer.stage(PipelineStage.INSERT) as timing:
+        new, duplicates = _insert_new_transactions(
+            enriched, db=db, app_config=app_config
+        )
+        timing.add_rows(len(enriched))
+    _publish(
+        job.id, JobStage.INSERTED, row_count=len(new), duplicate_count=len(duplicates)
+    )
+
+    # [DEV OBSERVABILITY]
+    if app_config.app_environment == AppEnvironment.DEV:
+        _dump_csv(duplicates, "test_duplicates.csv")
+
+    return len(new), len(duplicates)
+
+
+def _user_id(job: IngestJob) -> UUID:
+    if job.user_id is None:
+        raise ValueError(f"Job {job.id} has no user")
+    return job.user_id
+
+
+# Load the statement from file storage
+def _download(
+    job: IngestJob, file_storage: FileStorage, app_config: AppConfig, timer: StageTimer
+) -> BytesIO:
+    with timer.stage(PipelineStage.DOWNLOAD):
+        statement = file_storage.load_file(
+            job.file_path, bucket=app_config.statements_storage_bucket
+        )
+    _publish(job.id, JobStage.DOWNLOADED)
+    return statement
+
+
+# Downloads the statement and runs the stages before the insert
+def _prepare_job(
+    job: IngestJob, file_storage: FileStorage, app_config: AppConfig, timer: StageTimer
+) -> PreparedTransactions:
+    user_id = _user_id(job)
+    statement = _download(
+        job, file_storage=file_storage, app_config=app_config, timer=timer
+    )
+
+    # 4-6. CPU-bound stages, in a separate process with the process pool executor.
+    # Their progress is published when they're all done.
+    prepared = run_cpu_bound(
+        app_config,
+        prepare_transactions,
+        statement.read(),
+        statement_source=job.statement_source,
+        job_id=job.id,
+        user_id=user_id,
+        pipeline_engine=job.pipeline_engine or app_config.pipeline_engine,
+        app_config=app_config,
+    )
+    timer.add(prepared.stage_timings)
+
+    if prepared.parsed_count is not None:
+        _publish(job.id, JobStage.PARSED, row_count=prepared.parsed_count)
+    if prepared.filtered_count is not None:
+        _publish(job.id, JobStage.FILTERED, row_count=prepared.filtered_count)
+    _publish(job.id, JobStage.ENRICHED, row_count=len(prepared.enriched))
+    return prepared
+
+
+# Parse, filter and enrich a whole statement.
+# Runs in the pipeline processes, so arguments and result must be picklable.
+def prepare_transactions(
+    statement: bytes,
+    statement_source: StatementSource,
+    job_id: UUID,
+    user_id: UUID,
+    pipeline_engine: PipelineEngine,
+    app_config: AppConfig,
+) -> PreparedTransactions:
+    rate_store = get_rate_store(app_config)
+    timer = StageTimer()
+
+    # Column operations over the whole statement.
+    # Produces the same transactions as the row-wise stages.
+    if pipeline_engine == PipelineEngine.COLUMNAR:
+        # Imported here: pandas is only needed by this engine
+        from app.columnar import enrich_statement
+
+        enriched = enrich_statement(
+            BytesIO(statement),
+            statement_source=statement_source,
+            job_id=job_id,
+            user_id=user_id,
+            rate_table=rate_store.rate_table,
+            timer=timer,
+        )
+        return PreparedTransactions(enriched, stage_timings=timer.timings)
+
+    parser = get_parser(statement_source)
+    if parser is None:
+        raise ValueError(f"No parser for {statement_source}")
 
     # 4. Get imported transactions
-    imported_txns: list[ImportedTransaction] = parser(statement)
+    with timer.stage(PipelineStage.PARSE) as timing:
+        imported_txns = parser(BytesIO(statement))
+        timing.add_rows(len(imported_txns))
 
     # [DEV OBSERVABILITY]
     if app_config.app_environment == AppEnvironment.DEV:
-        df = pd.DataFrame(txn.model_dump() for txn in imported_txns)
-        df.to_csv("test_output_imported.csv")
+        _dump_csv(imported_txns, "test_output_imported.csv")
 
-    filtered = filter_transactions(imported_txns)
+    with timer.stage(PipelineStage.FILTER) as timing:
+        filtered = filter_transactions(imported_txns)
+        timing.add_rows(len(filtered))
 
     # [DEV OBSERVABILITY]
     if app_config.app_environment == AppEnvironment.DEV:
-        df = pd.DataFrame(txn.model_dump() for txn in filtered)
-        df.to_csv("test_output_filtered.csv")
+        _dump_csv(filtered, "test_output_filtered.csv")
 
     # 5. Enhance transactions to match the DB schema (EUR, Categories, Dedup key)
-    enriched: list[Transaction] = enrich_transactions(
-        filtered, job_id=job_id, user_id=user_id
-    )
+    with timer.stage(PipelineStage.ENRICH) as timing:
+        enriched: list[EnrichedTransaction] = enrich_transactions(
+            filtered,
+            job_id=job_id,
+            user_id=user_id,
+            rate_store=rate_store,
+        )
+        timing.add_rows(len(enriched))
 
     # [DEV OBSERVABILITY]
     if app_config.app_environment == AppEnvironment.DEV:
-        df = pd.DataFrame(txn.model_dump() for txn in enriched)
-        df.to_csv("test_output_enriched.csv")
+        _dump_csv(enriched, "test_output_enriched.csv")
+
+    return PreparedTransactions(
+        enriched,
+        parsed_count=len(imported_txns),
+        filtered_count=len(filtered),
+        stage_timings=timer.timings,
+    )
+
+
+# Rows flow from the parser to the database in chunks of `pipeline_chunk_size`,
+# so memory use doesn't grow with the statement size.
+# Each chunk is committed separately; a re-run skips the committed rows as duplicates.
+# Runs in the process running the job: the parser reads the statement lazily.
+def _run_streaming_pipeline(
+    imported_txns: Iterable[ImportedTransaction],
+    job_id: UUID,
+    user_id: UUID,
+    db: Engine,
+    app_config: AppConfig,
+    timer: StageTimer,
+) -> tuple[int, int]:
+    rate_store = get_rate_store(app_config)
+    parsed_count = 0
+    filtered_count = 0
+    enriched_count = 0
+    ingested_count = 0
+    duplicate_count = 0
+    rejected_counts: Counter[str] = Counter()
+    chunks = batched(imported_txns, app_config.pipeline_chunk_size)
+    for chunk in _timed_chunks(chunks, timer):
+        parsed_count += len(chunk)
+        _publish(job_id, JobStage.PARSED, row_count=parsed_count)
+
+        with timer.stage(PipelineStage.FILTER) as timing:
+            filtered, chunk_rejected_counts = apply_filters(list(chunk))
+            timing.add_rows(len(filtered))
+        rejected_counts.update(chunk_rejected_counts)
+        filtered_count += len(filtered)
+        _publish(job_id, JobStage.FILTERED, row_count=filtered_count)
+
+        with timer.stage(PipelineStage.ENRICH) as timing:
+            enriched = enrich_transactions(
+                filtered,
+                job_id=job_id,
+                user_id=user_id,
+                rate_store=rate_store,
+            )
+            timing.add_rows(len(enriched))
+        enriched_count += len(enriched)
+        _publish(job_id, JobStage.ENRICHED, row_count=enriched_count)
+
+        with timer.stage(PipelineStage.INSERT) as timing:
+            new, duplicates = _insert_new_transactions(
+                enriched, db=db, app_config=app_config
+            )
+            timing.add_rows(len(enriched))
+        ingested_count += len(new)
+        duplicate_count += len(duplicates)
+        _publish(
+            job_id,
+            JobStage.INSERTED,
+            row_count=ingested_count,
+            duplicate_count=duplicate_count,
+        )
+
+    log_rejected_counts(rejected_counts)
+    return ingested_count, duplicate_count
+
+
+# The parser reads the statement lazily: parsing happens while the next
+# chunk is taken
+def _timed_chunks(
+    chunks: Iterator[tuple[ImportedTransaction, ...]], timer: StageTimer
+) -> Iterator[tuple[ImportedTransaction, ...]]:
+    while True:
+        with timer.stage(PipelineStage.PARSE) as timing:
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        timing.add_rows(len(chunk))
+        yield chunk
 
-    new: list[Transaction] = []
-    duplicates: list[Transaction] = []
 
-    # Using set for O(1) lookups
-    existing_dedup_keys = set(get_existing_dedup_keys(db=db))
+# Inserts the transactions and splits them into new ones and duplicates
+def _insert_new_transactions(
+    enriched: list[EnrichedTransaction], db: Engine, app_config: AppConfig
+) -> tuple[list[EnrichedTransaction], list[EnrichedTransaction]]:
+    inserted_dedup_keys = insert_transactions(
+        transactions=enriched,
+        db=db,
+        mode=app_config.insert_mode,
+        chunk_size=app_config.insert_chunk_size,
+    )
+
+    new: list[EnrichedTransaction] = []
+    duplicates: list[EnrichedTransaction] = []
     for transaction in enriched:
-        if transaction.dedup_key not in existing_dedup_keys:
+        if transaction.dedup_key in inserted_dedup_keys:
             new.append(transaction)
+            # A repeated dedup key within the statement is only inserted once
+            inserted_dedup_keys.discard(transaction.dedup_key)
         else:
             duplicates.append(transaction)
 
-    # [DEV OBSERVABILITY]
-    if app_config.app_environment == AppEnvironment.DEV:
-        df = pd.DataFrame(txn.model_dump() for txn in duplicates)
-        df.to_csv("test_duplicates.csv")
-
-    # 7. Insert new transactions
-    insert_transactions(transactions=new, db=db)
-
-    # 8. Update job status in DB.
-    job.finished_at = dt.datetime.now()
-    job.status = JobStatus.COMPLETED
-    job.ingested_txn_count = len(new)
-    job.duplicate_txn_count = len(duplicates)
+    return new, duplicates
 
-    update_job(updated_job=job, db=db)
 
-    logger.log(logging.INFO, f"### Completed Job: {job.id} for {job.statement_source}")
-    logger.log(
-        logging.INFO,
-        f"Inserted {len(new)} new transactions | {len(duplicates)} duplicates",
+def _publish(
+    job_id: UUID,
+    stage: JobStage,
+    row_count: int | None = None,
+    duplicate_count: int | None = None,
+    failure_reason: str | None = None,
+) -> None:
+    get_progress_broker().publish(
+        ProgressEvent(
+            job_id,
+            stage,
+            row_count=row_count,
+            duplicate_count=duplicate_count,
+            failure_reason=failure_reason,
+        )
     )
 
 
+# [DEV OBSERVABILITY] pandas is imported on first use, it's slow to import
+def _dump_csv(records: Sequence[object], filename: str) -> None:
+    import pandas as pd
 
+    pd.DataFrame(records).to_csv(filename)
@@ -0,0 +1,54 @@
+# Responsibility: keyset pagination cursors and conditional (ETag) responses
+# of the listing endpoints.
+# A cursor holds the sort key of the last row of a page; the next page starts
+# after it, so pages cost the same however deep the client goes.
+import base64
+import datetime as dt
+import hashlib
+import json
+from typing import Any, Callable, Sequence
+
+from fastapi import Request, Response
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(values: Sequence[object]) -> str:
+    payload = json.dumps([_cursor_value(value) for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+# `parsers` turn the values back into their types,
+# e.g. (dt.datetime.fromisoformat, UUID)
+def decode_cursor(cursor: str, parsers: Sequence[Callable[[str], Any]]) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError("wrong number of values")
+        return tuple(parse(value) for parse, value in zip(parsers, values))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+
+
+def _cursor_value(value: object) -> str:
+    if isinstance(value, (dt.date, dt.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+# JSON response with an ETag of its content. A client sending the ETag of its
+# copy in If-None-Match gets an empty 304 if the page didn't change.
+def conditional_json_response(request: Request, content: dict) -> Response:
+    body = json.dumps(content, separators=(",", ":")).encode()
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    # Pages change with every job or import: clients must always revalidate
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    client_etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if etag in client_etags or "*" in client_etags:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
@@ -1,10 +1,12 @@
-from typing import BinaryIO, Callable
+from pathlib import PurePath
+from typing import BinaryIO, Callable, Iterator
 
-from app.parsers.revolut import parse_revolut_statement
-from app.parsers.swedbank import parse_swedbank_statement
+from app.parsers.revolut import iter_revolut_statement, parse_revolut_statement
+from app.parsers.swedbank import iter_swedbank_statement, parse_swedbank_statement
 from app.project_types import StatementSource, ImportedTransaction
 
 ParserFN = Callable[[BinaryIO], list[ImportedTransaction]]
+StreamParserFN = Callable[[BinaryIO], Iterator[ImportedTransaction]]
 
 # Registry of parsers
 _registry: dict[StatementSource, ParserFN] = {
@@ -12,6 +14,27 @@ _registry: dict[StatementSource, ParserFN] = {
     StatementSource.SWEDBANK: parse_swedbank_statement,
 }
 
+# Registry of streaming parsers, yielding transactions as rows are read
+_stream_registry: dict[StatementSource, StreamParserFN] = {
+    StatementSource.REVOLUT: iter_revolut_statement,
+    StatementSource.SWEDBANK: iter_swedbank_statement,
+}
+
+
+# Statement exports by file type, for uploads without an explicit source
+_sources_by_extension: dict[str, StatementSource] = {
+    ".xlsx": StatementSource.REVOLUT,
+    ".csv": StatementSource.SWEDBANK,
+}
+
 
 def get_parser(statement_source: StatementSource) -> ParserFN | None:
     return _registry.get(statement_source)
+
+
+def get_stream_parser(statement_source: StatementSource) -> StreamParserFN | None:
+    return _stream_registry.get(statement_source)
+
+
+def detect_statement_source(filename: str) -> StatementSource | None:
+    return _sources_by_extension.get(PurePath(filename).suffix.lower())
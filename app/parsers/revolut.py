@@ -2,58 +2,76 @@ import datetime as dt
 import logging
 from decimal import Decimal
 from hashlib import sha256
-from typing import Any, BinaryIO
+from itertools import batched
+from typing import Any, BinaryIO, Iterator
 
-import openpyxl
 from pydantic import (
     BaseModel,
     ConfigDict,
     Field,
     model_validator,
-    ValidationError,
+    TypeAdapter,
 )
 
+from app.parsers.validation import (
+    Row,
+    stripped_text,
+    validate_rows,
+    VALIDATION_BATCH_SIZE,
+)
 from app.project_types import ImportedTransaction, TransactionType, TransactionSource, Side
 
 logger = logging.getLogger(__name__)
 
+SUPPORTED_PRODUCT = "CURRENT"
+SUPPORTED_STATE = "COMPLETED"
+UNSUPPORTED_TYPES = {"CASHBACK", "EXCHANGE", "TOPUP", "FEE", "TRADE"}
+
 
 def parse_revolut_statement(statement: BinaryIO) -> list[ImportedTransaction]:
-    statement_rows = get_statement_rows(statement)
-    transactions = []
-    rejected_count = 0
-    for row in statement_rows:
-        try:
-            transactions.append(RawTransactionRevolut.model_validate(row))
-        except ValidationError:
-            rejected_count += 1
+    return list(iter_revolut_statement(statement))
+
 
-    normalized = [convert_to_standardized_transaction(txn) for txn in transactions]
+# Streaming version: rows are validated in batches and yielded one at a time
+def iter_revolut_statement(statement: BinaryIO) -> Iterator[ImportedTransaction]:
+    imported_count = 0
+    rejected_count = 0
+    for rows in batched(iter_statement_rows(statement), VALIDATION_BATCH_SIZE):
+        transactions, rejected = validate_rows(RAW_ROWS_ADAPTER, rows, is_supported_row)
+        imported_count += len(transactions)
+        rejected_count += rejected
+        for transaction in transactions:
+            yield convert_to_standardized_transaction(transaction)
 
     logger.log(logging.INFO, "### Revolut Parser finished")
-    logger.log(logging.INFO, f"Imported valid transactions: {len(normalized)}")
+    logger.log(logging.INFO, f"Imported valid transactions: {imported_count}")
     logger.log(logging.INFO, f"Rejected rows: {rejected_count}")
 
-    return normalized
-
 
 def get_statement_rows(statement: BinaryIO) -> list[dict[str, Any]]:
+    return list(iter_statement_rows(statement))
+
+
+def iter_statement_rows(statement: BinaryIO) -> Iterator[dict[str, Any]]:
+    # Imported here: slow to import and only needed to run jobs
+    import openpyxl
+
     # read_only mode auto-closes the excel file
     workbook = openpyxl.load_workbook(statement, read_only=True)
     try:
         sheet = workbook.active
         if not sheet:
-            return []
+            return
 
         rows_iterator = sheet.iter_rows(values_only=True)
-        first_row = next(rows_iterator)
+        # An empty sheet has no rows. StopIteration must not escape a generator.
+        first_row = next(rows_iterator, None)
+        if first_row is None:
+            return
         headers = [str(header) for header in first_row]
 
-        rows = [
-            {header: value for header, value in zip(headers, row)}
-            for row in rows_iterator
-        ]
-        return rows
+        for row in rows_iterator:
+            yield {header: value for header, value in zip(headers, row)}
     finally:
         workbook.close()
 
@@ -74,28 +92,40 @@ class RawTransactionRevolut(BaseModel):
     @model_validator(mode="after")
     def is_valid_transaction(self) -> "RawTransactionRevolut":
         # Only use current account transactions (excl. saving, trading, etc.)
-        if self.account_type.upper() != "CURRENT":
+        if self.account_type.upper() != SUPPORTED_PRODUCT:
             raise ValueError(
                 f"Only Current product is supported. Got: {self.account_type}"
             )
 
-        if self.state.upper() != "COMPLETED":
+        if self.state.upper() != SUPPORTED_STATE:
             raise ValueError(
                 f"Only completed transactions supported. Got state: {self.state}"
             )
 
-        if self.type.upper() in {
-            "CASHBACK",
-            "EXCHANGE",
-            "TOPUP",
-            "FEE",
-            "TRADE",
-        }:
+        if self.type.upper() in UNSUPPORTED_TYPES:
             raise ValueError(f"Transaction type {self.type} is not supported")
 
         return self
 
 
+RAW_ROWS_ADAPTER = TypeAdapter(list[RawTransactionRevolut])
+
+
+# Same rules as RawTransactionRevolut.is_valid_transaction, on the raw values.
+# Only rejects rows that would certainly fail validation.
+def is_supported_row(row: Row) -> bool:
+    product = stripped_text(row.get("Product"))
+    if product is not None and product.upper() != SUPPORTED_PRODUCT:
+        return False
+
+    state = stripped_text(row.get("State"))
+    if state is not None and state.upper() != SUPPORTED_STATE:
+        return False
+
+    transaction_type = stripped_text(row.get("Type"))
+    return transaction_type is None or transaction_type.upper() not in UNSUPPORTED_TYPES
+
+
 def convert_to_standardized_transaction(
     transaction: RawTransactionRevolut,
 ) -> ImportedTransaction:
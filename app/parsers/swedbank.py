@@ -5,17 +5,24 @@ from csv import DictReader
 from decimal import Decimal
 from io import TextIOWrapper
 from hashlib import sha256
-from typing import Any, BinaryIO
+from itertools import batched
+from typing import Any, BinaryIO, Iterator
 
 from pydantic import (
     BaseModel,
     ConfigDict,
     Field,
-    ValidationError,
     field_validator,
     model_validator,
+    TypeAdapter,
 )
 
+from app.parsers.validation import (
+    Row,
+    stripped_text,
+    validate_rows,
+    VALIDATION_BATCH_SIZE,
+)
 from app.project_types import ImportedTransaction, TransactionType, TransactionSource, Side
 
 logger = logging.getLogger(__name__)
@@ -24,33 +31,43 @@ EXCL_DESCRIPTION_PATTERNS = (
     r"^apyvarta$",
     r"^likutis .*$",
 )
+# All excluded patterns compiled once into a single alternation
+EXCL_DESCRIPTION_REGEX = re.compile(
+    "|".join(f"(?:{pattern})" for pattern in EXCL_DESCRIPTION_PATTERNS),
+    re.IGNORECASE,
+)
+SIDES = {"D", "K"}
 
 
 def parse_swedbank_statement(statement: BinaryIO) -> list[ImportedTransaction]:
-    statement_rows = get_statement_rows(statement)
-    transactions = []
-    rejected_count = 0
-    for row in statement_rows:
-        try:
-            transactions.append(RawTransactionSwedbank.model_validate(row))
-        except ValidationError:
-            rejected_count += 1
+    return list(iter_swedbank_statement(statement))
 
-    normalized = [convert_to_standardized_transaction(txn) for txn in transactions]
+
+# Streaming version: rows are validated in batches and yielded one at a time
+def iter_swedbank_statement(statement: BinaryIO) -> Iterator[ImportedTransaction]:
+    imported_count = 0
+    rejected_count = 0
+    for rows in batched(iter_statement_rows(statement), VALIDATION_BATCH_SIZE):
+        transactions, rejected = validate_rows(RAW_ROWS_ADAPTER, rows, is_supported_row)
+        imported_count += len(transactions)
+        rejected_count += rejected
+        for transaction in transactions:
+            yield convert_to_standardized_transaction(transaction)
 
     logger.log(logging.INFO, "### Swedbank Parser finished")
-    logger.log(logging.INFO, f"Imported valid transactions: {len(normalized)}")
+    logger.log(logging.INFO, f"Imported valid transactions: {imported_count}")
     logger.log(logging.INFO, f"Rejected rows: {rejected_count}")
 
-    return normalized
-
 
 def get_statement_rows(statement: BinaryIO) -> list[dict[str, Any]]:
+    return list(iter_statement_rows(statement))
+
+
+def iter_statement_rows(statement: BinaryIO) -> Iterator[dict[str, Any]]:
     # Input: csv file data
-    # Output: list of dictionaries (mapping each column to value) - 1 for each row in csv
+    # Output: dictionaries (mapping each column to value) - 1 for each row in csv
     text_reader = TextIOWrapper(statement)
-    dict_reader = DictReader(text_reader)
-    return [txn_as_dict for txn_as_dict in dict_reader]
+    yield from DictReader(text_reader)
 
 
 class RawTransactionSwedbank(BaseModel):
@@ -68,7 +85,7 @@ class RawTransactionSwedbank(BaseModel):
     @field_validator("side")
     @classmethod
     def debit_or_credit(cls, value: str) -> str:
-        if value.upper() not in {"D", "K"}:
+        if value.upper() not in SIDES:
             raise ValueError(f"Invalid Debit/Credit value: {value}")
 
         return value
@@ -77,15 +94,26 @@ class RawTransactionSwedbank(BaseModel):
     def is_valid_transaction(self) -> "RawTransactionSwedbank":
         # Exclude entries such as total amount spent during period.
         # Such transactions contain patterns like "apyvarta..." in description field
-        for pattern in EXCL_DESCRIPTION_PATTERNS:
-            if re.search(pattern, self.description, re.IGNORECASE) is not None:
-                raise ValueError(
-                    f"Description {self.description} contains excluded pattern: {pattern}"
-                )
+        if EXCL_DESCRIPTION_REGEX.search(self.description) is not None:
+            raise ValueError(f"Description {self.description} is an excluded entry")
 
         return self
 
 
+RAW_ROWS_ADAPTER = TypeAdapter(list[RawTransactionSwedbank])
+
+
+# Same rules as the RawTransactionSwedbank validators, on the raw values.
+# Only rejects rows that would certainly fail validation.
+def is_supported_row(row: Row) -> bool:
+    side = stripped_text(row.get("D/K"))
+    if side is not None and side.upper() not in SIDES:
+        return False
+
+    description = stripped_text(row.get("Paaiškinimai"))
+    return description is None or EXCL_DESCRIPTION_REGEX.search(description) is None
+
+
 def calculate_dedup_key(transaction: RawTransactionSwedbank) -> str:
     dedup_data = str(transaction.unique_id).strip().lower()
 
@@ -0,0 +1,48 @@
+# Responsibility: validate statement rows in batches.
+# Rows go through cheap pre-checks first, then all remaining rows
+# are validated with a single TypeAdapter call.
+from typing import Any, Callable, Sequence, TypeVar
+
+from pydantic import TypeAdapter, ValidationError
+
+T = TypeVar("T")
+
+Row = dict[str, Any]
+
+# Number of rows validated per TypeAdapter call
+VALIDATION_BATCH_SIZE = 5000
+
+# Whitespace removed by str_strip_whitespace, for ASCII text
+ASCII_WHITESPACE = " \t\n\v\f\r"
+
+
+# Returns the validated rows and the number of rejected rows
+def validate_rows(
+    adapter: TypeAdapter[list[T]],
+    rows: Sequence[Row],
+    precheck: Callable[[Row], bool],
+) -> tuple[list[T], int]:
+    # 1. Rows that certainly fail validation are rejected without building a model
+    candidates = [row for row in rows if precheck(row)]
+
+    # 2. Whole batch in one call. If some rows are invalid,
+    # they are dropped using the error locations and the rest is validated again.
+    try:
+        validated = adapter.validate_python(candidates)
+    except ValidationError as e:
+        invalid = {error["loc"][0] for error in e.errors()}
+        candidates = [row for i, row in enumerate(candidates) if i not in invalid]
+        validated = adapter.validate_python(candidates)
+
+    return validated, len(rows) - len(validated)
+
+
+# Text as the raw models see it (stripped), or None if the pre-check can't tell:
+# not a string, or non-ASCII ends where pydantic strips more than ASCII whitespace.
+def stripped_text(value: Any) -> str | None:
+    if type(value) is not str:
+        return None
+    stripped = value.strip(ASCII_WHITESPACE)
+    if stripped and not (stripped[0].isascii() and stripped[-1].isascii()):
+        return None
+    return stripped
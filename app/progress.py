@@ -0,0 +1,108 @@
+# Responsibility: in-process pub/sub of job progress. Jobs publish from the
+# thread running them; subscribers are API requests streaming the events to
+# clients (asyncio). Recent events are kept, so that a client connecting
+# mid-job first gets what it missed.
+# Jobs running in worker processes publish to their own process only: the
+# events endpoint falls back to the job status in the database for them.
+import asyncio
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from uuid import UUID
+
+from app.project_types import JobStage
+
+# Jobs whose events are kept, most recently updated first out
+MAX_TRACKED_JOBS = 1000
+TERMINAL_STAGES = {JobStage.COMPLETED, JobStage.FAILED}
+
+
+@dataclass(frozen=True, slots=True)
+class ProgressEvent:
+    job_id: UUID
+    stage: JobStage
+    # Rows at this stage. In streaming mode, the running total over the chunks.
+    row_count: int | None = None
+    duplicate_count: int | None = None
+    failure_reason: str | None = None
+
+    def to_json(self) -> dict[str, str | int]:
+        return {
+            key: str(value) if isinstance(value, UUID) else value
+            for key, value in asdict(self).items()
+            if value is not None
+        }
+
+
+class Subscription:
+    def __init__(
+        self,
+        broker: "ProgressBroker",
+        job_id: UUID,
+        history: list[ProgressEvent],
+        loop: asyncio.AbstractEventLoop,
+    ):
+        self.job_id = job_id
+        # Events published before the subscription
+        self.history = history
+        self._broker = broker
+        self._loop = loop
+        self._queue: asyncio.Queue[ProgressEvent] = asyncio.Queue()
+
+    async def get(self) -> ProgressEvent:
+        return await self._queue.get()
+
+    def close(self) -> None:
+        self._broker._unsubscribe(self)
+
+    # Called from the publishing thread
+    def _deliver(self, event: ProgressEvent) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+        except RuntimeError:
+            # The event loop was closed (shutdown)
+            pass
+
+
+class ProgressBroker:
+    def __init__(self) -> None:
+        self._history: OrderedDict[UUID, list[ProgressEvent]] = OrderedDict()
+        self._subscriptions: dict[UUID, set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, event: ProgressEvent) -> None:
+        with self._lock:
+            history = self._history.setdefault(event.job_id, [])
+            history.append(event)
+            self._history.move_to_end(event.job_id)
+            if len(self._history) > MAX_TRACKED_JOBS:
+                self._history.popitem(last=False)
+            subscriptions = list(self._subscriptions.get(event.job_id, ()))
+        for subscription in subscriptions:
+            subscription._deliver(event)
+
+    # Must be called from the event loop the events are consumed in
+    def subscribe(self, job_id: UUID) -> Subscription:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            subscription = Subscription(
+                self, job_id, list(self._history.get(job_id, [])), loop
+            )
+            self._subscriptions.setdefault(job_id, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.job_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.job_id]
+
+
+_progress_broker = ProgressBroker()
+
+
+# Process-wide broker shared by the jobs and the events endpoint
+def get_progress_broker() -> ProgressBroker:
+    return _progress_broker
@@ -1,8 +1,8 @@
 import datetime as dt
+from dataclasses import dataclass
 from decimal import Decimal
 from enum import StrEnum
-
-from pydantic import BaseModel
+from uuid import UUID
 
 
 class StatementSource(StrEnum):
@@ -17,6 +17,33 @@ class JobStatus(StrEnum):
     FAILED = "failed"
 
 
+# Progress of a running job, reported to clients following the job
+class JobStage(StrEnum):
+    STARTED = "started"
+    DOWNLOADED = "downloaded"
+    PARSED = "parsed"
+    FILTERED = "filtered"
+    ENRICHED = "enriched"
+    INSERTED = "inserted"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+# Timed steps of the ingest pipeline, see app.metrics
+class PipelineStage(StrEnum):
+    DOWNLOAD = "download"
+    PARSE = "parse"
+    FILTER = "filter"
+    ENRICH = "enrich"
+    # Includes dedup: duplicates are skipped by the database
+    INSERT = "insert"
+
+
+class ExportFormat(StrEnum):
+    CSV = "csv"
+    PARQUET = "parquet"
+
+
 class Side(StrEnum):
     DEBIT = "debit"
     CREDIT = "credit"
@@ -35,7 +62,10 @@ class TransactionType(StrEnum):
     OTHER = "other"
 
 
-class ImportedTransaction(BaseModel):
+# Records passed between the pipeline stages. Values are validated
+# by the parsers' raw models, so the records don't validate again.
+@dataclass(slots=True, kw_only=True)
+class ImportedTransaction:
     transaction_datetime: dt.datetime
     type: TransactionType
     counterparty: str
@@ -45,3 +75,34 @@ class ImportedTransaction(BaseModel):
     source: TransactionSource
     note: str | None = None
     dedup_key: str
+
+
+# Imported transaction with the values added by enrichment.
+# Database rows (and ORM objects) are only built for the ones that get inserted.
+@dataclass(slots=True, kw_only=True)
+class EnrichedTransaction(ImportedTransaction):
+    eur_amount: Decimal | None
+    category: str | None = None
+    sub_category: str | None = None
+    detail: str | None = None
+    meal_type: str | None = None
+    job_id: UUID
+    user_id: UUID
+
+
+# Wall time of a pipeline stage and the rows it produced (the rows written or
+# skipped as duplicates for the insert). The download has no row count.
+@dataclass(slots=True)
+class StageTiming:
+    stage: PipelineStage
+    seconds: float = 0.0
+    row_count: int | None = None
+
+    def add_rows(self, count: int) -> None:
+        self.row_count = (self.row_count or 0) + count
+
+    @property
+    def rows_per_second(self) -> float | None:
+        if self.row_count is None or self.seconds <= 0:
+            return None
+        return self.row_count / self.seconds
@@ -0,0 +1,39 @@
+# Responsibility: track the start-up of the components requests depend on,
+# for the readiness endpoint. In fast-start mode they are started in the
+# background, after the API already accepts requests.
+import threading
+from enum import StrEnum
+
+
+class ComponentStatus(StrEnum):
+    STARTING = "starting"
+    READY = "ready"
+    FAILED = "failed"
+
+
+class Readiness:
+    def __init__(self, *components: str):
+        self._statuses = {component: ComponentStatus.STARTING for component in components}
+        self._errors: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def mark_ready(self, component: str) -> None:
+        with self._lock:
+            self._statuses[component] = ComponentStatus.READY
+
+    def mark_failed(self, component: str, error: Exception) -> None:
+        with self._lock:
+            self._statuses[component] = ComponentStatus.FAILED
+            self._errors[component] = str(error)
+
+    def is_ready(self, component: str) -> bool:
+        with self._lock:
+            return self._statuses.get(component) == ComponentStatus.READY
+
+    def report(self) -> dict[str, dict[str, str]]:
+        with self._lock:
+            return {
+                component: {"status": status}
+                | ({"error": self._errors[component]} if component in self._errors else {})
+                for component, status in self._statuses.items()
+            }
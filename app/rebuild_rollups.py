@@ -0,0 +1,34 @@
+# Responsibility: recompute the monthly spending rollups from the transactions,
+# e.g. after the rollups table was added or transactions were changed by hand.
+# Usage: spending-tracker-rebuild-rollups [--user-id UUID]
+#        (or python -m app.rebuild_rollups)
+import argparse
+import logging
+from uuid import UUID
+
+from sqlmodel import create_engine
+
+from app.config import AppConfig
+from app.db.schema import check_schema
+from app.db.summaries import rebuild_rollups
+from app.logging_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--user-id", type=UUID, help="Only the rollups of this user")
+    args = parser.parse_args()
+
+    configure_logging()
+    app_config = AppConfig()  # type: ignore
+
+    db = create_engine(app_config.db_connection_string)
+    check_schema(db)
+    rows = rebuild_rollups(db, user_id=args.user_id)
+    logger.log(logging.INFO, f"Rebuilt monthly spending rollups ({rows} rows)")
+
+
+if __name__ == "__main__":
+    main()
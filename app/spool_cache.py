@@ -0,0 +1,125 @@
+# Responsibility: keep uploaded statements on local disk for a while, so that
+# a job running on the same node doesn't download the file it just uploaded.
+# Storage stays the source of truth: a miss falls back to downloading.
+# The cache is only a directory, so it's shared by all processes of the node
+# (API and workers). The modification time of an entry is its last use.
+import datetime as dt
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+
+from app.config import AppConfig
+
+logger = logging.getLogger(__name__)
+
+
+class SpoolCache:
+    def __init__(self, directory: Path, max_bytes: int, ttl: dt.timedelta):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._directory.mkdir(parents=True, exist_ok=True)
+
+    # Returns a writer for a new entry. The entry is only visible after commit().
+    def open_entry(self, key: str) -> "SpoolEntry":
+        return SpoolEntry(self, key)
+
+    def get(self, key: str) -> BytesIO | None:
+        entry_path = self._entry_path(key)
+        try:
+            modified_at = entry_path.stat().st_mtime
+            if time.time() - modified_at > self._ttl.total_seconds():
+                entry_path.unlink(missing_ok=True)
+                return None
+            data = entry_path.read_bytes()
+            # Mark as recently used
+            os.utime(entry_path)
+        except FileNotFoundError:
+            return None
+        return BytesIO(data)
+
+    def remove(self, key: str) -> None:
+        self._entry_path(key).unlink(missing_ok=True)
+
+    def _entry_path(self, key: str) -> Path:
+        return self._directory / hashlib.sha256(key.encode()).hexdigest()
+
+    def _commit(self, temp_path: Path, key: str, size: int) -> None:
+        if size > self._max_bytes:
+            temp_path.unlink(missing_ok=True)
+            return
+        os.replace(temp_path, self._entry_path(key))
+        self._evict()
+
+    # Removes expired entries, then the least recently used ones over the budget
+    def _evict(self) -> None:
+        with self._lock:
+            now = time.time()
+            entries = []
+            for entry in os.scandir(self._directory):
+                try:
+                    stat = entry.stat()
+                    # Writes left behind by a process that died
+                    if entry.name.startswith("."):
+                        if now - stat.st_mtime > self._ttl.total_seconds():
+                            os.unlink(entry.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total_bytes = sum(size for _, size, _ in entries)
+            for modified_at, size, path in sorted(entries):
+                expired = now - modified_at > self._ttl.total_seconds()
+                if not expired and total_bytes <= self._max_bytes:
+                    continue
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total_bytes -= size
+
+
+class SpoolEntry:
+    def __init__(self, cache: SpoolCache, key: str):
+        self._cache = cache
+        self._key = key
+        self._size = 0
+        # Dot files are in-progress writes, skipped by eviction and lookups
+        file_descriptor, temp_path = tempfile.mkstemp(
+            dir=cache._directory, prefix="."
+        )
+        self._file = os.fdopen(file_descriptor, "wb")
+        self._temp_path = Path(temp_path)
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._size += len(data)
+
+    def commit(self) -> None:
+        self._file.close()
+        self._cache._commit(self._temp_path, self._key, self._size)
+
+    def discard(self) -> None:
+        self._file.close()
+        self._temp_path.unlink(missing_ok=True)
+
+
+def create_spool_cache(app_config: AppConfig) -> SpoolCache | None:
+    if app_config.spool_cache_max_bytes <= 0:
+        return None
+    try:
+        return SpoolCache(
+            directory=Path(app_config.spool_cache_dir),
+            max_bytes=app_config.spool_cache_max_bytes,
+            ttl=dt.timedelta(seconds=app_config.spool_cache_ttl_seconds),
+        )
+    except OSError as e:
+        logger.log(logging.WARNING, f"Statement spool cache disabled: {e}")
+        return None
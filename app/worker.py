@@ -0,0 +1,148 @@
+# Responsibility: standalone worker process running queued ingest jobs.
+# Any number of workers (processes or nodes) can share the same jobs table.
+# Usage: spending-tracker-worker (or python -m app.worker)
+import datetime as dt
+import logging
+import signal
+import threading
+from types import FrameType
+
+from sqlalchemy import Engine
+from sqlmodel import create_engine
+
+from app.config import AppConfig
+from app.db.jobs import (
+    claim_batch_jobs,
+    claim_next_job,
+    get_worker_id,
+    requeue_expired_jobs,
+)
+from app.db.schema import check_schema
+from app.executor import shutdown_pool
+from app.file_storage import FileStorage
+from app.fx_rates import get_rate_store
+from app.http_clients import create_http_client, create_supabase_client
+from app.logging_config import configure_logging
+from app.metrics import get_metrics, start_metrics_server
+from app.orchestration import process_batch, process_job
+from app.spool_cache import create_spool_cache
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    def __init__(self, db: Engine, file_storage: FileStorage, app_config: AppConfig):
+        self._db = db
+        self._file_storage = file_storage
+        self._app_config = app_config
+        self._worker_id = get_worker_id()
+        self._lease_duration = dt.timedelta(seconds=app_config.job_lease_seconds)
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        logger.log(logging.INFO, f"Worker {self._worker_id} started")
+        while not self._stop_event.is_set():
+            if not self.run_once():
+                self._stop_event.wait(self._app_config.job_poll_interval_seconds)
+        logger.log(logging.INFO, f"Worker {self._worker_id} stopped")
+
+    # Runs the next queued job. Returns False if the queue was empty.
+    def run_once(self) -> bool:
+        requeued = requeue_expired_jobs(
+            self._db, max_attempts=self._app_config.job_max_attempts
+        )
+        if requeued:
+            logger.log(logging.INFO, f"Requeued {requeued} jobs with expired leases")
+
+        job = claim_next_job(
+            self._db, worker_id=self._worker_id, lease_duration=self._lease_duration
+        )
+        if not job:
+            return False
+
+        # The other pending jobs of its batch are run with it
+        if job.batch_id is not None:
+            batch_jobs = claim_batch_jobs(
+                job.batch_id,
+                db=self._db,
+                worker_id=self._worker_id,
+                lease_duration=self._lease_duration,
+            )
+            process_batch(
+                [job, *batch_jobs],
+                db=self._db,
+                file_storage=self._file_storage,
+                app_config=self._app_config,
+            )
+            return True
+
+        process_job(
+            job,
+            db=self._db,
+            file_storage=self._file_storage,
+            app_config=self._app_config,
+        )
+        return True
+
+    # Runs the queued jobs until the queue is empty
+    def drain(self) -> None:
+        while not self._stop_event.is_set() and self.run_once():
+            pass
+
+    # The current job is finished before the worker stops
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+def main() -> None:
+    configure_logging()
+
+    # 1. Initialize app config
+    app_config = AppConfig()  # type: ignore
+
+    # 2. Initialize database client
+    # Schema changes are made by spending-tracker-migrate
+    db = create_engine(app_config.db_connection_string)
+    check_schema(db)
+
+    # 3. Initialize file storage with the service role supabase client. Statements
+    # uploaded through an API process on this node are read from the spool cache.
+    http_client = create_http_client(app_config)
+    supabase_admin = create_supabase_client(
+        app_config, app_config.supabase_admin_key, http_client=http_client
+    )
+    file_storage = FileStorage(
+        supabase_admin, spool_cache=create_spool_cache(app_config)
+    )
+
+    # 4. Load exchange rates in the background and keep them fresh
+    rate_store = get_rate_store(app_config)
+    rate_store.start()
+
+    # 5. Metrics of the jobs run by this worker
+    metrics_server = None
+    if app_config.metrics_enabled:
+        get_metrics().enabled = True
+        metrics_server = start_metrics_server(app_config.worker_metrics_port)
+
+    worker = Worker(db=db, file_storage=file_storage, app_config=app_config)
+
+    def handle_signal(signum: int, frame: FrameType | None) -> None:
+        logger.log(logging.INFO, f"Received signal {signum}, stopping")
+        worker.stop()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    try:
+        worker.run()
+    finally:
+        if metrics_server:
+            metrics_server.shutdown()
+        shutdown_pool()
+        rate_store.stop()
+        http_client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# Compares the row-wise and columnar engines for parse -> filter -> enrich
+# on generated statements. Uses the exchange rates bundled with currency_converter.
+# Usage: python -m benchmarks.bench_engines [--sizes 10000 100000]
+import argparse
+import csv
+import datetime as dt
+import io
+import logging
+import random
+import time
+import uuid
+from typing import Callable
+
+import openpyxl
+from currency_converter import CURRENCY_FILE
+
+from app.columnar import enrich_statement
+from app.config import PipelineEngine
+from app.enrichment import enrich_transactions
+from app.filters import apply_filters
+from app.fx_rates import RateStore, RateTable
+from app.parsers.registry import get_parser
+from app.project_types import StatementSource
+
+DEFAULT_SIZES = [10_000, 100_000]
+COUNTERPARTIES = ["Lidl", "Caffeine", "Netflix", "Wolt", "Spirgis", "TO GBP", "Shop"]
+
+
+class FixedRateStore(RateStore):
+    def __init__(self, rate_table: RateTable):
+        super().__init__(snapshot_path=None, refresh_interval=dt.timedelta(0))
+        self._rate_table = rate_table
+
+
+def make_revolut_statement(count: int) -> bytes:
+    rng = random.Random(1)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(
+        ["Type", "Product", "Started Date", "Completed Date", "Description"]
+        + ["Amount", "Fee", "Currency", "State", "Balance"]
+    )
+    start = dt.datetime(2020, 1, 1)
+    for i in range(count):
+        started_at = start + dt.timedelta(minutes=5 * i)
+        sheet.append(
+            [
+                rng.choice(["Card Payment", "Card Payment", "Transfer", "ATM"]),
+                "Current",
+                started_at,
+                started_at,
+                rng.choice(COUNTERPARTIES),
+                round(rng.uniform(-80, 20), 2),
+                0,
+                rng.choice(["EUR", "EUR", "USD", "GBP"]),
+                "COMPLETED",
+                round(rng.uniform(0, 1000), 2),
+            ]
+        )
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def make_swedbank_statement(count: int) -> bytes:
+    rng = random.Random(2)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(
+        ["Data", "Gavėjas", "Paaiškinimai", "Suma", "Valiuta", "D/K", "Įrašo Nr.", "Kodas"]
+    )
+    start = dt.date(2020, 1, 1)
+    for i in range(count):
+        writer.writerow(
+            [
+                (start + dt.timedelta(days=i // 20)).isoformat(),
+                rng.choice(COUNTERPARTIES),
+                rng.choice(["Pirkinys", "grynieji pinigai", "Apyvarta"]),
+                f"{rng.uniform(1, 99):.2f}",
+                "EUR",
+                rng.choice(["D", "K"]),
+                f"{i:012d}",
+                rng.choice(["K", "MK"]),
+            ]
+        )
+    return buffer.getvalue().encode("utf-8")
+
+
+STATEMENT_FACTORIES: dict[StatementSource, Callable[[int], bytes]] = {
+    StatementSource.REVOLUT: make_revolut_statement,
+    StatementSource.SWEDBANK: make_swedbank_statement,
+}
+
+
+def run_engine(
+    engine: PipelineEngine,
+    statement: bytes,
+    statement_source: StatementSource,
+    rate_table: RateTable,
+) -> int:
+    job_id, user_id = uuid.uuid4(), uuid.uuid4()
+    if engine == PipelineEngine.COLUMNAR:
+        enriched = enrich_statement(
+            io.BytesIO(statement),
+            statement_source=statement_source,
+            job_id=job_id,
+            user_id=user_id,
+            rate_table=rate_table,
+        )
+    else:
+        parser = get_parser(statement_source)
+        assert parser is not None
+        filtered = apply_filters(parser(io.BytesIO(statement))).transactions
+        enriched = enrich_transactions(
+            filtered,
+            job_id=job_id,
+            user_id=user_id,
+            rate_store=FixedRateStore(rate_table),
+        )
+    return len(enriched)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument(
+        "--sources", nargs="+", default=[source.value for source in StatementSource]
+    )
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    rate_table = RateTable.from_file(CURRENCY_FILE)
+
+    print(f"{'rows':>10} {'source':>9} {'engine':>9} {'seconds':>9} {'rows/s':>10}")
+    for size in args.sizes:
+        for source in args.sources:
+            statement_source = StatementSource(source)
+            statement = STATEMENT_FACTORIES[statement_source](size)
+            for engine in PipelineEngine:
+                started = time.perf_counter()
+                run_engine(engine, statement, statement_source, rate_table)
+                elapsed = time.perf_counter() - started
+                print(
+                    f"{size:>10} {source:>9} {engine.value:>9} "
+                    f"{elapsed:>9.2f} {size / elapsed:>10.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
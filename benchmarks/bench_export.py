@@ -0,0 +1,99 @@
+# Measures the peak memory and the speed of transaction exports as the number
+# of exported rows grows. With the streaming export, peak memory should stay
+# the same. Each export runs in a fresh interpreter, so its peak RSS is its own.
+# Usage: python -m benchmarks.bench_export --db postgresql://...
+#        [--sizes 100000 1000000] [--formats csv parquet]
+# WARNING: drops and recreates the app tables in the target database.
+import argparse
+import json
+import subprocess
+import sys
+import uuid
+
+from sqlalchemy import text
+from sqlmodel import create_engine, SQLModel
+
+from app.db import jobs  # noqa: F401 - registers the jobs table for the FK
+from app.db.transactions import Transaction  # noqa: F401
+
+DEFAULT_SIZES = [100_000, 500_000, 2_000_000]
+
+INSERT_ROWS = """
+INSERT INTO transactions (
+    id, transaction_datetime, type, counterparty, orig_amount, orig_currency,
+    side, source, eur_amount, manually_added, category, refunded_eur_amount,
+    dedup_key, user_id
+)
+SELECT
+    gen_random_uuid(),
+    timestamp '2020-01-01' + n * interval '1 minute',
+    'CARD_PAYMENT',
+    'merchant ' || (n % 500),
+    (n % 10000) / 100.0,
+    'EUR',
+    'DEBIT',
+    'REVOLUT',
+    (n % 10000) / 100.0,
+    FALSE,
+    'Groceries',
+    0,
+    :user_id || '_' || n,
+    CAST(:user_id AS uuid)
+FROM generate_series(1, :rows) AS n
+"""
+
+RUN_EXPORT = """
+import json, resource, sys, time, uuid
+from sqlmodel import create_engine
+from app.db.transactions import TransactionQuery
+from app.export import export_transactions
+from app.project_types import ExportFormat
+
+db_url, user_id, export_format = sys.argv[1:4]
+db = create_engine(db_url)
+start = time.perf_counter()
+size = 0
+for chunk in export_transactions(
+    db, TransactionQuery(uuid.UUID(user_id)), ExportFormat(export_format), 5000
+):
+    size += len(chunk)
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "bytes": size,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True, help="Postgres connection string")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--formats", nargs="+", default=["csv", "parquet"])
+    args = parser.parse_args()
+
+    engine = create_engine(args.db)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+
+    print(f"{'rows':>9} {'format':>8} {'seconds':>8} {'MB out':>8} {'peak RSS MB':>12}")
+    for size in args.sizes:
+        user_id = str(uuid.uuid4())
+        with engine.begin() as connection:
+            connection.execute(text(INSERT_ROWS), {"user_id": user_id, "rows": size})
+        for export_format in args.formats:
+            result = subprocess.run(
+                [sys.executable, "-c", RUN_EXPORT, args.db, user_id, export_format],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            run = json.loads(result.stdout.strip().splitlines()[-1])
+            print(
+                f"{size:>9} {export_format:>8} {run['seconds']:>8.1f} "
+                f"{run['bytes'] / 1e6:>8.1f} {run['peak_rss_mb']:>12.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Compares the insert paths of `insert_transactions` on a Postgres database.
+# Usage: python -m benchmarks.bench_insert --db postgresql://... [--sizes 10000 100000]
+# WARNING: drops and recreates the app tables in the target database.
+import argparse
+import datetime as dt
+import time
+import uuid
+from decimal import Decimal
+
+from sqlalchemy import text
+from sqlmodel import create_engine, SQLModel
+
+from app.config import InsertMode
+from app.db import jobs  # noqa: F401 - registers the jobs table for the FK
+from app.db.transactions import insert_transactions
+from app.project_types import (
+    EnrichedTransaction,
+    Side,
+    TransactionSource,
+    TransactionType,
+)
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def make_transactions(count: int, user_id: uuid.UUID) -> list[EnrichedTransaction]:
+    start = dt.datetime(2020, 1, 1)
+    job_id = uuid.uuid4()
+    return [
+        EnrichedTransaction(
+            transaction_datetime=start + dt.timedelta(minutes=i),
+            type=TransactionType.CARD_PAYMENT,
+            counterparty=f"merchant {i % 500}",
+            orig_amount=Decimal(i % 10_000) / 100,
+            orig_currency="EUR",
+            side=Side.DEBIT,
+            source=TransactionSource.REVOLUT,
+            eur_amount=Decimal(i % 10_000) / 100,
+            category="Groceries",
+            dedup_key=f"{user_id}_{i}",
+            job_id=job_id,
+            user_id=user_id,
+        )
+        for i in range(count)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True, help="Postgres connection string")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument(
+        "--modes", nargs="+", default=[mode.value for mode in InsertMode]
+    )
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    engine = create_engine(args.db)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+
+    print(f"{'rows':>10} {'mode':>8} {'seconds':>9} {'rows/s':>10}")
+    for size in args.sizes:
+        transactions = make_transactions(size, uuid.uuid4())
+        for mode in args.modes:
+            with engine.begin() as connection:
+                connection.execute(text("TRUNCATE transactions"))
+
+            started = time.perf_counter()
+            inserted = insert_transactions(
+                transactions, engine, InsertMode(mode), args.chunk_size
+            )
+            elapsed = time.perf_counter() - started
+            assert len(inserted) == size
+
+            print(f"{size:>10} {mode:>8} {elapsed:>9.2f} {size / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
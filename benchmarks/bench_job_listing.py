@@ -0,0 +1,105 @@
+# Measures the latency of job listing pages as the number of jobs of a user
+# grows: the first page, a page deep in the listing (keyset cursor) and a page
+# filtered by status. With the composite indexes it should stay flat.
+# Usage: python -m benchmarks.bench_job_listing --db postgresql://... [--sizes 100 1000 10000]
+#        [--without-indexes] to compare with the listing indexes dropped
+# WARNING: drops and recreates the app tables in the target database.
+import argparse
+import datetime as dt
+import statistics
+import time
+import uuid
+from typing import Callable
+
+from sqlalchemy import insert, text
+from sqlmodel import create_engine, SQLModel
+
+from app.db import transactions  # noqa: F401 - registers the transactions table
+from app.db.jobs import IngestJob, list_jobs
+from app.project_types import JobStatus, StatementSource
+
+DEFAULT_SIZES = [100, 1_000, 10_000, 50_000]
+LISTING_INDEXES = [
+    "ix_jobs_user_created",
+    "ix_jobs_user_status_created",
+    "ix_jobs_user_source_created",
+]
+# Jobs of other users, so the table is never just the measured user's
+OTHER_USERS = 20
+PAGE_SIZE = 50
+REPEATS = 50
+
+
+def add_jobs(engine, user_id: uuid.UUID, count: int) -> None:
+    start = dt.datetime(2020, 1, 1)
+    statuses = [JobStatus.COMPLETED] * 8 + [JobStatus.FAILED, JobStatus.PENDING]
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "user_id": user_id,
+            "statement_source": StatementSource.REVOLUT,
+            "file_path": f"{user_id}/statement_{i}.xlsx",
+            "created_at": start + dt.timedelta(minutes=i),
+            "status": statuses[i % len(statuses)],
+            "attempts": 1,
+        }
+        for i in range(count)
+    ]
+    with engine.begin() as connection:
+        for offset in range(0, count, 10_000):
+            connection.execute(insert(IngestJob), rows[offset : offset + 10_000])
+
+
+def median_ms(fetch: Callable[[], object]) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        fetch()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True, help="Postgres connection string")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--without-indexes", action="store_true")
+    args = parser.parse_args()
+
+    engine = create_engine(args.db)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    if args.without_indexes:
+        with engine.begin() as connection:
+            for index in LISTING_INDEXES:
+                connection.execute(text(f"DROP INDEX {index}"))
+
+    print(f"{'jobs':>8} {'first ms':>9} {'deep ms':>9} {'failed ms':>10}")
+    for size in args.sizes:
+        with engine.begin() as connection:
+            connection.execute(text("TRUNCATE jobs CASCADE"))
+        user_id = uuid.uuid4()
+        add_jobs(engine, user_id, size)
+        for _ in range(OTHER_USERS):
+            add_jobs(engine, uuid.uuid4(), size)
+        with engine.begin() as connection:
+            connection.execute(text("ANALYZE jobs"))
+
+        # Cursor of a page 90% into the listing
+        deep_jobs = list_jobs(engine, user_id, limit=int(size * 0.9))
+        deep_cursor = (deep_jobs[-1].created_at, deep_jobs[-1].id)
+
+        first = median_ms(lambda: list_jobs(engine, user_id, limit=PAGE_SIZE))
+        deep = median_ms(
+            lambda: list_jobs(engine, user_id, limit=PAGE_SIZE, after=deep_cursor)
+        )
+        failed = median_ms(
+            lambda: list_jobs(
+                engine, user_id, limit=PAGE_SIZE, status=JobStatus.FAILED
+            )
+        )
+        print(f"{size:>8} {first:>9.2f} {deep:>9.2f} {failed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
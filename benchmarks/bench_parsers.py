@@ -0,0 +1,76 @@
+# Per-row cost of validating statement rows: one model_validate call per row
+# (previous approach) against batch validation with pre-checks.
+# Usage: python -m benchmarks.bench_parsers [--rows 50000] [--repeat 5]
+import argparse
+import gc
+import io
+import time
+from typing import Any, Callable
+
+from pydantic import BaseModel, ValidationError
+
+from app.parsers import revolut, swedbank
+from app.parsers.validation import validate_rows
+from benchmarks.bench_engines import make_revolut_statement, make_swedbank_statement
+
+PARSERS: dict[str, tuple[Any, type[BaseModel], Callable[[int], bytes]]] = {
+    "revolut": (revolut, revolut.RawTransactionRevolut, make_revolut_statement),
+    "swedbank": (swedbank, swedbank.RawTransactionSwedbank, make_swedbank_statement),
+}
+
+
+def validate_per_row(raw_model: type[BaseModel], rows: list[dict]) -> list:
+    validated = []
+    for row in rows:
+        try:
+            validated.append(raw_model.model_validate(row))
+        except ValidationError:
+            pass
+    return validated
+
+
+def validate_batch(parser_module: Any, rows: list[dict]) -> list:
+    validated, _ = validate_rows(
+        parser_module.RAW_ROWS_ADAPTER, rows, parser_module.is_supported_row
+    )
+    return validated
+
+
+def best_time(run: Callable[[], Any], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'source':>9} {'stage':>10} {'us/row':>8}")
+    for source, (parser_module, raw_model, make_statement) in PARSERS.items():
+        statement = make_statement(args.rows)
+        rows = parser_module.get_statement_rows(io.BytesIO(statement))
+        validated = validate_batch(parser_module, rows)
+        assert len(validated) == len(validate_per_row(raw_model, rows))
+        gc.freeze()
+
+        stages: dict[str, Callable[[], Any]] = {
+            "per-row": lambda: validate_per_row(raw_model, rows),
+            "batch": lambda: validate_batch(parser_module, rows),
+            "convert": lambda: [
+                parser_module.convert_to_standardized_transaction(transaction)
+                for transaction in validated
+            ],
+        }
+        for stage, run in stages.items():
+            elapsed = best_time(run, args.repeat)
+            print(f"{source:>9} {stage:>10} {elapsed / len(rows) * 1e6:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
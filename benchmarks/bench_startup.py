@@ -0,0 +1,69 @@
+# Measures the cold start of the API: import of app.main, time until requests
+# are accepted (lifespan start-up done) and time until /ready reports ready.
+# Each run is a fresh interpreter.
+# Usage: python -m benchmarks.bench_startup --db postgresql://... [--runs 5]
+# The database schema must be up to date (spending-tracker-migrate).
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RUN_STARTUP = """
+import json, time
+start = time.perf_counter()
+from fastapi.testclient import TestClient
+from app.main import app
+imported = time.perf_counter()
+with TestClient(app) as client:
+    accepting = time.perf_counter()
+    while client.get("/ready").status_code != 200:
+        time.sleep(0.01)
+    ready = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "accepting": accepting - start,
+    "ready": ready - start,
+}))
+"""
+
+
+def measure(env: dict[str, str]) -> dict[str, float]:
+    result = subprocess.run(
+        [sys.executable, "-c", RUN_STARTUP],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True, help="Postgres connection string")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    base_env = {
+        **os.environ,
+        "DB_CONNECTION_STRING": args.db,
+        # Not contacted at start-up
+        "SUPABASE_URL": os.environ.get("SUPABASE_URL", "http://127.0.0.1:9"),
+        "SUPABASE_ANON_KEY": os.environ.get("SUPABASE_ANON_KEY", "anon"),
+        "SUPABASE_ADMIN_KEY": os.environ.get("SUPABASE_ADMIN_KEY", "admin"),
+    }
+    for fast_start in ["false", "true"]:
+        runs = [measure({**base_env, "FAST_START": fast_start}) for _ in range(args.runs)]
+        medians = {
+            stage: statistics.median(run[stage] for run in runs) for stage in runs[0]
+        }
+        print(
+            f"fast_start={fast_start:<5} "
+            + " ".join(f"{stage}={seconds:.3f}s" for stage, seconds in medians.items())
+        )
+
+
+if __name__ == "__main__":
+    main()
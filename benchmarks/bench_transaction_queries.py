@@ -0,0 +1,165 @@
+# Load test of the transaction queries: the table grows to a few million rows
+# across many users, and after each step random users run the queries of the
+# transactions endpoint. With the composite and partial indexes, the p95
+# latency should stay flat as the table grows.
+# Usage: python -m benchmarks.bench_transaction_queries --db postgresql://...
+#        [--steps 1000000 2000000 4000000] [--rows-per-user 2000] [--queries 500]
+#        [--without-indexes] to compare with the query indexes dropped
+# WARNING: drops and recreates the app tables in the target database.
+import argparse
+import datetime as dt
+import hashlib
+import random
+import statistics
+import time
+import uuid
+
+from sqlalchemy import Engine, text
+from sqlmodel import create_engine, SQLModel
+
+from app.db import jobs  # noqa: F401 - registers the jobs table for the FK
+from app.db.transactions import list_transactions, TransactionQuery
+from app.project_types import Side, TransactionSource
+
+DEFAULT_STEPS = [1_000_000, 2_000_000, 4_000_000]
+QUERY_INDEXES = [
+    "ix_transactions_user_datetime",
+    "ix_transactions_user_category_datetime",
+    "ix_transactions_user_source_datetime",
+    "ix_transactions_user_credits_datetime",
+]
+CATEGORIES = ["Groceries", "Restaurants", "Transport", "Housing", "Travel", "Health"]
+# Transactions of a user are spread over this period
+START = dt.datetime(2020, 1, 1)
+DAYS = 4 * 365
+PAGE_SIZE = 50
+
+# Generated in the database: thousands of rows per user, 1 in 10 a credit
+INSERT_USERS = f"""
+INSERT INTO transactions (
+    id, transaction_datetime, type, counterparty, orig_amount, orig_currency,
+    side, source, eur_amount, manually_added, category, refunded_eur_amount,
+    dedup_key, user_id
+)
+SELECT
+    gen_random_uuid(),
+    timestamp '{START.isoformat()}' + random() * interval '{DAYS} days',
+    'CARD_PAYMENT',
+    'merchant ' || (n % 500),
+    (n % 10000) / 100.0,
+    'EUR',
+    (CASE WHEN n % 10 = 0 THEN 'CREDIT' ELSE 'DEBIT' END)::side,
+    (ARRAY['REVOLUT', 'SWEDBANK', 'CASH'])[1 + n % 3]::transactionsource,
+    (n % 10000) / 100.0,
+    FALSE,
+    (ARRAY{CATEGORIES!r})[1 + (n / 7) % {len(CATEGORIES)}],
+    0,
+    u || '_' || n,
+    md5('user' || u)::uuid
+FROM generate_series(:first_user, :last_user) AS u,
+     generate_series(1, :rows_per_user) AS n
+"""
+
+
+def user_id(number: int) -> uuid.UUID:
+    return uuid.UUID(hashlib.md5(f"user{number}".encode()).hexdigest())
+
+
+def random_query(user: uuid.UUID) -> tuple[str, TransactionQuery]:
+    kind = random.choice(["latest", "month", "category", "source", "credits"])
+    if kind == "month":
+        start = START + dt.timedelta(days=random.randrange(DAYS - 30))
+        end = start + dt.timedelta(days=30)
+        return kind, TransactionQuery(user, start=start, end=end)
+    if kind == "category":
+        return kind, TransactionQuery(user, category=random.choice(CATEGORIES))
+    if kind == "source":
+        source = random.choice(list(TransactionSource))
+        return kind, TransactionQuery(user, source=source)
+    if kind == "credits":
+        return kind, TransactionQuery(user, side=Side.CREDIT)
+    return kind, TransactionQuery(user)
+
+
+# Runs the query and, half of the time, the page after it (keyset cursor)
+def timed_query(engine: Engine, transaction_query: TransactionQuery) -> list[float]:
+    timings = []
+    started = time.perf_counter()
+    page = list_transactions(engine, transaction_query, limit=PAGE_SIZE)
+    timings.append(time.perf_counter() - started)
+    if page and random.random() < 0.5:
+        after = (page[-1].transaction_datetime, page[-1].id)
+        started = time.perf_counter()
+        list_transactions(engine, transaction_query, limit=PAGE_SIZE, after=after)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def p95_ms(timings: list[float]) -> float:
+    return statistics.quantiles(timings, n=20)[-1] * 1000
+
+
+def run_queries(engine: Engine, users: int, queries: int) -> dict[str, list[float]]:
+    timings: dict[str, list[float]] = {}
+    for _ in range(queries):
+        kind, transaction_query = random_query(user_id(random.randrange(users)))
+        timings.setdefault(kind, []).extend(timed_query(engine, transaction_query))
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True, help="Postgres connection string")
+    parser.add_argument("--steps", type=int, nargs="+", default=DEFAULT_STEPS)
+    parser.add_argument("--rows-per-user", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--without-indexes", action="store_true")
+    args = parser.parse_args()
+    random.seed(0)
+
+    engine = create_engine(args.db)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    if args.without_indexes:
+        with engine.begin() as connection:
+            for index in QUERY_INDEXES:
+                connection.execute(text(f"DROP INDEX {index}"))
+
+    kinds = ["latest", "month", "category", "source", "credits"]
+    print(
+        f"{'rows':>9} {'users':>6} {'load s':>7} "
+        + " ".join(f"{kind:>9}" for kind in kinds)
+        + f" {'all p95':>8}"
+    )
+    users = 0
+    for step in args.steps:
+        step_users = step // args.rows_per_user
+        started = time.perf_counter()
+        with engine.begin() as connection:
+            connection.execute(
+                text(INSERT_USERS),
+                {
+                    "first_user": users,
+                    "last_user": step_users - 1,
+                    "rows_per_user": args.rows_per_user,
+                },
+            )
+        autocommit_engine = engine.execution_options(isolation_level="AUTOCOMMIT")
+        with autocommit_engine.connect() as connection:
+            connection.execute(text("VACUUM ANALYZE transactions"))
+        load_seconds = time.perf_counter() - started
+        users = step_users
+
+        # Warm-up, then the measured queries
+        run_queries(engine, users, args.queries // 10)
+        timings = run_queries(engine, users, args.queries)
+        all_timings = [t for kind_timings in timings.values() for t in kind_timings]
+        print(
+            f"{step:>9} {users:>6} {load_seconds:>7.1f} "
+            + " ".join(f"{p95_ms(timings[kind]):>9.2f}" for kind in kinds)
+            + f" {p95_ms(all_timings):>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import datetime as dt
+import json
+import time
+import uuid
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.auth import LocalVerificationUnavailable, TokenVerifier
+from app.dependencies import get_authenticated_user, get_authenticated_user_strict
+
+SUPABASE_URL = "https://project.supabase.co"
+SECRET = "super-secret-jwt-token-with-at-least-32-characters"
+USER_ID = uuid.uuid4()
+
+
+def make_verifier(jwt_secret: str | None = SECRET) -> TokenVerifier:
+    return TokenVerifier(
+        supabase_url=SUPABASE_URL,
+        jwt_secret=jwt_secret,
+        token_cache_ttl=dt.timedelta(seconds=60),
+        jwks_cache_ttl=dt.timedelta(minutes=10),
+    )
+
+
+def claims(**overrides) -> dict:
+    return {
+        "sub": str(USER_ID),
+        "aud": "authenticated",
+        "iss": f"{SUPABASE_URL}/auth/v1",
+        "exp": int(time.time()) + 3600,
+        **overrides,
+    }
+
+
+def test_verifies_secret_signed_token():
+    token = jwt.encode(claims(), SECRET, algorithm="HS256")
+    assert make_verifier().verify(token) == USER_ID
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        jwt.encode(claims(exp=int(time.time()) - 10), SECRET, algorithm="HS256"),
+        jwt.encode(claims(aud="anon"), SECRET, algorithm="HS256"),
+        jwt.encode(claims(iss="https://other.supabase.co/auth/v1"), SECRET, algorithm="HS256"),
+        jwt.encode(claims(), "another-secret-with-at-least-32-characters", algorithm="HS256"),
+        jwt.encode(claims(), None, algorithm="none"),
+        # Validly signed, but not for a user
+        jwt.encode(claims(sub="service-account"), SECRET, algorithm="HS256"),
+    ],
+)
+def test_rejects_invalid_tokens(token):
+    with pytest.raises(jwt.InvalidTokenError):
+        make_verifier().verify(token)
+
+
+def test_caches_verified_tokens():
+    verifier = make_verifier()
+    token = jwt.encode(claims(), SECRET, algorithm="HS256")
+    verifier.verify(token)
+
+    # Not decoded again
+    verifier._jwt_secret = "rotated"
+    assert verifier.verify(token) == USER_ID
+
+
+def test_needs_remote_verification_without_secret():
+    token = jwt.encode(claims(), SECRET, algorithm="HS256")
+    with pytest.raises(LocalVerificationUnavailable):
+        make_verifier(jwt_secret=None).verify(token)
+
+
+def test_verifies_token_with_jwks(monkeypatch):
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    jwk = json.loads(jwt.algorithms.ECAlgorithm.to_jwk(private_key.public_key()))
+    verifier = make_verifier(jwt_secret=None)
+    monkeypatch.setattr(
+        verifier._jwks_client,
+        "fetch_data",
+        lambda: {"keys": [{**jwk, "kid": "key-1", "use": "sig", "alg": "ES256"}]},
+    )
+
+    token = jwt.encode(claims(), private_key, algorithm="ES256", headers={"kid": "key-1"})
+    assert verifier.verify(token) == USER_ID
+
+    rotated = jwt.encode(claims(), private_key, algorithm="ES256", headers={"kid": "key-2"})
+    with pytest.raises(LocalVerificationUnavailable):
+        verifier.verify(rotated)
+
+
+# In fast-start mode, until the admin client is started
+def starting_request() -> Request:
+    return Request({"type": "http", "app": FastAPI()})
+
+
+def test_local_verification_without_admin_client():
+    token = jwt.encode(claims(), SECRET, algorithm="HS256")
+    header = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    assert get_authenticated_user(starting_request(), make_verifier(), header) == USER_ID
+
+    # Remote checks wait for the admin client
+    for check in (
+        lambda: get_authenticated_user(
+            starting_request(), make_verifier(jwt_secret=None), header
+        ),
+        lambda: get_authenticated_user_strict(starting_request(), header),
+    ):
+        with pytest.raises(HTTPException) as error:
+            check()
+        assert error.value.status_code == 503
+
+
+def test_token_with_invalid_subject_is_unauthorized():
+    token = jwt.encode(claims(sub="service-account"), SECRET, algorithm="HS256")
+    header = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    with pytest.raises(HTTPException) as error:
+        get_authenticated_user(starting_request(), make_verifier(), header)
+    assert error.value.status_code == 401
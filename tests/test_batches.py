@@ -0,0 +1,323 @@
+import datetime as dt
+import io
+import uuid
+import zipfile
+from decimal import Decimal
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.pool import StaticPool
+from sqlmodel import create_engine, SQLModel
+
+from app import orchestration
+from app.config import AppConfig, JobRunner
+from app.db import transactions  # noqa: F401 - registers the transactions table
+from app.db.jobs import claim_batch_jobs, LeaseHeartbeat, load_batch_jobs
+from app.dependencies import get_authenticated_user, get_authenticated_user_strict
+from app.file_storage import FileStorage
+from app.main import app
+from app.orchestration import PreparedTransactions, process_batch
+from app.parsers.registry import detect_statement_source
+from app.project_types import (
+    EnrichedTransaction,
+    JobStatus,
+    Side,
+    StatementSource,
+    TransactionSource,
+    TransactionType,
+)
+from test_file_storage import FakeTusServer
+
+USER_ID = uuid.uuid4()
+
+
+@pytest.fixture
+def server():
+    return FakeTusServer()
+
+
+@pytest.fixture
+def client(server):
+    db = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(db)
+    upload_client = httpx.AsyncClient(
+        base_url="http://storage", transport=httpx.MockTransport(server.handle)
+    )
+    app.state.app_config = AppConfig(
+        db_connection_string="sqlite://",
+        supabase_url="http://localhost",
+        supabase_anon_key="anon",
+        supabase_admin_key="admin",
+        job_runner=JobRunner.QUEUE,
+        spool_cache_max_bytes=0,
+        batch_max_files=3,
+    )
+    app.state.db_engine = db
+    app.state.file_storage = FileStorage(storage_client=None, upload_client=upload_client)
+    app.dependency_overrides[get_authenticated_user_strict] = lambda: USER_ID
+    app.dependency_overrides[get_authenticated_user] = lambda: USER_ID
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def zip_archive(files: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def transaction(job_id: uuid.UUID, day: int) -> EnrichedTransaction:
+    return EnrichedTransaction(
+        transaction_datetime=dt.datetime(2024, 1, day),
+        type=TransactionType.CARD_PAYMENT,
+        counterparty="merchant",
+        orig_amount=Decimal("10"),
+        orig_currency="EUR",
+        side=Side.DEBIT,
+        source=TransactionSource.REVOLUT,
+        eur_amount=Decimal("10"),
+        dedup_key=f"2024-01-{day}",
+        job_id=job_id,
+        user_id=USER_ID,
+    )
+
+
+def test_detect_statement_source():
+    assert detect_statement_source("2024/revolut.XLSX") == StatementSource.REVOLUT
+    assert detect_statement_source("swedbank.csv") == StatementSource.SWEDBANK
+    assert detect_statement_source("statement.pdf") is None
+
+
+def test_batch_of_files(client, server):
+    response = client.post(
+        "/ingest-batches",
+        files=[
+            ("statement_files", ("january.csv", b"january")),
+            ("statement_files", ("february.xlsx", b"february")),
+        ],
+    )
+
+    assert response.status_code == 202
+    body = response.json()
+    assert [job["status"] for job in body["jobs"]] == ["pending", "pending"]
+    assert [job["statement_source"] for job in body["jobs"]] == ["swedbank", "revolut"]
+    assert sorted(map(bytes, server.uploads.values())) == [b"february", b"january"]
+    jobs = load_batch_jobs(uuid.UUID(body["batch_id"]), app.state.db_engine)
+    assert len(jobs) == 2
+
+
+def test_batch_from_zip_archive(client, server):
+    archive = zip_archive(
+        {
+            "2024/january.csv": b"january",
+            "2024/february.csv": b"february",
+            "__MACOSX/2024/._january.csv": b"metadata",
+        }
+    )
+
+    response = client.post(
+        "/ingest-batches",
+        files={"statement_files": ("statements.zip", archive)},
+        data={"statement_source": "swedbank"},
+    )
+
+    assert response.status_code == 202
+    jobs = response.json()["jobs"]
+    assert len(jobs) == 2
+    assert all("2024_" in job["file_path"] for job in jobs)
+    assert sorted(map(bytes, server.uploads.values())) == [b"february", b"january"]
+
+
+def test_invalid_batches(client):
+    unknown = client.post(
+        "/ingest-batches", files={"statement_files": ("statement.pdf", b"pdf")}
+    )
+    assert unknown.status_code == 400
+    assert "statement.pdf" in unknown.json()["detail"]
+
+    too_many = client.post(
+        "/ingest-batches",
+        files=[("statement_files", (f"{i}.csv", b"%d" % i)) for i in range(4)],
+    )
+    assert too_many.status_code == 400
+
+    bad_zip = client.post(
+        "/ingest-batches", files={"statement_files": ("statements.zip", b"not a zip")}
+    )
+    assert bad_zip.status_code == 400
+
+
+def test_batch_dedups_across_statements(client, monkeypatch):
+    response = client.post(
+        "/ingest-batches",
+        files=[
+            ("statement_files", ("january.csv", b"january")),
+            ("statement_files", ("overlap.csv", b"overlap")),
+            ("statement_files", ("broken.csv", b"broken")),
+        ],
+    )
+    batch_id = response.json()["batch_id"]
+
+    # The second statement repeats two transactions of the first one
+    def prepare_job(job, file_storage, app_config, timer):
+        if job.file_path.endswith("broken.csv"):
+            raise ValueError("Unreadable statement")
+        days = [1, 2, 3] if job.file_path.endswith("january.csv") else [2, 3, 4]
+        return PreparedTransactions(enriched=[transaction(job.id, day) for day in days])
+
+    monkeypatch.setattr(orchestration, "_prepare_job", prepare_job)
+    db = app.state.db_engine
+    jobs = claim_batch_jobs(
+        uuid.UUID(batch_id), db, "worker", lease_duration=dt.timedelta(minutes=5)
+    )
+    process_batch(
+        jobs,
+        db=db,
+        file_storage=app.state.file_storage,
+        app_config=app.state.app_config,
+    )
+
+    batch = client.get(f"/ingest-batches/{batch_id}").json()
+    assert batch["status"] == JobStatus.COMPLETED
+    assert batch["ingested_txn_count"] == 4
+    assert batch["duplicate_txn_count"] == 2
+    assert batch["failed_job_count"] == 1
+    counts = [
+        (job["status"], job.get("ingested_txn_count"), job.get("duplicate_txn_count"))
+        for job in batch["jobs"]
+    ]
+    assert sorted(counts, key=str) == sorted(
+        [("completed", 3, 0), ("completed", 1, 2), ("failed", None, None)], key=str
+    )
+
+
+# A failed job stops renewing its lease right away; the others are completed
+# while their leases are still renewed
+def test_batch_leases(client, monkeypatch):
+    response = client.post(
+        "/ingest-batches",
+        files=[
+            ("statement_files", ("january.csv", b"january")),
+            ("statement_files", ("broken.csv", b"broken")),
+        ],
+    )
+    batch_id = uuid.UUID(response.json()["batch_id"])
+    heartbeats = {}
+
+    class RecordingHeartbeat(LeaseHeartbeat):
+        def __init__(self, job, db, lease_duration):
+            super().__init__(job, db=db, lease_duration=lease_duration)
+            heartbeats[job.id] = self
+
+    def prepare_job(job, file_storage, app_config, timer):
+        if job.file_path.endswith("broken.csv"):
+            raise ValueError("Unreadable statement")
+        return PreparedTransactions(enriched=[transaction(job.id, 1)])
+
+    active_at_insert = {}
+    insert_new_transactions = orchestration._insert_new_transactions
+
+    def insert(enriched, db, app_config):
+        active_at_insert.update(
+            {job_id: heartbeat.active for job_id, heartbeat in heartbeats.items()}
+        )
+        return insert_new_transactions(enriched, db=db, app_config=app_config)
+
+    active_at_finish = {}
+    finish_job = orchestration.finish_job
+
+    def finish(job, db):
+        active_at_finish[job.id] = heartbeats[job.id].active
+        return finish_job(job, db=db)
+
+    monkeypatch.setattr(orchestration, "LeaseHeartbeat", RecordingHeartbeat)
+    monkeypatch.setattr(orchestration, "_prepare_job", prepare_job)
+    monkeypatch.setattr(orchestration, "_insert_new_transactions", insert)
+    monkeypatch.setattr(orchestration, "finish_job", finish)
+    db = app.state.db_engine
+    jobs = claim_batch_jobs(batch_id, db, "worker", lease_duration=dt.timedelta(1))
+    process_batch(
+        jobs,
+        db=db,
+        file_storage=app.state.file_storage,
+        app_config=app.state.app_config,
+    )
+
+    broken, january = sorted(jobs, key=lambda job: "january" in job.file_path)
+    assert active_at_insert == {broken.id: False, january.id: True}
+    assert active_at_finish == {broken.id: True, january.id: True}
+    assert not any(heartbeat.active for heartbeat in heartbeats.values())
+
+
+def test_batch_of_another_user(client):
+    assert client.get(f"/ingest-batches/{uuid.uuid4()}").status_code == 404
+
+
+def test_invalid_content_length(client):
+    response = client.post(
+        "/ingest-batches",
+        files={"statement_files": ("january.csv", b"january")},
+        headers={"content-length": "many"},
+    )
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid Content-Length header"
+
+
+def test_oversized_zip_member(client, server):
+    app.state.app_config.upload_max_bytes = 1000
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("january.csv", b"january")
+        # Small once compressed
+        archive.writestr("february.csv", b"0" * 10**6)
+
+    response = client.post(
+        "/ingest-batches",
+        files={"statement_files": ("statements.zip", buffer.getvalue())},
+    )
+
+    assert response.status_code == 413
+    assert "february.csv" in response.json()["detail"]
+
+
+class FakeStorageClient:
+    def __init__(self):
+        self.removed: list[str] = []
+        self.storage = self
+
+    def from_(self, bucket: str) -> "FakeStorageClient":
+        return self
+
+    def remove(self, paths: list[str]) -> None:
+        self.removed.extend(paths)
+
+
+# The statements stored before another one of the batch failed are deleted
+def test_failed_batch_deletes_stored_statements(client, server):
+    storage_client = FakeStorageClient()
+    upload_client = httpx.AsyncClient(
+        base_url="http://storage", transport=httpx.MockTransport(server.handle)
+    )
+    app.state.file_storage = FileStorage(storage_client, upload_client=upload_client)
+    app.state.app_config.upload_max_bytes = 1000
+
+    response = client.post(
+        "/ingest-batches",
+        files=[
+            ("statement_files", ("january.csv", b"january")),
+            ("statement_files", ("february.csv", b"0" * 2000)),
+        ],
+    )
+
+    assert response.status_code == 413
+    assert len(server.uploads) == 1
+    assert len(storage_client.removed) == 1
+    assert storage_client.removed[0].endswith("_january.csv")
@@ -0,0 +1,144 @@
+import datetime as dt
+import random
+import re
+from decimal import Decimal
+
+from app.enrichment import (
+    BUSINESS_LUNCH_MERCHANTS,
+    COFFESHOP_MERCHANTS,
+    FOOD_DELIVERY_MERCHANTS,
+    RESTAURANT_MERCHANTS,
+    STREAMING_MERCHANTS,
+    SUPERMARKET_MERCHANTS,
+    get_categorization,
+)
+from app.project_types import (
+    ImportedTransaction,
+    Side,
+    TransactionSource,
+    TransactionType,
+)
+
+
+# Previous implementation: one predicate per merchant group, checked in order
+def legacy_get_categorization(transaction):
+    counterparty = transaction.counterparty.lower().strip()
+    txn_datetime = transaction.transaction_datetime
+    if any(counterparty == m.lower() for m in SUPERMARKET_MERCHANTS):
+        return {"category": "Groceries", "sub_category": "Groceries", "detail": "Groceries"}
+    elif (
+        counterparty in ("caffeine", "kavos era")
+        and txn_datetime.hour < 11
+        and transaction.orig_amount > 5
+    ):
+        return {
+            "category": "Food & Drink",
+            "sub_category": "Food",
+            "detail": "Eating Out",
+            "meal_type": "Breakfast",
+        }
+    elif (
+        any(counterparty == m.lower() for m in COFFESHOP_MERCHANTS)
+        and transaction.orig_amount < 5
+    ):
+        return {
+            "category": "Food & Drink",
+            "sub_category": "Food",
+            "detail": "Hot Drinks & Snacks",
+            "meal_type": "Snacks",
+        }
+    elif any(
+        re.search(rf"^{m}.*$", counterparty, flags=re.IGNORECASE)
+        for m in STREAMING_MERCHANTS
+    ):
+        return {
+            "category": "Entertainment",
+            "sub_category": "Streaming Services",
+            "detail": f"{transaction.counterparty} subscription",
+        }
+    elif (
+        any(counterparty == m.lower() for m in BUSINESS_LUNCH_MERCHANTS)
+        and txn_datetime.isoweekday() in range(1, 6)
+        and 11 <= txn_datetime.hour < 15
+    ):
+        return {
+            "category": "Food & Drink",
+            "sub_category": "Food",
+            "detail": "Eating Out",
+            "note": "Business Lunch",
+            "meal_type": "Lunch",
+        }
+    elif any(counterparty == m.lower() for m in FOOD_DELIVERY_MERCHANTS):
+        meal_type = "Lunch" if 10 < txn_datetime.hour <= 15 else "Dinner"
+        return {
+            "category": "Food & Drink",
+            "sub_category": "Food",
+            "detail": "Food Delivery",
+            "meal_type": meal_type,
+        }
+    elif any(m.lower() in counterparty for m in RESTAURANT_MERCHANTS):
+        if txn_datetime.hour < 11:
+            meal_type = "Breakfast"
+        elif txn_datetime.hour < 17:
+            meal_type = "Lunch"
+        else:
+            meal_type = "Dinner"
+        return {
+            "category": "Food & Drink",
+            "sub_category": "Food",
+            "detail": "Eating Out",
+            "meal_type": meal_type,
+        }
+    return {}
+
+
+def random_counterparty(rng: random.Random) -> str:
+    merchants = sorted(
+        SUPERMARKET_MERCHANTS
+        | COFFESHOP_MERCHANTS
+        | BUSINESS_LUNCH_MERCHANTS
+        | STREAMING_MERCHANTS
+        | FOOD_DELIVERY_MERCHANTS
+        | RESTAURANT_MERCHANTS
+    )
+    merchant = rng.choice(merchants)
+    variant = rng.randint(0, 8)
+    if variant == 0:
+        return merchant
+    elif variant == 1:
+        return f"  {merchant.upper()} "
+    elif variant == 2:
+        return f"{merchant.title()} {rng.randint(1, 999)}"
+    elif variant == 3:
+        return f"UAB {merchant} Vilnius"
+    elif variant == 4:
+        # Partial merchant name
+        return merchant[: rng.randint(1, len(merchant))]
+    elif variant == 5:
+        return f"{merchant}\nline"
+    elif variant == 6:
+        return "".join(rng.choice("abcdefgh ") for _ in range(rng.randint(0, 15)))
+    elif variant == 7:
+        return f"{merchant}{rng.choice(merchants)}"
+    return "Unknown merchant"
+
+
+def test_categorization_matches_previous_predicates():
+    rng = random.Random(7)
+    start = dt.datetime(2024, 1, 1)
+    for _ in range(20_000):
+        transaction = ImportedTransaction(
+            transaction_datetime=start
+            + dt.timedelta(days=rng.randint(0, 13), hours=rng.randint(0, 23)),
+            type=TransactionType.CARD_PAYMENT,
+            counterparty=random_counterparty(rng),
+            orig_amount=Decimal(rng.randint(0, 1000)) / 100,
+            orig_currency="EUR",
+            side=Side.DEBIT,
+            source=TransactionSource.REVOLUT,
+            dedup_key="key",
+        )
+
+        assert get_categorization(transaction) == legacy_get_categorization(
+            transaction
+        ), transaction.counterparty
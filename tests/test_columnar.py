@@ -0,0 +1,199 @@
+import csv
+import dataclasses
+import datetime as dt
+import io
+import logging
+import random
+import uuid
+from decimal import Decimal
+
+import openpyxl
+import pandas as pd
+from currency_converter import CURRENCY_FILE
+
+from app.columnar import enrich_statement
+from app.enrichment import enrich_transactions
+from app.filters import (
+    apply_filters,
+    filter_batch,
+    filter_transactions,
+    is_own_account_transfer,
+)
+from app.fx_rates import RateStore, RateTable
+from app.parsers.registry import get_parser
+from app.project_types import (
+    ImportedTransaction,
+    Side,
+    StatementSource,
+    TransactionSource,
+    TransactionType,
+)
+
+REVOLUT_HEADERS = [
+    "Type",
+    "Product",
+    "Started Date",
+    "Completed Date",
+    "Description",
+    "Amount",
+    "Fee",
+    "Currency",
+    "State",
+    "Balance",
+]
+SWEDBANK_HEADERS = [
+    "Sąskaitos Nr.",
+    "",
+    "Data",
+    "Gavėjas",
+    "Paaiškinimai",
+    "Suma",
+    "Valiuta",
+    "D/K",
+    "Įrašo Nr.",
+    "Kodas",
+]
+COUNTERPARTIES = [
+    "Lidl",
+    "  Maxima  ",
+    "Caffeine",
+    "Kavos Era",
+    "Netflix",
+    "Wolt",
+    "Bolt Food",
+    "Spirgis",
+    "TO GBP",
+    "JUSTAS ZIEMINYKAS",
+    "Some Shop",
+    "",
+]
+
+
+class FixedRateStore(RateStore):
+    def __init__(self, rate_table: RateTable):
+        super().__init__(snapshot_path=None, refresh_interval=dt.timedelta(0))
+        self._rate_table = rate_table
+
+
+def revolut_statement(rows: int, rng: random.Random) -> bytes:
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(REVOLUT_HEADERS)
+    start = dt.datetime(2022, 1, 1, 8)
+    for i in range(rows):
+        started_at = start + dt.timedelta(minutes=37 * i)
+        sheet.append(
+            [
+                rng.choice(["Card Payment", "Transfer", "ATM", "TOPUP", "Card Refund"]),
+                rng.choice(["Current", "Current", " current ", "Savings"]),
+                started_at,
+                started_at + dt.timedelta(hours=1),
+                rng.choice(COUNTERPARTIES),
+                rng.choice([round(rng.uniform(-80, 20), 2), rng.randint(-50, 50)]),
+                0,
+                rng.choice(["EUR", "EUR", "USD", "GBP", "PLN"]),
+                rng.choice(["COMPLETED", "COMPLETED", "REVERTED"]),
+                round(rng.uniform(0, 1000), 2),
+            ]
+        )
+
+    # Rows with unexpected values: text amounts and dates, missing cells
+    sheet.append(["Card Payment", "Current", start, start, "Lidl", "-1.5", 0, "EUR", "COMPLETED", "10"])
+    sheet.append(["Card Payment", "Current", "2022-01-02 10:00:00", start, "Rimi", -2, 0, "EUR", "COMPLETED", 8])
+    sheet.append(["Card Payment", "Current", start, start, None, -3, 0, "EUR", "COMPLETED", 5])
+    sheet.append(["Card Payment", "Current", start, start, "Rimi", "abc", 0, "EUR", "COMPLETED", 5])
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def swedbank_statement(rows: int, rng: random.Random) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(SWEDBANK_HEADERS)
+    start = dt.date(2022, 1, 1)
+    for i in range(rows):
+        writer.writerow(
+            [
+                "LT1",
+                "20",
+                (start + dt.timedelta(days=i // 5)).isoformat(),
+                rng.choice(COUNTERPARTIES),
+                rng.choice(["Pirkinys", "grynieji pinigai", "Apyvarta", "Likutis pradžiai"]),
+                f"{rng.uniform(1, 99):.2f}",
+                rng.choice(["EUR", "EUR", "USD"]),
+                rng.choice(["D", "D", "K", " d ", "X"]),
+                f"2022{i:08d}",
+                rng.choice(["K", "MK", "AS"]),
+            ]
+        )
+
+    # Rows with unexpected values: datetimes, decimal commas, invalid dates
+    writer.writerow(["LT1", "20", "2022-01-03T10:30:00", "IKI", "Pirkinys", "1.50", "EUR", "D", "X1", "K"])
+    writer.writerow(["LT1", "20", "2022-01-03", "IKI", "Pirkinys", "1,50", "EUR", "D", "X2", "K"])
+    writer.writerow(["LT1", "20", "2022-02-30", "IKI", "Pirkinys", "1.50", "EUR", "D", "X3", "K"])
+    writer.writerow(["LT1", "20", "2022-01-03", "IKI", "Pirkinys", "1e2", "EUR", "D", "X4", "K"])
+    return buffer.getvalue().encode("utf-8")
+
+
+def assert_same_output(statement_source: StatementSource, statement: bytes):
+    rate_table = RateTable.from_file(CURRENCY_FILE)
+    job_id, user_id = uuid.uuid4(), uuid.uuid4()
+
+    parser = get_parser(statement_source)
+    filtered = apply_filters(parser(io.BytesIO(statement))).transactions
+    expected = enrich_transactions(
+        filtered, job_id=job_id, user_id=user_id, rate_store=FixedRateStore(rate_table)
+    )
+    actual = enrich_statement(
+        io.BytesIO(statement),
+        statement_source=statement_source,
+        job_id=job_id,
+        user_id=user_id,
+        rate_table=rate_table,
+    )
+
+    assert actual == expected
+
+
+def test_columnar_revolut_matches_row_engine():
+    statement = revolut_statement(2000, random.Random(1))
+    assert_same_output(StatementSource.REVOLUT, statement)
+
+
+def test_columnar_swedbank_matches_row_engine():
+    statement = swedbank_statement(2000, random.Random(2))
+    assert_same_output(StatementSource.SWEDBANK, statement)
+
+
+def test_filter_batch_matches_row_filters(caplog):
+    rng = random.Random(4)
+    transactions = [
+        ImportedTransaction(
+            transaction_datetime=dt.datetime(2022, 1, 1) + dt.timedelta(hours=i),
+            type=rng.choice(list(TransactionType)),
+            counterparty=rng.choice(COUNTERPARTIES + ["to gbp", "TO GBP SAVINGS"]),
+            orig_amount=Decimal("1.50"),
+            orig_currency="EUR",
+            side=Side.DEBIT,
+            source=TransactionSource.REVOLUT,
+            dedup_key=str(i),
+        )
+        for i in range(2000)
+    ]
+    batch = pd.DataFrame([dataclasses.asdict(txn) for txn in transactions])
+
+    with caplog.at_level(logging.INFO, logger="app.filters"):
+        expected = filter_transactions(transactions)
+        row_messages = caplog.messages
+        caplog.clear()
+        filtered, rejected_counts = filter_batch(batch)
+
+    assert filtered["dedup_key"].tolist() == [txn.dedup_key for txn in expected]
+    assert rejected_counts == apply_filters(transactions).rejected_counts
+    assert all(rejected_counts.values())
+    assert rejected_counts["own_account_transfer"] == sum(
+        map(is_own_account_transfer, transactions)
+    )
+    assert caplog.messages == row_messages
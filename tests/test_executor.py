@@ -0,0 +1,31 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.config import AppConfig, PipelineExecutor
+from app.executor import run_cpu_bound, shutdown_pool
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    yield AppConfig(
+        db_connection_string="sqlite://",
+        supabase_url="http://localhost",
+        supabase_anon_key="anon",
+        supabase_admin_key="admin",
+        pipeline_executor=PipelineExecutor.PROCESS_POOL,
+        fx_snapshot_path=str(tmp_path / "ecb_rates.zip"),
+    )
+    shutdown_pool()
+
+
+def test_runs_task_in_pool(app_config):
+    assert run_cpu_bound(app_config, sorted, [3, 1, 2], reverse=True) == [3, 2, 1]
+
+
+def test_replaces_broken_pool(app_config):
+    with pytest.raises(BrokenProcessPool):
+        run_cpu_bound(app_config, os._exit, 1)
+
+    assert run_cpu_bound(app_config, sorted, [2, 1]) == [1, 2]
@@ -0,0 +1,117 @@
+import csv
+import datetime as dt
+import io
+import uuid
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.pool import StaticPool
+from sqlmodel import create_engine, Session, SQLModel
+
+from app.config import AppConfig
+from app.db import jobs  # noqa: F401 - registers the jobs table for the FK
+from app.db.transactions import Transaction, TransactionQuery
+from app.dependencies import get_authenticated_user
+from app.export import export_transactions
+from app.main import app
+from app.project_types import ExportFormat, Side, TransactionSource
+
+USER_ID = uuid.uuid4()
+
+
+@pytest.fixture
+def db():
+    db = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(db)
+    with Session(db) as session:
+        session.add_all(
+            Transaction(
+                transaction_datetime=dt.datetime(2024, 1, 1) + dt.timedelta(days=i),
+                counterparty=f"merchant {i}",
+                orig_amount=Decimal("12.25"),
+                orig_currency="EUR",
+                side=Side.CREDIT if i % 4 == 0 else Side.DEBIT,
+                source=TransactionSource.REVOLUT,
+                eur_amount=Decimal("12.25"),
+                category="Groceries",
+                dedup_key=str(i),
+                user_id=USER_ID,
+            )
+            for i in range(10)
+        )
+        session.commit()
+    return db
+
+
+@pytest.fixture
+def client(db):
+    app.state.db_engine = db
+    app.state.app_config = AppConfig(
+        db_connection_string="sqlite://",
+        supabase_url="http://localhost",
+        supabase_anon_key="anon",
+        supabase_admin_key="admin",
+        export_batch_size=3,
+    )
+    app.dependency_overrides[get_authenticated_user] = lambda: USER_ID
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def test_exports_in_batches(db):
+    chunks = list(
+        export_transactions(
+            db, TransactionQuery(USER_ID), ExportFormat.CSV, batch_size=4
+        )
+    )
+
+    # Header with the first batch, then one chunk per batch
+    assert len(chunks) == 3
+    rows = list(csv.DictReader(io.StringIO(b"".join(chunks).decode())))
+    assert [row["counterparty"] for row in rows] == [f"merchant {i}" for i in range(10)]
+    assert rows[0]["side"] == "credit"
+
+
+def test_export_csv_with_filters(client):
+    response = client.get(
+        "/transactions/export", params={"format": "csv", "side": "credit"}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["counterparty"] for row in rows] == [
+        "merchant 0",
+        "merchant 4",
+        "merchant 8",
+    ]
+
+
+def test_export_of_nothing_has_header(client):
+    response = client.get("/transactions/export", params={"category": "Travel"})
+
+    assert response.text.strip() == ",".join(
+        ["id", "transaction_datetime", "type", "counterparty", "orig_amount"]
+        + ["orig_currency", "side", "source", "eur_amount", "refunded_eur_amount"]
+        + ["category", "sub_category", "detail", "meal_type", "note"]
+        + ["manually_added", "job_id"]
+    )
+
+
+def test_export_parquet(client):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    response = client.get("/transactions/export", params={"format": "parquet"})
+
+    assert response.status_code == 200
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.num_rows == 10
+    # One row group per batch
+    assert pq.ParquetFile(io.BytesIO(response.content)).num_row_groups == 4
+    assert table.column("eur_amount")[0].as_py() == Decimal("12.25")
+    assert table.column("side")[0].as_py() == "credit"
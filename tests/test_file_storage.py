@@ -0,0 +1,192 @@
+import asyncio
+import datetime as dt
+import hashlib
+import io
+import uuid
+
+import httpx
+import pytest
+from fastapi import UploadFile
+
+from app.file_storage import (
+    FileStorage,
+    FileTooLargeError,
+    hash_upload,
+    TUS_CHUNK_SIZE,
+)
+from app.project_types import StatementSource
+from app.spool_cache import SpoolCache
+
+
+# In-memory TUS server, optionally failing the first PATCH after part of it was stored
+class FakeTusServer:
+    def __init__(self, fail_first_patch: bool = False):
+        self.uploads: dict[str, bytearray] = {}
+        # Declared on creation, or by a PATCH when the length was deferred
+        self.lengths: dict[str, int | None] = {}
+        self.patch_sizes: list[int] = []
+        self.deleted: list[str] = []
+        self._fail_next_patch = fail_first_patch
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            upload_id = f"/upload/resumable/{len(self.uploads)}"
+            self.uploads[upload_id] = bytearray()
+            self.lengths[upload_id] = _length(request)
+            return httpx.Response(201, headers={"Location": upload_id})
+
+        upload = self.uploads[request.url.path]
+        if request.method == "HEAD":
+            return httpx.Response(200, headers={"Upload-Offset": str(len(upload))})
+        if request.method == "DELETE":
+            self.deleted.append(request.url.path)
+            return httpx.Response(204)
+
+        assert int(request.headers["Upload-Offset"]) == len(upload)
+        if "Upload-Length" in request.headers:
+            assert self.lengths[request.url.path] in (None, _length(request))
+            self.lengths[request.url.path] = _length(request)
+        content = request.read()
+        self.patch_sizes.append(len(content))
+        if self._fail_next_patch:
+            self._fail_next_patch = False
+            upload.extend(content[: len(content) // 2])
+            return httpx.Response(500)
+        upload.extend(content)
+        return httpx.Response(204, headers={"Upload-Offset": str(len(upload))})
+
+
+def _length(request: httpx.Request) -> int | None:
+    length = request.headers.get("Upload-Length")
+    return int(length) if length is not None else None
+
+
+def upload(
+    server: FakeTusServer,
+    content: bytes,
+    max_size: int,
+    size: int | None,
+    spool_cache: SpoolCache | None = None,
+):
+    client = httpx.AsyncClient(
+        base_url="http://storage", transport=httpx.MockTransport(server.handle)
+    )
+    file_storage = FileStorage(
+        storage_client=None, upload_client=client, spool_cache=spool_cache
+    )
+    return file_storage, asyncio.run(
+        file_storage.stream_statement(
+            statement_source=StatementSource.REVOLUT,
+            filename="statement.xlsx",
+            file=UploadFile(io.BytesIO(content), size=size),
+            bucket="statements",
+            user_id=uuid.uuid4(),
+            max_size=max_size,
+        )
+    )
+
+
+def test_streams_file_in_chunks():
+    server = FakeTusServer()
+    content = bytes(range(256)) * (TUS_CHUNK_SIZE * 3 // 2 // 256)
+
+    _, stored_file = upload(server, content, max_size=len(content), size=len(content))
+
+    assert server.patch_sizes == [TUS_CHUNK_SIZE, len(content) - TUS_CHUNK_SIZE]
+    assert bytes(server.uploads["/upload/resumable/0"]) == content
+    assert server.lengths == {"/upload/resumable/0": len(content)}
+    assert stored_file.size == len(content)
+
+
+# Without a known size, the last chunk declares the upload length
+@pytest.mark.parametrize("chunks", [1, 2])
+def test_streams_file_of_unknown_size(chunks):
+    server = FakeTusServer()
+    content = b"x" * (TUS_CHUNK_SIZE * chunks - 10)
+
+    upload(server, content, max_size=len(content), size=None)
+
+    assert bytes(server.uploads["/upload/resumable/0"]) == content
+    assert server.lengths == {"/upload/resumable/0": len(content)}
+
+
+def test_resumes_failed_chunk():
+    server = FakeTusServer(fail_first_patch=True)
+    content = b"x" * 1000
+
+    upload(server, content, max_size=len(content), size=len(content))
+
+    assert server.patch_sizes == [1000, 500]
+    assert bytes(server.uploads["/upload/resumable/0"]) == content
+
+
+def test_rejects_large_file_before_upload():
+    server = FakeTusServer()
+
+    with pytest.raises(FileTooLargeError):
+        upload(server, b"x" * 1000, max_size=999, size=1000)
+
+    assert server.uploads == {}
+
+
+def test_terminates_upload_larger_than_declared():
+    server = FakeTusServer()
+
+    with pytest.raises(FileTooLargeError):
+        upload(server, b"x" * 1000, max_size=999, size=None)
+
+    assert server.deleted == ["/upload/resumable/0"]
+
+
+def test_loads_uploaded_file_from_spool_cache(tmp_path):
+    server = FakeTusServer()
+    spool_cache = SpoolCache(tmp_path, max_bytes=10**6, ttl=dt.timedelta(hours=1))
+    content = b"x" * 1000
+
+    file_storage, stored_file = upload(
+        server, content, max_size=len(content), size=len(content), spool_cache=spool_cache
+    )
+
+    # The storage client is not used
+    assert file_storage.load_file(stored_file.path, "statements").read() == content
+
+
+def test_discards_spooled_copy_of_failed_upload(tmp_path):
+    server = FakeTusServer()
+    spool_cache = SpoolCache(tmp_path, max_bytes=10**6, ttl=dt.timedelta(hours=1))
+
+    with pytest.raises(FileTooLargeError):
+        upload(server, b"x" * 1000, max_size=999, size=None, spool_cache=spool_cache)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+class CountingUpload(UploadFile):
+    read_bytes = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        chunk = await super().read(size)
+        self.read_bytes += len(chunk)
+        return chunk
+
+
+def test_hashes_upload_and_rewinds():
+    content = b"x" * (TUS_CHUNK_SIZE + 10)
+    file = UploadFile(io.BytesIO(content), size=len(content))
+
+    content_hash = asyncio.run(hash_upload(file, max_size=len(content)))
+
+    assert content_hash == hashlib.sha256(content).hexdigest()
+    assert asyncio.run(file.read()) == content
+
+
+@pytest.mark.parametrize("size", [TUS_CHUNK_SIZE * 4, None])
+def test_stops_hashing_large_upload(size):
+    file = CountingUpload(io.BytesIO(b"x" * TUS_CHUNK_SIZE * 4), size=size)
+
+    with pytest.raises(FileTooLargeError):
+        asyncio.run(hash_upload(file, max_size=TUS_CHUNK_SIZE))
+
+    # A declared size is checked before reading, otherwise reading stops past
+    # the limit
+    assert file.read_bytes == (0 if size else TUS_CHUNK_SIZE * 2)
@@ -0,0 +1,142 @@
+import datetime as dt
+import os
+import random
+import threading
+from decimal import Decimal
+
+import pytest
+
+from currency_converter import CURRENCY_FILE, CurrencyConverter, RateNotFoundError
+
+from app.fx_rates import RateStore, RateTable
+
+
+# Previous implementation: step one day back until a rate is found
+def legacy_get_eur_amount(converter, txn_date, orig_currency, orig_amount):
+    if orig_currency.upper() == "EUR":
+        return orig_amount
+
+    eur_amount = None
+    exchange_rate_date = txn_date
+    retry_attempts = 0
+    while eur_amount is None:
+        if retry_attempts > 10:
+            return None
+        try:
+            eur_amount = converter.convert(
+                orig_amount, orig_currency, "EUR", date=exchange_rate_date
+            )
+        except RateNotFoundError:
+            exchange_rate_date = exchange_rate_date - dt.timedelta(days=1)
+            retry_attempts += 1
+
+    return Decimal(eur_amount).quantize(Decimal("0.01"))
+
+
+def test_to_eur_matches_previous_conversion():
+    converter = CurrencyConverter(CURRENCY_FILE)
+    rate_table = RateTable.from_file(CURRENCY_FILE)
+    rng = random.Random(42)
+    # Includes dates before and after the ECB history, and retired currencies
+    currencies = ["USD", "GBP", "PLN", "SEK", "CYP", "ISK", "RUB", "EUR", "eur"]
+    start = dt.datetime(1998, 12, 1)
+    dates, txn_currencies, amounts = [], [], []
+    for _ in range(5000):
+        dates.append(start + dt.timedelta(days=rng.randint(0, 10_500), hours=15))
+        txn_currencies.append(rng.choice(currencies))
+        amounts.append(Decimal(rng.randint(1, 1_000_000)) / 100)
+
+    expected = []
+    for date, currency, amount in zip(dates, txn_currencies, amounts):
+        try:
+            expected.append(legacy_get_eur_amount(converter, date, currency, amount))
+        except Exception:
+            expected.append(None)
+
+    assert rate_table.to_eur(dates, txn_currencies, amounts) == expected
+
+
+def test_to_eur_unknown_currency():
+    rate_table = RateTable.from_file(CURRENCY_FILE)
+    assert rate_table.to_eur([dt.date(2020, 1, 2)], ["XYZ"], [Decimal("1")]) == [None]
+
+
+SNAPSHOT = b"Date,USD\n2024-01-02,1.1\n"
+DOWNLOADED = b"Date,USD\n2024-01-03,1.2\n2024-01-02,1.1\n"
+
+
+class FakeDownloader:
+    def __init__(self, content: bytes | None):
+        self.content = content
+        self.urls: list[str] = []
+        self.release = threading.Event()
+        self.release.set()
+        self.done = threading.Event()
+
+    def __call__(self, url: str) -> bytes:
+        self.urls.append(url)
+        self.release.wait(timeout=5)
+        self.done.set()
+        if self.content is None:
+            raise OSError("Network is unreachable")
+        return self.content
+
+
+def rate_store(tmp_path, downloader: FakeDownloader) -> RateStore:
+    return RateStore(
+        snapshot_path=tmp_path / "rates.csv",
+        refresh_interval=dt.timedelta(days=1),
+        download=downloader,
+    )
+
+
+def test_download_failure_uses_bundled_rates(tmp_path):
+    downloader = FakeDownloader(None)
+    store = rate_store(tmp_path, downloader)
+
+    # The first access doesn't download
+    assert store.rate_table.last_date == RateTable.from_file(CURRENCY_FILE).last_date
+    assert downloader.urls == []
+
+    store.start()
+    assert downloader.done.wait(timeout=5)
+    store.stop()
+    assert store.last_rate_date == RateTable.from_file(CURRENCY_FILE).last_date
+    assert store.fetched_at is None
+    assert not (tmp_path / "rates.csv").exists()
+
+
+def test_fresh_snapshot_is_reused(tmp_path):
+    (tmp_path / "rates.csv").write_bytes(SNAPSHOT)
+    downloader = FakeDownloader(DOWNLOADED)
+    store = rate_store(tmp_path, downloader)
+
+    store.start()
+    store.stop()
+
+    assert store.last_rate_date == dt.date(2024, 1, 2)
+    assert downloader.urls == []
+
+
+@pytest.mark.parametrize("snapshot", [SNAPSHOT, None])
+def test_stale_or_missing_snapshot_is_refreshed(tmp_path, snapshot):
+    snapshot_path = tmp_path / "rates.csv"
+    if snapshot is not None:
+        snapshot_path.write_bytes(snapshot)
+        two_days_ago = (dt.datetime.now() - dt.timedelta(days=2)).timestamp()
+        os.utime(snapshot_path, (two_days_ago, two_days_ago))
+    downloader = FakeDownloader(DOWNLOADED)
+    downloader.release.clear()
+    store = rate_store(tmp_path, downloader)
+
+    store.start()
+    # The loaded rates are used while the download runs
+    loaded = store.rate_table
+    downloader.release.set()
+    assert downloader.done.wait(timeout=5)
+    store.stop()
+
+    assert loaded.last_date != dt.date(2024, 1, 3)
+    assert store.last_rate_date == dt.date(2024, 1, 3)
+    assert store.age is not None and store.age < dt.timedelta(minutes=1)
+    assert snapshot_path.read_bytes() == DOWNLOADED
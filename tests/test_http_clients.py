@@ -0,0 +1,75 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.http_clients import AsyncRetryTransport, RetryTransport
+
+
+# Fails with the given responses or errors first, then succeeds
+class FlakyServer:
+    def __init__(self, *failures: int | Exception):
+        self.failures = list(failures)
+        self.requests = 0
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.failures:
+            failure = self.failures.pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            return httpx.Response(failure)
+        return httpx.Response(200)
+
+
+def client(server: FlakyServer, max_retries: int = 3) -> httpx.Client:
+    transport = RetryTransport(
+        httpx.MockTransport(server.handle), max_retries=max_retries, backoff=0
+    )
+    return httpx.Client(transport=transport, base_url="http://supabase")
+
+
+def test_retries_idempotent_requests():
+    server = FlakyServer(503, httpx.ReadTimeout("slow"), 502)
+
+    assert client(server).get("/object/file").status_code == 200
+    assert server.requests == 4
+
+
+def test_gives_up_after_max_retries():
+    server = FlakyServer(503, 503)
+
+    assert client(server, max_retries=1).get("/object/file").status_code == 503
+    assert server.requests == 2
+
+
+def test_retries_unsent_requests_only():
+    server = FlakyServer(httpx.ConnectError("refused"), 503)
+
+    assert client(server).post("/token").status_code == 503
+    assert server.requests == 2
+
+    server = FlakyServer(httpx.ReadTimeout("slow"))
+    with pytest.raises(httpx.ReadTimeout):
+        client(server).post("/token")
+
+
+def test_does_not_retry_client_errors():
+    server = FlakyServer(404)
+
+    assert client(server).get("/object/file").status_code == 404
+    assert server.requests == 1
+
+
+def test_async_retries():
+    server = FlakyServer(504)
+    transport = AsyncRetryTransport(
+        httpx.MockTransport(server.handle), max_retries=3, backoff=0
+    )
+
+    async def get() -> int:
+        async with httpx.AsyncClient(transport=transport, base_url="http://supabase") as c:
+            return (await c.head("/upload/resumable/1")).status_code
+
+    assert asyncio.run(get()) == 200
+    assert server.requests == 2
@@ -0,0 +1,90 @@
+import uuid
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.pool import StaticPool
+from sqlmodel import create_engine, SQLModel
+
+from app.config import AppConfig, JobRunner
+from app.db import transactions  # noqa: F401 - registers the transactions table
+from app.db.jobs import load_job, update_job
+from app.dependencies import get_authenticated_user_strict
+from app.file_storage import FileStorage
+from app.main import app
+from app.project_types import JobStatus
+from test_file_storage import FakeTusServer
+
+USER_ID = uuid.uuid4()
+
+
+@pytest.fixture
+def server():
+    return FakeTusServer()
+
+
+@pytest.fixture
+def client(server):
+    db = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(db)
+    upload_client = httpx.AsyncClient(
+        base_url="http://storage", transport=httpx.MockTransport(server.handle)
+    )
+    app.state.app_config = AppConfig(
+        db_connection_string="sqlite://",
+        supabase_url="http://localhost",
+        supabase_anon_key="anon",
+        supabase_admin_key="admin",
+        job_runner=JobRunner.QUEUE,
+        spool_cache_max_bytes=0,
+    )
+    app.state.db_engine = db
+    app.state.file_storage = FileStorage(storage_client=None, upload_client=upload_client)
+    app.dependency_overrides[get_authenticated_user_strict] = lambda: USER_ID
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def upload(client: TestClient, content: bytes, statement_source: str = "swedbank"):
+    response = client.post(
+        "/ingest-jobs",
+        files={"statement_file": ("statement.csv", content)},
+        data={"statement_source": statement_source},
+    )
+    return response.json()
+
+
+def complete(job_id: str, ingested: int, duplicates: int):
+    db = app.state.db_engine
+    job = load_job(uuid.UUID(job_id), db)
+    job.status = JobStatus.COMPLETED
+    job.ingested_txn_count = ingested
+    job.duplicate_txn_count = duplicates
+    update_job(job, db)
+
+
+def test_reupload_completes_with_original_counts(client, server):
+    first = upload(client, b"statement")
+    complete(first["job_id"], ingested=10, duplicates=2)
+
+    second = upload(client, b"statement")
+
+    assert second["status"] == JobStatus.COMPLETED
+    assert second["ingested_txn_count"] == 10
+    assert second["duplicate_txn_count"] == 2
+    assert len(server.uploads) == 1
+    stored = load_job(uuid.UUID(second["job_id"]), app.state.db_engine)
+    assert stored.file_path == load_job(uuid.UUID(first["job_id"]), app.state.db_engine).file_path
+
+
+def test_reupload_runs_pipeline_until_first_job_completed(client, server):
+    upload(client, b"statement")
+
+    assert upload(client, b"statement")["status"] == JobStatus.PENDING
+    assert upload(client, b"statement", "revolut")["status"] == JobStatus.PENDING
+    assert upload(client, b"other statement")["status"] == JobStatus.PENDING
+    assert len(server.uploads) == 4
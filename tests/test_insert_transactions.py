@@ -0,0 +1,186 @@
+import datetime as dt
+import io
+import os
+import uuid
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import StaticPool
+from sqlmodel import create_engine, select, Session, SQLModel
+
+from app import orchestration
+from app.config import AppConfig, InsertMode
+from app.db.jobs import create_new_job, IngestJob, load_job
+from app.db.summaries import MonthlySpending
+from app.db.transactions import insert_transactions, Transaction
+from app.orchestration import _insert_new_transactions, PreparedTransactions, run_job
+from app.project_types import (
+    EnrichedTransaction,
+    JobStatus,
+    Side,
+    StatementSource,
+    TransactionSource,
+    TransactionType,
+)
+
+# Postgres database for the tests of the bulk insert paths, e.g.
+# postgresql+psycopg2://postgres@localhost/test, with an up-to-date schema
+# (python -m app.migrate). Each test writes rows of a new user.
+POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+
+
+@pytest.fixture(scope="module")
+def postgres():
+    if not POSTGRES_URL:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    engine = create_engine(POSTGRES_URL)
+    try:
+        SQLModel.metadata.create_all(engine)
+    except OperationalError as e:
+        pytest.skip(f"Postgres is not available: {e}")
+    yield engine
+    engine.dispose()
+
+
+def transaction(user_id: uuid.UUID, dedup_key: str, amount: str) -> EnrichedTransaction:
+    return EnrichedTransaction(
+        transaction_datetime=dt.datetime(2024, 1, 5, 12),
+        type=TransactionType.CARD_PAYMENT,
+        counterparty=f"merchant {dedup_key}",
+        orig_amount=Decimal(amount),
+        orig_currency="EUR",
+        side=Side.DEBIT,
+        source=TransactionSource.REVOLUT,
+        eur_amount=Decimal(amount),
+        category="Groceries",
+        dedup_key=dedup_key,
+        job_id=None,  # type: ignore
+        user_id=user_id,
+    )
+
+
+def stored_amounts(db, user_id: uuid.UUID) -> dict[str, Decimal]:
+    with Session(db) as session:
+        rows = session.exec(
+            select(Transaction.dedup_key, Transaction.eur_amount).where(
+                Transaction.user_id == user_id
+            )
+        ).all()
+    return {key: Decimal(amount) for key, amount in rows}
+
+
+def spent(db, user_id: uuid.UUID) -> Decimal:
+    with Session(db) as session:
+        rollup = session.exec(
+            select(MonthlySpending).where(MonthlySpending.user_id == user_id)
+        ).one()
+    return Decimal(rollup.spent_eur)
+
+
+@pytest.mark.parametrize("mode", [InsertMode.BATCHED, InsertMode.COPY])
+def test_bulk_insert_on_postgres(postgres, mode):
+    user_id = uuid.uuid4()
+    insert_transactions([transaction(user_id, "stored", "1")], postgres, mode=mode)
+    batch = [
+        transaction(user_id, "stored", "2"),
+        transaction(user_id, "a", "10"),
+        # Repeated in the batch: the first row is kept
+        transaction(user_id, "b", "20"),
+        transaction(user_id, "b", "99"),
+        transaction(user_id, "c", "30"),
+    ]
+
+    # Chunks smaller than the batch: the repeated key spans two chunks
+    inserted = insert_transactions(batch, postgres, mode=mode, chunk_size=3)
+
+    assert inserted == {"a", "b", "c"}
+    assert stored_amounts(postgres, user_id) == {
+        "stored": Decimal("1"),
+        "a": Decimal("10"),
+        "b": Decimal("20"),
+        "c": Decimal("30"),
+    }
+    # The rollups count the rows that were inserted
+    assert spent(postgres, user_id) == Decimal("61")
+
+
+@pytest.mark.parametrize("mode", [InsertMode.BATCHED, InsertMode.COPY])
+def test_duplicate_counts_on_postgres(postgres, mode):
+    user_id = uuid.uuid4()
+    app_config = AppConfig(
+        db_connection_string=POSTGRES_URL,  # type: ignore
+        supabase_url="http://localhost",
+        supabase_anon_key="anon",
+        supabase_admin_key="admin",
+        insert_mode=mode,
+        insert_chunk_size=2,
+    )
+    first = [transaction(user_id, key, "1") for key in ("a", "b", "c")]
+    second = [transaction(user_id, key, "1") for key in ("b", "c", "c", "d", "e")]
+
+    new, duplicates = _insert_new_transactions(first, postgres, app_config)
+    assert (len(new), len(duplicates)) == (3, 0)
+    new, duplicates = _insert_new_transactions(second, postgres, app_config)
+    assert [txn.dedup_key for txn in new] == ["d", "e"]
+    assert [txn.dedup_key for txn in duplicates] == ["b", "c", "c"]
+
+
+class FakeStorage:
+    def load_file(self, filepath: str, bucket: str) -> io.BytesIO:
+        return io.BytesIO(filepath.encode())
+
+
+@pytest.fixture
+def sqlite():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+# The second statement overlaps the first one: its repeated transactions are
+# counted as duplicates on its job
+@pytest.mark.parametrize("database", ["sqlite", "postgres"])
+def test_reingested_batch_counts(database, request, monkeypatch):
+    db = request.getfixturevalue(database)
+    user_id = uuid.uuid4()
+    statements = {
+        "january.xlsx": [("a", "1"), ("b", "2"), ("c", "3")],
+        "overlap.xlsx": [("b", "2"), ("c", "3"), ("d", "4"), ("d", "4")],
+    }
+
+    def prepare_transactions(statement, **kwargs):
+        keys = statements[statement.decode()]
+        return PreparedTransactions(
+            [transaction(user_id, key, amount) for key, amount in keys]
+        )
+
+    monkeypatch.setattr(orchestration, "prepare_transactions", prepare_transactions)
+    app_config = AppConfig(
+        db_connection_string="sqlite://",
+        supabase_url="http://localhost",
+        supabase_anon_key="anon",
+        supabase_admin_key="admin",
+    )
+    counts = []
+    for file_path in statements:
+        job = create_new_job(
+            IngestJob(
+                user_id=user_id,
+                statement_source=StatementSource.REVOLUT,
+                file_path=file_path,
+            ),
+            db,
+        )
+        storage = FakeStorage()
+        run_job(job.id, db=db, file_storage=storage, app_config=app_config)  # type: ignore
+        job = load_job(job.id, db)
+        assert job is not None
+        counts.append((job.status, job.ingested_txn_count, job.duplicate_txn_count))
+
+    assert counts == [(JobStatus.COMPLETED, 3, 0), (JobStatus.COMPLETED, 1, 3)]
+    assert stored_amounts(db, user_id).keys() == {"a", "b", "c", "d"}
@@ -0,0 +1,106 @@
+import datetime as dt
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.pool import StaticPool
+from sqlmodel import create_engine, SQLModel
+
+from app.db import transactions  # noqa: F401 - registers the transactions table
+from app.db.jobs import create_new_job, IngestJob
+from app.dependencies import get_authenticated_user
+from app.main import app
+from app.project_types import JobStatus, StatementSource
+
+USER_ID = uuid.uuid4()
+
+
+@pytest.fixture
+def db():
+    db = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(db)
+    app.state.db_engine = db
+    app.dependency_overrides[get_authenticated_user] = lambda: USER_ID
+    yield db
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def client(db):
+    return TestClient(app)
+
+
+def add_jobs(db, count: int, user_id: uuid.UUID = USER_ID, **fields) -> list[IngestJob]:
+    start = dt.datetime(2024, 1, 1)
+    return [
+        create_new_job(
+            IngestJob(
+                user_id=user_id,
+                file_path=f"statement_{i}.csv",
+                # Same creation time for pairs of jobs: the id breaks the tie
+                created_at=start + dt.timedelta(minutes=i // 2),
+                **{"statement_source": StatementSource.SWEDBANK, **fields},
+            ),
+            db,
+        )
+        for i in range(count)
+    ]
+
+
+def list_all(client: TestClient, **params) -> list[str]:
+    job_ids = []
+    cursor = None
+    while True:
+        response = client.get(
+            "/ingest-jobs", params={**params, **({"cursor": cursor} if cursor else {})}
+        )
+        assert response.status_code == 200
+        page = response.json()
+        job_ids.extend(job["job_id"] for job in page["jobs"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return job_ids
+
+
+def test_pages_through_jobs_newest_first(db, client):
+    jobs = add_jobs(db, 7)
+    add_jobs(db, 3, user_id=uuid.uuid4())
+
+    job_ids = list_all(client, limit=3)
+
+    newest_first = sorted(jobs, key=lambda job: (job.created_at, job.id), reverse=True)
+    assert job_ids == [str(job.id) for job in newest_first]
+
+
+def test_filters_jobs(db, client):
+    add_jobs(db, 2)
+    failed = add_jobs(db, 2, status=JobStatus.FAILED)
+    revolut = add_jobs(db, 3, statement_source=StatementSource.REVOLUT)
+
+    assert set(list_all(client, status="failed", limit=1)) == {str(j.id) for j in failed}
+    assert set(list_all(client, statement_source="revolut")) == {
+        str(job.id) for job in revolut
+    }
+
+
+def test_unchanged_page_not_modified(db, client):
+    add_jobs(db, 2)
+    response = client.get("/ingest-jobs")
+    etag = response.headers["etag"]
+
+    assert client.get("/ingest-jobs", headers={"If-None-Match": etag}).status_code == 304
+
+    add_jobs(db, 1)
+    changed = client.get("/ingest-jobs", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert len(changed.json()["jobs"]) == 3
+
+
+def test_invalid_cursor(client):
+    response = client.get("/ingest-jobs", params={"cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
@@ -0,0 +1,181 @@
+import datetime as dt
+import time
+import types
+import uuid
+
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import create_engine, SQLModel
+
+from app import worker
+from app.config import AppConfig
+from app.db import transactions  # noqa: F401 - registers the transactions table
+from app.db import jobs
+from app.db.jobs import (
+    claim_job,
+    claim_next_job,
+    create_new_job,
+    finish_job,
+    IngestJob,
+    LeaseHeartbeat,
+    load_job,
+    renew_lease,
+    requeue_expired_jobs,
+)
+from app.project_types import JobStatus, StatementSource
+from app.worker import Worker
+
+LEASE = dt.timedelta(minutes=5)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    return engine
+
+
+def new_job(db, **values) -> IngestJob:
+    return create_new_job(
+        IngestJob(
+            statement_source=StatementSource.REVOLUT,
+            file_path="statement.xlsx",
+            user_id=uuid.uuid4(),
+            **values,
+        ),
+        db,
+    )
+
+
+def test_claims_oldest_pending_job_once(db):
+    start = dt.datetime(2024, 1, 1)
+    newer = new_job(db, created_at=start + dt.timedelta(minutes=1))
+    older = new_job(db, created_at=start)
+
+    first = claim_next_job(db, worker_id="a", lease_duration=LEASE)
+    second = claim_next_job(db, worker_id="b", lease_duration=LEASE)
+
+    assert first.id == older.id
+    assert second.id == newer.id
+    assert claim_next_job(db, worker_id="c", lease_duration=LEASE) is None
+    assert claim_job(older.id, db, worker_id="c", lease_duration=LEASE) is None
+
+    stored = load_job(older.id, db)
+    assert stored.status == JobStatus.RUNNING
+    assert stored.worker_id == "a"
+    assert stored.attempts == 1
+    # Database clock, in UTC
+    assert stored.lease_expires_at > dt.datetime.now(dt.UTC).replace(tzinfo=None)
+
+
+def test_only_lease_holder_renews(db):
+    job = new_job(db)
+    claim_job(job.id, db, worker_id="a", lease_duration=LEASE)
+
+    assert renew_lease(job.id, db, worker_id="a", lease_duration=LEASE)
+    assert not renew_lease(job.id, db, worker_id="b", lease_duration=LEASE)
+
+
+def test_requeues_expired_leases(db):
+    expired = new_job(db)
+    claim_job(expired.id, db, worker_id="a", lease_duration=-LEASE)
+    active = new_job(db)
+    claim_job(active.id, db, worker_id="b", lease_duration=LEASE)
+    # Started before jobs had leases
+    legacy = new_job(db, status=JobStatus.RUNNING)
+
+    assert requeue_expired_jobs(db, max_attempts=3) == 2
+
+    assert load_job(expired.id, db).status == JobStatus.PENDING
+    assert load_job(expired.id, db).worker_id is None
+    assert load_job(legacy.id, db).status == JobStatus.PENDING
+    assert load_job(active.id, db).status == JobStatus.RUNNING
+
+
+def test_fails_job_after_max_attempts(db):
+    job = new_job(db, attempts=2)
+    claim_job(job.id, db, worker_id="a", lease_duration=-LEASE)
+
+    assert requeue_expired_jobs(db, max_attempts=3) == 0
+
+    stored = load_job(job.id, db)
+    assert stored.status == JobStatus.FAILED
+    assert stored.failure_reason == "lease_expired"
+
+
+def test_heartbeat_extends_lease(db):
+    job = new_job(db)
+    lease = dt.timedelta(seconds=0.3)
+    claimed = claim_job(job.id, db, worker_id="a", lease_duration=lease)
+    first_expiry = claimed.lease_expires_at
+
+    with LeaseHeartbeat(claimed, db=db, lease_duration=lease):
+        time.sleep(0.5)
+
+    assert load_job(job.id, db).lease_expires_at > first_expiry
+
+
+# A worker whose clock is ahead doesn't take the jobs of other workers
+def test_leases_use_database_clock(db, monkeypatch):
+    job = new_job(db)
+    claim_job(job.id, db, worker_id="a", lease_duration=LEASE)
+
+    class SkewedDatetime(dt.datetime):
+        @classmethod
+        def now(cls, tz=None):  # type: ignore
+            return dt.datetime.now(tz) + dt.timedelta(hours=1)
+
+    skewed = types.SimpleNamespace(datetime=SkewedDatetime, timedelta=dt.timedelta)
+    monkeypatch.setattr(jobs, "dt", skewed)
+    assert requeue_expired_jobs(db, max_attempts=3) == 0
+    assert load_job(job.id, db).status == JobStatus.RUNNING
+
+
+def test_lost_lease(db):
+    job = new_job(db)
+    lease = dt.timedelta(seconds=0.3)
+    claimed = claim_job(job.id, db, worker_id="a", lease_duration=-lease)
+    requeue_expired_jobs(db, max_attempts=3)
+    claim_job(job.id, db, worker_id="b", lease_duration=LEASE)
+
+    with LeaseHeartbeat(claimed, db=db, lease_duration=lease) as heartbeat:
+        time.sleep(0.2)
+    assert heartbeat.lease_lost
+
+    # The result of the first worker doesn't overwrite the running job
+    claimed.status = JobStatus.COMPLETED
+    assert not finish_job(claimed, db)
+    stored = load_job(job.id, db)
+    assert stored.status == JobStatus.RUNNING
+    assert stored.worker_id == "b"
+
+
+# API processes in background mode run it at start-up: jobs left running by a
+# process that stopped are run again, with the jobs still queued
+def test_worker_drains_queue(db, monkeypatch):
+    expired = new_job(db)
+    claim_job(expired.id, db, worker_id="stopped", lease_duration=-LEASE)
+    queued = new_job(db)
+    active = new_job(db)
+    claim_job(active.id, db, worker_id="running", lease_duration=LEASE)
+    processed = []
+
+    def process_job(job, db, file_storage, app_config):
+        processed.append(job.id)
+
+    monkeypatch.setattr(worker, "process_job", process_job)
+    app_config = AppConfig(
+        db_connection_string="sqlite://",
+        supabase_url="http://localhost",
+        supabase_anon_key="anon",
+        supabase_admin_key="admin",
+    )
+
+    Worker(db=db, file_storage=None, app_config=app_config).drain()  # type: ignore
+
+    assert sorted(processed) == sorted([expired.id, queued.id])
+    assert load_job(active.id, db).worker_id == "running"
@@ -0,0 +1,193 @@
+import io
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.pool import StaticPool
+from sqlmodel import create_engine, SQLModel
+
+from app import orchestration
+from app.config import AppConfig
+from app.db import transactions  # noqa: F401 - registers the transactions table
+from app.db.jobs import (
+    create_new_job,
+    IngestJob,
+    load_stage_metrics,
+    save_stage_metrics,
+)
+from app.dependencies import get_authenticated_user
+from app.main import app
+from app.metrics import get_metrics, Histogram, StageTimer
+from app.orchestration import PreparedTransactions, run_job
+from app.project_types import (
+    JobStatus,
+    PipelineStage,
+    StageTiming,
+    StatementSource,
+)
+
+USER_ID = uuid.uuid4()
+
+
+class FakeStorage:
+    def load_file(self, filepath: str, bucket: str) -> io.BytesIO:
+        return io.BytesIO(b"statement")
+
+
+@pytest.fixture
+def db():
+    db = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(db)
+    app.state.db_engine = db
+    app.dependency_overrides[get_authenticated_user] = lambda: USER_ID
+    yield db
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def metrics():
+    metrics = get_metrics()
+    metrics.enabled = True
+    yield metrics
+    metrics.enabled = False
+
+
+def test_stage_timer_adds_up_repeated_stages():
+    timer = StageTimer()
+    for rows in (3, 2):
+        with timer.stage(PipelineStage.PARSE) as timing:
+            timing.add_rows(rows)
+    timer.add([StageTiming(PipelineStage.INSERT, seconds=2.0, row_count=10)])
+
+    parse, insert = timer.timings
+    assert parse.row_count == 5
+    assert parse.seconds > 0
+    assert insert.rows_per_second == 5.0
+    assert StageTiming(PipelineStage.DOWNLOAD, seconds=1.0).rows_per_second is None
+
+
+def test_histogram_text_format():
+    histogram = Histogram("stage_seconds", "Stage time.", ("stage",), (0.1, 1))
+    histogram.observe(("parse",), 0.1)
+    histogram.observe(("parse",), 0.5)
+    histogram.observe(("parse",), 5)
+
+    assert list(histogram.render()) == [
+        "# HELP stage_seconds Stage time.",
+        "# TYPE stage_seconds histogram",
+        'stage_seconds_bucket{stage="parse",le="0.1"} 1',
+        'stage_seconds_bucket{stage="parse",le="1"} 2',
+        'stage_seconds_bucket{stage="parse",le="+Inf"} 3',
+        'stage_seconds_sum{stage="parse"} 5.6',
+        'stage_seconds_count{stage="parse"} 3',
+    ]
+
+
+def test_job_stages_are_stored(db, monkeypatch):
+    def prepare_transactions(statement, **kwargs):
+        timings = [
+            StageTiming(PipelineStage.PARSE, seconds=0.5, row_count=10),
+            StageTiming(PipelineStage.FILTER, seconds=0.1, row_count=0),
+            StageTiming(PipelineStage.ENRICH, seconds=0.0, row_count=0),
+        ]
+        return PreparedTransactions([], stage_timings=timings)
+
+    monkeypatch.setattr(orchestration, "prepare_transactions", prepare_transactions)
+    job = create_new_job(
+        IngestJob(
+            user_id=USER_ID,
+            statement_source=StatementSource.REVOLUT,
+            file_path="statement.xlsx",
+        ),
+        db,
+    )
+    app_config = AppConfig(
+        db_connection_string="sqlite://",
+        supabase_url="http://localhost",
+        supabase_anon_key="anon",
+        supabase_admin_key="admin",
+    )
+
+    file_storage = FakeStorage()
+    run_job(job.id, db=db, file_storage=file_storage, app_config=app_config)  # type: ignore
+
+    stages = [
+        (metric.stage, metric.row_count, metric.rows_per_second)
+        for metric in load_stage_metrics(job.id, db)
+    ]
+    assert stages == [
+        (PipelineStage.DOWNLOAD, None, None),
+        (PipelineStage.PARSE, 10, 20.0),
+        (PipelineStage.FILTER, 0, 0.0),
+        (PipelineStage.ENRICH, 0, None),
+        (PipelineStage.INSERT, 0, 0.0),
+    ]
+    response = TestClient(app).get(f"/ingest-jobs/{job.id}").json()
+    assert response["status"] == JobStatus.COMPLETED
+    assert [stage["stage"] for stage in response["stages"]] == list(PipelineStage)
+
+
+def test_metrics_endpoint(db, metrics):
+    create_new_job(
+        IngestJob(
+            user_id=USER_ID,
+            statement_source=StatementSource.REVOLUT,
+            file_path="statement.xlsx",
+        ),
+        db,
+    )
+    metrics.observe_job(
+        JobStatus.COMPLETED,
+        [StageTiming(PipelineStage.PARSE, seconds=0.2, row_count=100)],
+    )
+    client = TestClient(app)
+    client.get("/transactions")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    assert 'ingest_stage_duration_seconds_bucket{stage="parse",le="0.25"} 1' in lines
+    assert 'ingest_stage_rows_total{stage="parse"} 100' in lines
+    assert 'ingest_jobs_queued{status="pending"} 1' in lines
+    assert any(
+        line.startswith(
+            'http_request_duration_seconds_count{method="GET",'
+            'route="/transactions",status="200"}'
+        )
+        for line in lines
+    )
+
+
+def test_metrics_disabled(db):
+    client = TestClient(app)
+    before = get_metrics().render()
+
+    client.get("/transactions")
+
+    assert client.get("/metrics").status_code == 404
+    assert get_metrics().render() == before
+
+
+def test_job_of_another_user(db):
+    job = create_new_job(
+        IngestJob(
+            user_id=uuid.uuid4(),
+            statement_source=StatementSource.REVOLUT,
+            file_path="statement.xlsx",
+        ),
+        db,
+    )
+    save_stage_metrics(
+        job.id, [StageTiming(PipelineStage.PARSE, seconds=0.5, row_count=10)], db
+    )
+
+    response = TestClient(app).get(f"/ingest-jobs/{job.id}")
+
+    assert response.status_code == 404
+    assert "stages" not in response.json()
@@ -0,0 +1,119 @@
+import datetime as dt
+import io
+import random
+
+import openpyxl
+import pytest
+from pydantic import ValidationError
+
+from app.parsers import revolut, swedbank
+from app.parsers.validation import validate_rows
+
+# Values with whitespace pydantic and str.strip() treat differently
+ODD_TEXT = ["", None, 1, " \x1cCURRENT", " Current ", " D", "CURRENT\x1f"]
+
+
+def pick(rng: random.Random, values: list) -> object:
+    return rng.choice(values) if rng.random() > 0.05 else rng.choice(ODD_TEXT)
+
+
+def random_revolut_row(rng: random.Random) -> dict:
+    started_at = dt.datetime(2024, 1, 1) + dt.timedelta(minutes=rng.randint(0, 10**5))
+    return {
+        "Type": pick(rng, ["Card Payment", " topup ", "ATM", "Transfer", "FEE", "Card Refund"]),
+        "Product": pick(rng, ["Current", " CURRENT ", "Savings", "current\t"]),
+        "Started Date": pick(rng, [started_at, started_at.isoformat(), "2024-13-01"]),
+        "Completed Date": started_at,
+        "Description": pick(rng, ["Lidl", "  Rimi ", "TO GBP"]),
+        "Amount": pick(rng, [-1.5, 3, "-2.25", "abc"]),
+        "Fee": 0,
+        "Currency": pick(rng, ["EUR", "USD"]),
+        "State": pick(rng, ["COMPLETED", "completed ", "REVERTED", "PENDING"]),
+        "Balance": pick(rng, [100.25, 7]),
+    }
+
+
+def random_swedbank_row(rng: random.Random) -> dict:
+    return {
+        "Data": pick(rng, ["2024-01-02", "2024-01-02T10:00:00", "2024-02-30"]),
+        "Gavėjas": pick(rng, ["IKI", "", "  Wolt  "]),
+        "Paaiškinimai": pick(rng, ["Pirkinys", "Apyvarta", " apyvarta ", "Likutis pradžiai", "LIKUTIS"]),
+        "Suma": pick(rng, ["1.50", "1,50", " 2 "]),
+        "Valiuta": "EUR",
+        "D/K": pick(rng, ["D", "K", " d ", "X"]),
+        "Įrašo Nr.": str(rng.randint(0, 10**6)),
+        "Kodas": pick(rng, ["K", "MK", "AS"]),
+    }
+
+
+# Previous implementation: one model per row, rejected on validation error
+def legacy_parse(raw_model, parser_module, rows):
+    transactions = []
+    rejected_count = 0
+    for row in rows:
+        try:
+            raw_transaction = raw_model.model_validate(row)
+        except ValidationError:
+            rejected_count += 1
+            continue
+        transactions.append(
+            parser_module.convert_to_standardized_transaction(raw_transaction)
+        )
+    return transactions, rejected_count
+
+
+def assert_same_as_legacy(raw_model, parser_module, rows):
+    expected, expected_rejected = legacy_parse(raw_model, parser_module, rows)
+    validated, rejected = validate_rows(
+        parser_module.RAW_ROWS_ADAPTER, rows, parser_module.is_supported_row
+    )
+    actual = [
+        parser_module.convert_to_standardized_transaction(transaction)
+        for transaction in validated
+    ]
+
+    assert rejected == expected_rejected
+    assert actual == expected
+
+
+def test_revolut_batch_validation_matches_row_validation():
+    rng = random.Random(3)
+    rows = [random_revolut_row(rng) for _ in range(5000)]
+    assert_same_as_legacy(revolut.RawTransactionRevolut, revolut, rows)
+
+
+def test_swedbank_batch_validation_matches_row_validation():
+    rng = random.Random(4)
+    rows = [random_swedbank_row(rng) for _ in range(5000)]
+    assert_same_as_legacy(swedbank.RawTransactionSwedbank, swedbank, rows)
+
+
+def test_validate_rows_without_valid_rows():
+    rows = [{"Type": "TOPUP"}, {"Amount": 1}]
+    assert validate_rows(
+        revolut.RAW_ROWS_ADAPTER, rows, revolut.is_supported_row
+    ) == ([], 2)
+
+
+def test_revolut_empty_sheet():
+    buffer = io.BytesIO()
+    openpyxl.Workbook().save(buffer)
+    buffer.seek(0)
+    assert revolut.parse_revolut_statement(buffer) == []
+
+
+@pytest.mark.parametrize("description", ["Apyvarta", " LIKUTIS pradžiai "])
+def test_swedbank_excluded_descriptions(description):
+    row = {
+        "Data": "2024-01-02",
+        "Gavėjas": "",
+        "Paaiškinimai": description,
+        "Suma": "1.50",
+        "Valiuta": "EUR",
+        "D/K": "D",
+        "Įrašo Nr.": "1",
+        "Kodas": "AS",
+    }
+    assert not swedbank.is_supported_row(row)
+    with pytest.raises(ValidationError, match="excluded entry"):
+        swedbank.RawTransactionSwedbank.model_validate(row)
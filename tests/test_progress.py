@@ -0,0 +1,116 @@
+import asyncio
+import json
+import threading
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.pool import StaticPool
+from sqlmodel import create_engine, SQLModel
+
+from app.db import transactions  # noqa: F401 - registers the transactions table
+from app.db.jobs import create_new_job, IngestJob
+from app.dependencies import get_authenticated_user
+from app.main import app
+from app.progress import get_progress_broker, ProgressBroker, ProgressEvent
+from app.project_types import JobStage, JobStatus, StatementSource
+
+USER_ID = uuid.uuid4()
+
+
+def test_subscription_gets_history_then_live_events():
+    broker = ProgressBroker()
+    job_id = uuid.uuid4()
+    broker.publish(ProgressEvent(job_id, JobStage.STARTED))
+    broker.publish(ProgressEvent(uuid.uuid4(), JobStage.STARTED))
+
+    async def follow() -> list[ProgressEvent]:
+        subscription = broker.subscribe(job_id)
+        # Published from the thread running the job
+        publisher = threading.Thread(
+            target=broker.publish,
+            args=(ProgressEvent(job_id, JobStage.PARSED, row_count=12),),
+        )
+        publisher.start()
+        event = await asyncio.wait_for(subscription.get(), timeout=5)
+        publisher.join()
+        subscription.close()
+        return subscription.history + [event]
+
+    events = asyncio.run(follow())
+
+    assert [event.stage for event in events] == [JobStage.STARTED, JobStage.PARSED]
+    assert events[1].to_json() == {
+        "job_id": str(job_id),
+        "stage": JobStage.PARSED,
+        "row_count": 12,
+    }
+
+
+@pytest.fixture
+def db():
+    db = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(db)
+    app.state.db_engine = db
+    app.dependency_overrides[get_authenticated_user] = lambda: USER_ID
+    yield db
+    app.dependency_overrides.clear()
+
+
+def new_job(db, status: JobStatus, user_id: uuid.UUID = USER_ID) -> IngestJob:
+    job = IngestJob(
+        statement_source=StatementSource.SWEDBANK,
+        file_path="statement.csv",
+        status=status,
+        user_id=user_id,
+    )
+    if status == JobStatus.COMPLETED:
+        job.ingested_txn_count = 3
+        job.duplicate_txn_count = 1
+    return create_new_job(job, db)
+
+
+def read_events(job_id: uuid.UUID) -> list[dict]:
+    with TestClient(app).stream("GET", f"/ingest-jobs/{job_id}/events") as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        return [
+            json.loads(line.removeprefix("data: "))
+            for line in response.iter_lines()
+            if line.startswith("data: ")
+        ]
+
+
+def test_events_replay_published_progress(db):
+    job = new_job(db, JobStatus.RUNNING)
+    broker = get_progress_broker()
+    broker.publish(ProgressEvent(job.id, JobStage.STARTED))
+    broker.publish(ProgressEvent(job.id, JobStage.INSERTED, 3, 1))
+    broker.publish(ProgressEvent(job.id, JobStage.COMPLETED, 3, 1))
+
+    events = read_events(job.id)
+
+    assert [event["stage"] for event in events] == ["started", "inserted", "completed"]
+
+
+def test_events_of_finished_job_without_progress(db):
+    # E.g. run by a queue worker, in another process
+    job = new_job(db, JobStatus.COMPLETED)
+
+    events = read_events(job.id)
+
+    assert events == [
+        {"job_id": str(job.id), "stage": "completed", "row_count": 3, "duplicate_count": 1}
+    ]
+
+
+def test_events_of_other_users_job_not_found(db):
+    job = new_job(db, JobStatus.RUNNING, user_id=uuid.uuid4())
+
+    response = TestClient(app).get(f"/ingest-jobs/{job.id}/events")
+
+    assert response.status_code == 404
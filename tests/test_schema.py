@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.pool import StaticPool
+from sqlmodel import create_engine, SQLModel
+
+from app.db.schema import check_schema, find_schema_problems, migrate, SchemaOutdatedError
+
+
+@pytest.fixture
+def db():
+    return create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+
+
+def test_migrate_creates_schema(db):
+    changes = migrate(db)
+
+    assert "created table jobs" in changes
+    assert "created table transactions" in changes
+    assert find_schema_problems(db) == []
+    assert migrate(db) == []
+
+
+def test_migrate_adds_missing_columns(db):
+    SQLModel.metadata.create_all(db)
+    with db.begin() as connection:
+        connection.execute(text("DROP INDEX ix_jobs_user_source_hash"))
+        connection.execute(text("ALTER TABLE jobs DROP COLUMN content_hash"))
+        connection.execute(text("DROP INDEX ix_jobs_lease_expires_at"))
+        connection.execute(text("ALTER TABLE jobs DROP COLUMN attempts"))
+        connection.execute(
+            text(
+                "INSERT INTO jobs (id, statement_source, file_path, created_at, status) "
+                "VALUES ('1', 'REVOLUT', 'statement.xlsx', '2024-01-01', 'COMPLETED')"
+            )
+        )
+
+    with pytest.raises(SchemaOutdatedError, match="jobs.content_hash"):
+        check_schema(db)
+
+    migrate(db)
+
+    check_schema(db)
+    with db.connect() as connection:
+        assert connection.execute(text("SELECT attempts FROM jobs")).scalar() == 0
+    columns = {column["name"] for column in inspect(db).get_columns("jobs")}
+    assert {"attempts", "content_hash"} <= columns
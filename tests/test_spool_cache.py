@@ -0,0 +1,64 @@
+import datetime as dt
+import os
+import time
+
+from app.spool_cache import SpoolCache
+
+TTL = dt.timedelta(hours=1)
+
+
+def put(cache: SpoolCache, key: str, data: bytes):
+    entry = cache.open_entry(key)
+    entry.write(data)
+    entry.commit()
+
+
+def age(cache: SpoolCache, key: str, seconds: float):
+    modified_at = time.time() - seconds
+    os.utime(cache._entry_path(key), (modified_at, modified_at))
+
+
+def test_returns_committed_entries(tmp_path):
+    cache = SpoolCache(tmp_path, max_bytes=100, ttl=TTL)
+    put(cache, "statements/a.xlsx", b"abc")
+    discarded = cache.open_entry("statements/b.xlsx")
+    discarded.write(b"def")
+
+    assert cache.get("statements/a.xlsx").read() == b"abc"
+    assert cache.get("statements/b.xlsx") is None
+
+    discarded.discard()
+    assert os.listdir(tmp_path) == [cache._entry_path("statements/a.xlsx").name]
+
+
+def test_expires_entries(tmp_path):
+    cache = SpoolCache(tmp_path, max_bytes=100, ttl=TTL)
+    put(cache, "a", b"abc")
+    age(cache, "a", TTL.total_seconds() + 1)
+
+    assert cache.get("a") is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = SpoolCache(tmp_path, max_bytes=10, ttl=TTL)
+    put(cache, "a", b"aaaa")
+    put(cache, "b", b"bbbb")
+    age(cache, "a", 20)
+    age(cache, "b", 10)
+    # Used after b
+    assert cache.get("a")
+
+    put(cache, "c", b"cccc")
+
+    assert cache.get("a")
+    assert cache.get("b") is None
+    assert cache.get("c")
+
+
+def test_skips_entries_over_budget(tmp_path):
+    cache = SpoolCache(tmp_path, max_bytes=10, ttl=TTL)
+    put(cache, "a", b"aaaa")
+    put(cache, "b", b"b" * 11)
+
+    assert cache.get("a")
+    assert cache.get("b") is None
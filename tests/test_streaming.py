@@ -0,0 +1,190 @@
+import io
+import random
+import uuid
+
+import pytest
+from currency_converter import CURRENCY_FILE
+from sqlalchemy.pool import StaticPool
+from sqlmodel import create_engine, func, select, Session, SQLModel
+
+from app import orchestration
+from app.config import AppConfig, PipelineEngine, PipelineMode
+from app.db.jobs import create_new_job, IngestJob, load_job
+from app.db.transactions import Transaction
+from app.fx_rates import RateTable
+from app.metrics import StageTimer
+from app.orchestration import (
+    _insert_new_transactions,
+    _run_streaming_pipeline,
+    prepare_transactions,
+    run_job,
+)
+from app.parsers.revolut import iter_revolut_statement
+from app.project_types import (
+    JobStage,
+    JobStatus,
+    PipelineStage,
+    StatementSource,
+)
+from test_columnar import FixedRateStore, revolut_statement
+
+CHUNK_SIZE = 64
+
+
+@pytest.fixture(scope="module")
+def statement() -> bytes:
+    # Several chunks of parsed rows
+    return revolut_statement(800, random.Random(7))
+
+
+@pytest.fixture
+def app_config() -> AppConfig:
+    return AppConfig(
+        db_connection_string="sqlite://",
+        supabase_url="http://localhost",
+        supabase_anon_key="anon",
+        supabase_admin_key="admin",
+        pipeline_mode=PipelineMode.STREAMING,
+        pipeline_chunk_size=CHUNK_SIZE,
+    )
+
+
+@pytest.fixture(autouse=True)
+def rate_store(monkeypatch):
+    rate_store = FixedRateStore(RateTable.from_file(CURRENCY_FILE))
+    monkeypatch.setattr(orchestration, "get_rate_store", lambda app_config: rate_store)
+
+
+@pytest.fixture
+def events(monkeypatch):
+    events = []
+
+    def publish(job_id, stage, row_count=None, duplicate_count=None, **kwargs):
+        events.append((stage, row_count, duplicate_count))
+
+    monkeypatch.setattr(orchestration, "_publish", publish)
+    return events
+
+
+def new_db():
+    db = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(db)
+    return db
+
+
+def stream(statement: bytes, db, app_config: AppConfig, user_id: uuid.UUID, timer=None):
+    return _run_streaming_pipeline(
+        iter_revolut_statement(io.BytesIO(statement)),
+        job_id=None,  # type: ignore
+        user_id=user_id,
+        db=db,
+        app_config=app_config,
+        timer=timer or StageTimer(),
+    )
+
+
+def stored_keys(db) -> list[str]:
+    with Session(db) as session:
+        return sorted(session.exec(select(Transaction.dedup_key)).all())
+
+
+def test_streaming_matches_batch_pipeline(statement, app_config, events):
+    user_id = uuid.uuid4()
+    prepared = prepare_transactions(
+        statement,
+        statement_source=StatementSource.REVOLUT,
+        job_id=None,  # type: ignore
+        user_id=user_id,
+        pipeline_engine=PipelineEngine.ROW,
+        app_config=app_config,
+    )
+    batch_db = new_db()
+    new, duplicates = _insert_new_transactions(
+        prepared.enriched, db=batch_db, app_config=app_config
+    )
+    assert prepared.parsed_count is not None
+    assert prepared.parsed_count > 4 * CHUNK_SIZE
+
+    streaming_db = new_db()
+    totals = stream(statement, streaming_db, app_config, user_id)
+
+    assert totals == (len(new), len(duplicates))
+    assert stored_keys(streaming_db) == stored_keys(batch_db)
+    # A re-run skips the committed rows of every chunk
+    assert stream(statement, streaming_db, app_config, user_id) == (
+        0,
+        len(prepared.enriched),
+    )
+
+
+def test_streaming_chunk_counters(statement, app_config, events):
+    timer = StageTimer()
+    ingested, duplicates = stream(statement, new_db(), app_config, uuid.uuid4(), timer)
+
+    parsed = [row_count for stage, row_count, _ in events if stage == JobStage.PARSED]
+    inserted = [
+        (row_count, duplicate_count)
+        for stage, row_count, duplicate_count in events
+        if stage == JobStage.INSERTED
+    ]
+    # Running totals, one event per chunk; the last chunk is partial
+    assert len(parsed) == len(inserted) > 1
+    assert parsed[-1] % CHUNK_SIZE != 0
+    assert parsed == [
+        min(CHUNK_SIZE * (i + 1), parsed[-1]) for i in range(len(parsed))
+    ]
+    assert inserted[-1] == (ingested, duplicates)
+
+    rows = {timing.stage: timing.row_count for timing in timer.timings}
+    enriched = [
+        row_count for stage, row_count, _ in events if stage == JobStage.ENRICHED
+    ]
+    assert rows[PipelineStage.PARSE] == parsed[-1]
+    assert rows[PipelineStage.ENRICH] == rows[PipelineStage.INSERT] == enriched[-1]
+    assert enriched[-1] == ingested + duplicates
+
+
+class FakeStorage:
+    def __init__(self, statement: bytes):
+        self.statement = statement
+
+    def load_file(self, filepath: str, bucket: str) -> io.BytesIO:
+        return io.BytesIO(self.statement)
+
+
+# The chunks committed before the failure are kept, the job is failed
+def test_streaming_failure_fails_job(statement, app_config, monkeypatch):
+    def failing_parser(file):
+        for i, transaction in enumerate(iter_revolut_statement(file)):
+            if i == CHUNK_SIZE + 1:
+                raise ValueError("Broken row")
+            yield transaction
+
+    monkeypatch.setattr(
+        orchestration, "get_stream_parser", lambda source: failing_parser
+    )
+    db = new_db()
+    job = create_new_job(
+        IngestJob(
+            user_id=uuid.uuid4(),
+            statement_source=StatementSource.REVOLUT,
+            file_path="statement.xlsx",
+        ),
+        db,
+    )
+
+    storage = FakeStorage(statement)
+    run_job(job.id, db=db, file_storage=storage, app_config=app_config)  # type: ignore
+
+    job = load_job(job.id, db)
+    assert job is not None
+    assert job.status == JobStatus.FAILED
+    assert job.failure_reason == "technical_error"
+    assert job.lease_expires_at is None
+    with Session(db) as session:
+        committed = session.exec(select(func.count()).select_from(Transaction)).one()
+    assert 0 < committed <= CHUNK_SIZE
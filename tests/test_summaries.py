@@ -0,0 +1,141 @@
+import datetime as dt
+import uuid
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.pool import StaticPool
+from sqlmodel import create_engine, Session, select, SQLModel
+
+from app.db import jobs  # noqa: F401 - registers the jobs table for the FK
+from app.db import summaries
+from app.db.summaries import MonthlySpending, rebuild_rollups
+from app.db.transactions import insert_transactions
+from app.dependencies import get_authenticated_user
+from app.main import app
+from app.project_types import (
+    EnrichedTransaction,
+    Side,
+    TransactionSource,
+    TransactionType,
+)
+
+USER_ID = uuid.uuid4()
+
+
+@pytest.fixture
+def db():
+    db = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(db)
+    app.state.db_engine = db
+    app.dependency_overrides[get_authenticated_user] = lambda: USER_ID
+    yield db
+    app.dependency_overrides.clear()
+
+
+def transaction(
+    day: dt.date, amount: str, side: Side = Side.DEBIT, **fields
+) -> EnrichedTransaction:
+    return EnrichedTransaction(
+        **{
+            "transaction_datetime": dt.datetime.combine(day, dt.time(12)),
+            "type": TransactionType.CARD_PAYMENT,
+            "counterparty": "merchant",
+            "orig_amount": Decimal(amount),
+            "orig_currency": "EUR",
+            "side": side,
+            "source": TransactionSource.REVOLUT,
+            "eur_amount": Decimal(amount),
+            "category": "Groceries",
+            "sub_category": "Groceries",
+            "dedup_key": f"{day}_{amount}_{side}",
+            "job_id": None,
+            "user_id": USER_ID,
+            **fields,
+        }
+    )
+
+
+def rollups(db) -> list[tuple]:
+    with Session(db) as session:
+        rows = session.exec(select(MonthlySpending)).all()
+        return sorted(
+            (
+                row.month,
+                row.category,
+                row.meal_type,
+                row.spent_eur,
+                row.income_eur,
+                row.transaction_count,
+            )
+            for row in rows
+        )
+
+
+def test_rollups_follow_inserted_transactions(db):
+    first_statement = [
+        transaction(dt.date(2024, 1, 5), "10.50"),
+        transaction(dt.date(2024, 1, 20), "4.50"),
+        transaction(dt.date(2024, 1, 25), "1000", Side.CREDIT, category="Salary"),
+    ]
+    insert_transactions(first_statement, db)
+    snack = transaction(
+        dt.date(2024, 2, 1), "3", category="Food & Drink", meal_type="Snacks"
+    )
+    # Overlaps the first statement: duplicates are not counted again
+    second_statement = first_statement[1:] + [snack, snack]
+    insert_transactions(second_statement, db)
+
+    incremental = rollups(db)
+    assert incremental == [
+        (dt.date(2024, 1, 1), "Groceries", "", Decimal("15"), Decimal("0"), 2),
+        (dt.date(2024, 1, 1), "Salary", "", Decimal("0"), Decimal("1000"), 1),
+        (dt.date(2024, 2, 1), "Food & Drink", "Snacks", Decimal("3"), Decimal("0"), 1),
+    ]
+
+    assert rebuild_rollups(db) == 3
+    assert rollups(db) == incremental
+
+
+# Databases without an upsert: the rollup rows are read and updated one by one
+def test_rollups_without_upsert(db, monkeypatch):
+    monkeypatch.setattr(summaries, "_UPSERTS", {})
+    january = transaction(dt.date(2024, 1, 5), "10")
+    insert_transactions([january], db)
+    insert_transactions([january, transaction(dt.date(2024, 1, 6), "5")], db)
+
+    assert rollups(db) == [
+        (dt.date(2024, 1, 1), "Groceries", "", Decimal("15"), Decimal("0"), 2)
+    ]
+
+
+def test_summaries_from_rollups(db):
+    insert_transactions(
+        [
+            transaction(dt.date(2024, 1, 5), "10"),
+            transaction(dt.date(2024, 1, 25), "1000", Side.CREDIT, category=None),
+            transaction(dt.date(2024, 2, 5), "20"),
+            transaction(dt.date(2024, 3, 5), "30"),
+        ],
+        db,
+    )
+    client = TestClient(app)
+
+    response = client.get(
+        "/summaries", params={"from_month": "2024-01", "to_month": "2024-02"}
+    )
+
+    assert response.status_code == 200
+    months = response.json()["months"]
+    assert [month["month"] for month in months] == ["2024-02", "2024-01"]
+    january = months[1]
+    assert Decimal(january["spent_eur"]) == Decimal("10")
+    assert Decimal(january["income_eur"]) == Decimal("1000")
+    assert january["transaction_count"] == 2
+    assert {item["category"] for item in january["categories"]} == {"Groceries", None}
+
+    assert client.get("/summaries", params={"from_month": "2024-13"}).status_code == 422
@@ -0,0 +1,114 @@
+import datetime as dt
+import uuid
+from decimal import Decimal
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.pool import StaticPool
+from sqlmodel import create_engine, Session, SQLModel
+
+from app.db import jobs  # noqa: F401 - registers the jobs table for the FK
+from app.db.transactions import Transaction
+from app.dependencies import get_authenticated_user
+from app.main import app
+from app.project_types import Side, TransactionSource
+
+USER_ID = uuid.uuid4()
+
+
+@pytest.fixture
+def db():
+    db = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(db)
+    app.state.db_engine = db
+    app.dependency_overrides[get_authenticated_user] = lambda: USER_ID
+    yield db
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def client(db):
+    return TestClient(app)
+
+
+def add_transactions(db, count: int, user_id: uuid.UUID = USER_ID, **fields) -> list[str]:
+    start = dt.datetime(2024, 1, 1)
+    transactions = [
+        Transaction(
+            **{
+                "transaction_datetime": start + dt.timedelta(hours=12 * i),
+                "counterparty": f"merchant {i}",
+                "orig_amount": Decimal("12.50"),
+                "orig_currency": "EUR",
+                "side": Side.DEBIT,
+                "source": TransactionSource.REVOLUT,
+                "eur_amount": Decimal("12.50"),
+                "category": "Groceries",
+                "dedup_key": f"{uuid.uuid4()}",
+                "user_id": user_id,
+                **fields,
+            }
+        )
+        for i in range(count)
+    ]
+    with Session(db) as session:
+        session.add_all(transactions)
+        session.commit()
+        return [str(txn.id) for txn in transactions]
+
+
+def query(client: TestClient, **params) -> list[dict]:
+    transactions = []
+    cursor = None
+    while True:
+        response = client.get(
+            "/transactions", params={**params, **({"cursor": cursor} if cursor else {})}
+        )
+        assert response.status_code == 200
+        page = response.json()
+        transactions.extend(page["transactions"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return transactions
+
+
+def test_pages_through_transactions_newest_first(db, client):
+    add_transactions(db, 9)
+    add_transactions(db, 4, user_id=uuid.uuid4())
+
+    transactions = query(client, limit=4)
+
+    assert len(transactions) == 9
+    datetimes = [txn["transaction_datetime"] for txn in transactions]
+    assert datetimes == sorted(datetimes, reverse=True)
+    assert Decimal(transactions[0]["eur_amount"]) == Decimal("12.50")
+    assert "dedup_key" not in transactions[0]
+
+
+def test_filters_transactions(db, client):
+    add_transactions(db, 6)
+    credits = add_transactions(db, 2, side=Side.CREDIT, category="Salary")
+    swedbank = add_transactions(db, 3, source=TransactionSource.SWEDBANK)
+
+    def ids(**params) -> set[str]:
+        return {txn["id"] for txn in query(client, limit=2, **params)}
+
+    assert ids(side="credit") == set(credits)
+    assert ids(category="Salary") == set(credits)
+    assert ids(source="swedbank") == set(swedbank)
+    # Two transactions a day: the 3rd to 6th of each batch
+    in_range = query(client, date_from="2024-01-02", date_to="2024-01-03")
+    assert len(in_range) == 4 + 1
+
+
+def test_unchanged_page_not_modified(db, client):
+    add_transactions(db, 2)
+    etag = client.get("/transactions").headers["etag"]
+
+    response = client.get("/transactions", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304